@@ -1,9 +1,35 @@
-from django.contrib import admin
-from .models import Category, Product, Review
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.db.models.functions import Substr
+from .bulk import change_prices, move_to_category
+from .models import Category, Product, Review, ReviewSubmission
+from .pagination import EstimatedCountPaginator
+from .serializers import BulkProductOperationSerializer
 
 # Регистрируем модели в админке, чтобы можно было добавлять/редактировать записи
 
 
+class IndexedSearchMixin:
+    """
+    Число ищется по id, остальное — по подстроке из search_fields
+    (GIN-индексы pg_trgm по UPPER(поле), миграция 0008)
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+class BulkProductActionForm(ActionForm):
+    # Параметры массовых действий над товарами (см. product/bulk.py)
+    percent = forms.DecimalField(label='Процент', required=False, max_digits=6, decimal_places=2)
+    amount = forms.DecimalField(label='Сумма', required=False, max_digits=10, decimal_places=2)
+    category = forms.ModelChoiceField(Category.objects.all(), label='Категория', required=False)
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
 	# показывать id и название в списке
@@ -13,22 +39,95 @@ class CategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(IndexedSearchMixin, admin.ModelAdmin):
 	# показывать id, заголовок, цену и категорию
 	list_display = ('id', 'title', 'price', 'category')
+	# категория загружается JOIN, а не отдельным запросом на строку
+	list_select_related = ('category',)
 	# фильтр по категории
 	list_filter = ('category',)
-	# поиск по заголовку и описанию
+	# поиск по id или по заголовку и описанию (через индексы pg_trgm)
 	search_fields = ('title', 'description')
+	# без точного COUNT(*) на больших таблицах, приблизительное количество помечается
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+	change_list_template = 'admin/product/estimated_count_change_list.html'
+
+	# массовые действия выполняются одним UPDATE
+	action_form = BulkProductActionForm
+	actions = ('change_prices_action', 'move_to_category_action')
+
+	def get_queryset(self, request):
+		# описание в списке не показывается
+		return super().get_queryset(request).defer('description')
+
+	def get_bulk_operation(self, request, names):
+		# параметры из формы действия проверяются тем же сериализатором, что и в API
+		data = {name: request.POST[name] for name in names if request.POST.get(name)}
+		serializer = BulkProductOperationSerializer(data=data)
+		if not serializer.is_valid():
+			errors = '; '.join(str(error) for field_errors in serializer.errors.values() for error in field_errors)
+			self.message_user(request, errors, messages.ERROR)
+			return None
+		return serializer.validated_data
+
+	@admin.action(description='Изменить цену (процент или сумма)')
+	def change_prices_action(self, request, queryset):
+		data = self.get_bulk_operation(request, ('percent', 'amount'))
+		if data is None:
+			return
+		updated, skipped = change_prices(queryset, percent=data.get('percent'), amount=data.get('amount'))
+		self.message_user(request, f'Цена изменена у товаров: {updated}')
+		if skipped:
+			self.message_user(request, f'Пропущено товаров (цена вне допустимых границ): {skipped}', messages.WARNING)
+
+	@admin.action(description='Перенести в категорию')
+	def move_to_category_action(self, request, queryset):
+		data = self.get_bulk_operation(request, ('category',))
+		if data is None:
+			return
+		updated = move_to_category(queryset, data['category'])
+		self.message_user(request, f'Перенесено товаров в категорию «{data["category"]}»: {updated}')
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
-    # показывать id, текст, рейтинг и связанный товар
-    list_display = ('id', 'text', 'stars', 'product')
+class ReviewAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    # показывать id, начало текста, рейтинг и связанный товар
+    list_display = ('id', 'short_text', 'stars', 'product')
+    list_select_related = ('product',)
     # фильтр по рейтингу
     list_filter = ('stars',)
+    # поиск по id отзыва или по тексту (через индекс pg_trgm)
     search_fields = ('text',)
+    # без точного COUNT(*) на больших таблицах, приблизительное количество помечается
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/product/estimated_count_change_list.html'
+
+    def get_queryset(self, request):
+        # Полный текст не читается: база отдаёт только первые символы
+        return super().get_queryset(request).defer('text', 'product__description').annotate(
+            text_preview=Substr('text', 1, 80)
+        )
+
+    @admin.display(description='Текст')
+    def short_text(self, obj):
+        return obj.text_preview
+
+    def action_checkbox(self, obj):
+        # В подписи чекбокса используется str(obj): без этого отложенный
+        # text загружался бы отдельным запросом для каждой строки
+        obj.text = obj.text_preview
+        return super().action_checkbox(obj)
+
+
+@admin.register(ReviewSubmission)
+class ReviewSubmissionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tracking_id', 'status', 'review', 'created_at', 'processed_at')
+    list_filter = ('status',)
+    search_fields = ('=tracking_id',)
+
+
 # Настройки интерфейса админки на русском
 admin.site.site_header = 'Администрация магазина'
 admin.site.site_title = 'Админка магазина'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
+
+    def ready(self):
+        # Подключаем обработчики сигналов (сброс кэша объектов и т.п.)
+        from . import signals  # noqa: F401
@@ -0,0 +1,132 @@
+"""
+Массовые операции над товарами одним UPDATE ... WHERE
+
+Изменение цены (в процентах или на сумму) и перенос в другую категорию
+для набора товаров. Новая цена считается и округляется в SQL, а границы
+validate_product_price (0 < цена <= 999 999.99) проверяются в том же WHERE:
+товары, цена которых вышла бы за границы, не изменяются. update() не
+заполняет auto_now, поэтому updated_at передаётся явно.
+
+Изменённые строки возвращает сам UPDATE ... RETURNING id, category_id
+(PostgreSQL и SQLite 3.35+), и сигнал bulk_changed отправляется только по
+ним: пропущенные по границам товары не попадают в журнал и не сбрасываются
+в прокси. Для других СУБД id выбираются тем же условием под блокировкой.
+"""
+
+from decimal import Decimal
+from django.db import connections, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Round
+from django.db.models.lookups import GreaterThan, LessThanOrEqual
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+from .models import Product
+from .signals import bulk_changed
+
+
+MAX_PRICE = Decimal('999999.99')
+
+
+def new_price_expression(percent=None, amount=None):
+    """
+    SQL-выражение новой цены, округлённой до копеек
+    """
+    if percent is not None:
+        price = F('price') * Value(1 + Decimal(percent) / 100)
+    else:
+        price = F('price') + Value(Decimal(amount))
+    return Round(
+        ExpressionWrapper(price, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        2
+    )
+
+
+def _targets(queryset):
+    # Подзапрос по id: сортировка и select_related из админки не мешают UPDATE
+    return Product.objects.filter(pk__in=queryset.values('pk'))
+
+
+def _supports_update_returning(connection):
+    """
+    UPDATE ... RETURNING: PostgreSQL и SQLite 3.35+ (как в users.models)
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.features.can_return_rows_from_bulk_insert
+
+
+def _update_returning(queryset, **values):
+    """
+    UPDATE товаров из queryset. Возвращает пары (id, category_id) изменённых строк
+    """
+    connection = connections[queryset.db]
+    if _supports_update_returning(connection):
+        # Тот же SQL, что строит queryset.update(), с RETURNING
+        query = queryset.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        query.annotations = {}
+        sql, params = query.get_compiler(queryset.db).as_sql()
+        qn = connection.ops.quote_name
+        category_column = Product._meta.get_field('category').column
+        returning = f'{qn(Product._meta.pk.column)}, {qn(category_column)}'
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} RETURNING {returning}', params)
+            return cursor.fetchall()
+    
+    rows = list(queryset.select_for_update().values_list('pk', 'category_id'))
+    Product.objects.filter(pk__in=[pk for pk, _ in rows]).update(**values)
+    return rows
+
+
+def _send_changed(product_ids, category_ids):
+    # Категории не изменились как строки (в журнал не пишутся), но их списки и статистика пересчитываются
+    bulk_changed.send(sender=Product, pks=sorted(product_ids), category_ids=sorted(category_ids))
+
+
+def change_prices(queryset, percent=None, amount=None):
+    """
+    Изменение цены товаров из queryset. Возвращает (изменено, пропущено)
+    """
+    new_price = new_price_expression(percent, amount)
+    with transaction.atomic():
+        total = _targets(queryset).count()
+        rows = _update_returning(
+            _targets(queryset).filter(GreaterThan(new_price, 0), LessThanOrEqual(new_price, MAX_PRICE)),
+            price=new_price, updated_at=timezone.now()
+        )
+        if rows:
+            _send_changed([pk for pk, _ in rows], {category_id for _, category_id in rows})
+    return len(rows), total - len(rows)
+
+
+def move_to_category(queryset, category):
+    """
+    Перенос товаров из queryset в категорию. Возвращает количество перенесённых
+    товаров (уже находящиеся в ней не изменяются)
+    """
+    with transaction.atomic():
+        # Прежние категории нужны для сброса их кэшей, RETURNING вернул бы уже новую
+        previous = dict(
+            _targets(queryset).exclude(category=category).select_for_update().values_list('pk', 'category_id')
+        )
+        if not previous:
+            return 0
+        updated = Product.objects.filter(pk__in=list(previous)).update(category=category, updated_at=timezone.now())
+        _send_changed(previous, set(previous.values()) | {category.pk})
+    return updated
+
+
+def filter_products(ids=None, category=None, min_price=None, max_price=None):
+    """
+    Набор товаров для массовой операции из API
+    """
+    queryset = Product.objects.all()
+    if ids:
+        queryset = queryset.filter(pk__in=ids)
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    return queryset
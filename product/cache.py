@@ -0,0 +1,34 @@
+"""
+Кэш сериализованных объектов каталога (товары, категории, отзывы)
+
+Включается настройкой OBJECT_CACHE (имя кэша из CACHES). Записи
+сбрасываются сигналами при сохранении и удалении моделей.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_object_cache():
+    """
+    Кэш объектов или None, если он не настроен
+    """
+    alias = getattr(settings, 'OBJECT_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def get_object_cache_timeout():
+    return getattr(settings, 'OBJECT_CACHE_TIMEOUT', 300)
+
+
+def object_cache_key(model, pk):
+    return f'obj:{model._meta.label_lower}:{pk}'
+
+
+def invalidate_objects(model, pks):
+    """
+    Удаление объектов из кэша
+    """
+    object_cache = get_object_cache()
+    if object_cache is not None and pks:
+        object_cache.delete_many([object_cache_key(model, pk) for pk in pks])
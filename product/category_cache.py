@@ -0,0 +1,91 @@
+"""
+Кэш stale-while-revalidate для списка категорий и статистики категорий
+
+Значение свежее SOFT_TTL секунд. После этого и до HARD_TTL оно отдаётся
+как есть, а один фоновый пересчёт (блокировка в общем кэше) обновляет его.
+Ключи не зависят от версий ресурсов: записи в Category и Product
+пересчитывают значения сразу после коммита (см. signals.py). Отзывы
+влияют только на рейтинг в статистике и обновляются по SOFT_TTL.
+"""
+
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min
+from .coalescing import coalesced_read, get_coalescing_settings, refresh
+from .models import Category, Product, Review
+from .serializers import CategoryWithCountSerializer
+
+
+DEFAULTS = {
+    'SOFT_TTL': 60,
+    'HARD_TTL': 60 * 60,
+}
+
+CATEGORY_LIST_KEY = 'categories:list'
+
+
+def category_stats_key(category_id):
+    return f'categories:{category_id}:stats'
+
+
+def get_category_cache_config():
+    ttl = {**DEFAULTS, **getattr(settings, 'CATEGORY_CACHE', {})}
+    return {
+        **get_coalescing_settings(),
+        'TIMEOUT': ttl['SOFT_TTL'],
+        'STALE_TIMEOUT': max(ttl['HARD_TTL'] - ttl['SOFT_TTL'], 0),
+    }
+
+
+def _money(value):
+    return str(Decimal(value).quantize(Decimal('0.01'))) if value is not None else None
+
+
+def build_category_list():
+    # Количество товаров считаем одним запросом вместо COUNT на каждую категорию
+    queryset = Category.objects.annotate(products_total=Count('products'))
+    return CategoryWithCountSerializer(queryset, many=True).data
+
+
+def build_category_stats(category_id):
+    """
+    Статистика категории: два агрегирующих запроса (товары и отзывы).
+    None, если категории нет
+    """
+    if not Category.objects.filter(pk=category_id).exists():
+        return None
+    products = Product.objects.filter(category_id=category_id).aggregate(
+        products_count=Count('id'), min_price=Min('price'), max_price=Max('price'), avg_price=Avg('price')
+    )
+    reviews = Review.objects.filter(product__category_id=category_id).aggregate(
+        reviews_count=Count('id'), avg_stars=Avg('stars')
+    )
+    return {
+        'category': category_id,
+        'products_count': products['products_count'],
+        'min_price': _money(products['min_price']),
+        'max_price': _money(products['max_price']),
+        'avg_price': _money(products['avg_price']),
+        'reviews_count': reviews['reviews_count'],
+        'rating': round(reviews['avg_stars'], 2) if reviews['avg_stars'] else 0.0,
+    }
+
+
+def get_category_list():
+    return coalesced_read(CATEGORY_LIST_KEY, build_category_list, get_category_cache_config())
+
+
+def get_category_stats(category_id):
+    return coalesced_read(
+        category_stats_key(category_id), lambda: build_category_stats(category_id), get_category_cache_config()
+    )
+
+
+def refresh_categories(category_ids):
+    """
+    Пересчёт списка категорий и статистики указанных категорий после записи
+    """
+    config = get_category_cache_config()
+    refresh(CATEGORY_LIST_KEY, build_category_list, config)
+    for category_id in set(category_ids):
+        refresh(category_stats_key(category_id), lambda: build_category_stats(category_id), config)
@@ -0,0 +1,200 @@
+"""
+Объединение одновременных промахов кэша (single-flight)
+
+Когда популярный ответ (список категорий, товар и т.п.) выпадает из кэша,
+его пересчитывает только один запрос: внутри процесса остальные потоки ждут
+тот же результат, а между воркерами роль лидера определяет блокировка
+в общем кэше (cache.add). С STALE_TIMEOUT > 0 устаревшее значение отдаётся
+сразу, а пересчёт идёт в фоне (stale-while-revalidate).
+
+Ключ значения включает версии ресурсов, от которых оно зависит (те же имена,
+что у surrogate-ключей: "products", "product-42", "reviews-product-42").
+Сигналы после коммита выдают изменённым ресурсам новые версии, поэтому,
+например, отзыв не сбрасывает список товаров без рейтинга.
+
+Версии и блокировки хранятся в кэше default и работают между воркерами,
+только если он общий (REDIS_URL). С LocMemCache новая версия видна лишь
+процессу, который выполнил запись, поэтому по умолчанию кэширование
+включается только при заданном REDIS_URL.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'TIMEOUT': 30,  # сколько секунд значение считается свежим
+    'STALE_TIMEOUT': 0,  # сколько ещё можно отдавать устаревшее значение
+    'LOCK_TIMEOUT': 10,  # максимальное время пересчёта
+    'POLL_INTERVAL': 0.05,  # как часто ожидающий воркер проверяет кэш
+}
+
+VERSION_PREFIX = 'coalesce:version:'
+
+
+def get_coalescing_settings():
+    return {**DEFAULTS, **getattr(settings, 'COALESCING', {})}
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Один вычислитель на ключ внутри процесса, остальные ждут его результат
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+
+_single_flight = SingleFlight()
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(resources):
+    """
+    Текущие версии ресурсов (одно обращение к кэшу на все ресурсы)
+    """
+    keys = [f'{VERSION_PREFIX}{resource}' for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = cache.get_or_set(key, _new_version(), None)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(resources):
+    """
+    Новые версии ресурсов: значения, закэшированные под старыми, больше не читаются.
+    Версия - случайная строка, поэтому вытеснение ключа версии не вернёт старые значения
+    """
+    if resources:
+        cache.set_many({f'{VERSION_PREFIX}{resource}': _new_version() for resource in set(resources)}, None)
+
+
+def coalesced_read(key, compute, config=None, resources=()):
+    """
+    Чтение через кэш с объединением одновременных пересчётов.
+    resources - от чего зависит значение; без них значение обновляют через refresh()
+    """
+    config = config or get_coalescing_settings()
+    if not config['ENABLED']:
+        return compute()
+    
+    cache_key = _cache_key(key, resources)
+    entry = cache.get(cache_key)
+    now = time.time()
+    metrics.inc('cache_requests_total', {'cache': 'coalescing', 'result': 'miss' if entry is None else 'hit'})
+    if entry is not None:
+        if entry['fresh_until'] > now:
+            return entry['value']
+        # Значение устарело, но ещё допустимо: отдаём его и обновляем в фоне
+        if config['STALE_TIMEOUT'] and cache.add(f'{cache_key}:lock', 1, config['LOCK_TIMEOUT']):
+            threading.Thread(
+                target=_refresh_in_background, args=(cache_key, compute, config), daemon=True
+            ).start()
+        if config['STALE_TIMEOUT']:
+            return entry['value']
+    
+    return _single_flight.do(cache_key, lambda: _rebuild(cache_key, compute, config))
+
+
+def refresh(key, compute, config=None):
+    """
+    Немедленный пересчёт значения (например, после записи в модели)
+    """
+    config = config or get_coalescing_settings()
+    if config['ENABLED']:
+        _store(_cache_key(key), compute(), config)
+
+
+def _cache_key(key, resources=()):
+    if resources:
+        return f'coalesce:{".".join(get_versions(resources))}:{key}'
+    return f'coalesce:{key}'
+
+
+def _store(cache_key, value, config):
+    cache.set(
+        cache_key,
+        {'value': value, 'fresh_until': time.time() + config['TIMEOUT']},
+        config['TIMEOUT'] + config['STALE_TIMEOUT'],
+    )
+
+
+def _rebuild(cache_key, compute, config):
+    lock_key = f'{cache_key}:lock'
+    if cache.add(lock_key, 1, config['LOCK_TIMEOUT']):
+        try:
+            value = compute()
+            _store(cache_key, value, config)
+            return value
+        finally:
+            cache.delete(lock_key)
+    
+    # Пересчёт уже идёт в другом воркере: ждём его результат
+    deadline = time.time() + config['LOCK_TIMEOUT']
+    while time.time() < deadline:
+        time.sleep(config['POLL_INTERVAL'])
+        entry = cache.get(cache_key)
+        if entry is not None and entry['fresh_until'] > time.time():
+            return entry['value']
+        if cache.get(lock_key) is None:
+            break
+    # Лидер не успел или упал: считаем сами
+    value = compute()
+    _store(cache_key, value, config)
+    return value
+
+
+def _refresh_in_background(cache_key, compute, config):
+    try:
+        _store(cache_key, compute(), config)
+    except Exception:
+        logger.exception(f'Background refresh failed for {cache_key}')
+    finally:
+        cache.delete(f'{cache_key}:lock')
+        # Поток открыл собственные соединения с БД
+        connections.close_all()
@@ -0,0 +1,322 @@
+"""
+Лента изменений товаров и отзывов (Server-Sent Events) для ASGI
+
+Один фоновый опрос журнала ChangeEvent на процесс складывает события в
+кольцевой буфер BroadcastHub. Подключения не опрашивают базу: все они ждут
+одно общее asyncio.Event и после пробуждения читают из буфера только
+события новее своего курсора, поэтому тысячи простаивающих подключений
+почти ничего не стоят. id события - seq из ChangeEvent: при переподключении
+браузер передаёт Last-Event-ID, и пропущенное досылается из буфера или базы.
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from .models import ChangeEvent, Product, Review
+from .sync import GapGuard
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH': '/api/v1/events/',
+    'BUFFER_SIZE': 1000,  # событий в кольцевом буфере процесса
+    'POLL_INTERVAL': 0.5,
+    'BATCH_SIZE': 500,
+    'HEARTBEAT': 15,  # комментарий-пинг, чтобы прокси не закрывали соединение
+    'GAP_TIMEOUT': 5,  # сколько ждать пропущенный seq (незакоммиченная запись журнала)
+    'REPLAY_LIMIT': 1000,  # сколько событий можно дослать из базы при переподключении
+}
+
+EVENT_MODELS = ('product', 'review')
+
+EVENT_NAMES = {
+    ChangeEvent.ACTION_CREATE: 'created',
+    ChangeEvent.ACTION_UPSERT: 'updated',
+    ChangeEvent.ACTION_DELETE: 'deleted',
+}
+
+
+def get_event_stream_settings():
+    return {**DEFAULTS, **getattr(settings, 'EVENT_STREAM', {})}
+
+
+class Event:
+    __slots__ = ('seq', 'name', 'data', 'product_id', 'category_id')
+
+    def __init__(self, seq, name, data, product_id, category_id):
+        self.seq = seq
+        self.name = name
+        self.data = data
+        self.product_id = product_id
+        self.category_id = category_id
+
+    def matches(self, product_id=None, category_id=None):
+        if product_id is not None and self.product_id != product_id:
+            return False
+        if category_id is not None and self.category_id != category_id:
+            return False
+        return True
+
+    def encode(self):
+        return f'id: {self.seq}\nevent: {self.name}\ndata: {json.dumps(self.data, ensure_ascii=False)}\n\n'.encode()
+
+
+def build_events(change_events):
+    """
+    События ленты по записям журнала: текущее состояние объектов грузится
+    двумя запросами на пачку, для удалений используются поля tombstone
+    """
+    upserts = {model: [] for model in EVENT_MODELS}
+    # Для удалённых отзывов категория известна не всегда: берём её у товара
+    unscoped = set()
+    for change in change_events:
+        if change.action != ChangeEvent.ACTION_DELETE:
+            upserts[change.model].append(change.object_id)
+        elif change.category_id is None and change.product_id is not None:
+            unscoped.add(change.product_id)
+
+    products, reviews = {}, {}
+    if upserts['product'] or unscoped:
+        products = {
+            row['id']: row for row in
+            Product.objects.filter(pk__in=set(upserts['product']) | unscoped).values('id', 'title', 'price', 'category_id')
+        }
+    if upserts['review']:
+        reviews = {
+            row['id']: row for row in
+            Review.objects.filter(pk__in=upserts['review'])
+            .values('id', 'text', 'stars', 'product_id', 'product__category_id')
+        }
+
+    events = []
+    for change in change_events:
+        name = f'{change.model}.{EVENT_NAMES[change.action]}'
+        if change.action == ChangeEvent.ACTION_DELETE:
+            category_id = change.category_id
+            if category_id is None and change.product_id in products:
+                category_id = products[change.product_id]['category_id']
+            events.append(Event(change.seq, name, {'id': change.object_id}, change.product_id, category_id))
+        elif change.model == 'product' and change.object_id in products:
+            row = products[change.object_id]
+            data = {'id': row['id'], 'title': row['title'], 'price': str(row['price']), 'category': row['category_id']}
+            events.append(Event(change.seq, name, data, row['id'], row['category_id']))
+        elif change.model == 'review' and change.object_id in reviews:
+            row = reviews[change.object_id]
+            data = {'id': row['id'], 'text': row['text'], 'stars': row['stars'], 'product': row['product_id']}
+            events.append(Event(change.seq, name, data, row['product_id'], row['product__category_id']))
+        # Объект уже удалён: его удаление придёт отдельным событием
+    return events
+
+
+def load_changes(after, limit):
+    return list(ChangeEvent.objects.filter(seq__gt=after).order_by('seq')[:limit])
+
+
+def _load_latest_seq():
+    try:
+        return ChangeEvent.objects.latest('seq').seq
+    except ChangeEvent.DoesNotExist:
+        return 0
+    finally:
+        close_old_connections()
+
+
+def _load_batch(after, limit):
+    try:
+        return load_changes(after, limit)
+    finally:
+        close_old_connections()
+
+
+def _replay(after, until, limit):
+    """
+    События из базы для переподключившегося клиента или None, если их больше limit
+    """
+    try:
+        changes = [change for change in load_changes(after, limit + 1) if change.seq <= until]
+        if len(changes) > limit:
+            return None
+        return build_events([change for change in changes if change.model in EVENT_MODELS])
+    finally:
+        close_old_connections()
+
+
+def _build(changes):
+    try:
+        return build_events(changes)
+    finally:
+        close_old_connections()
+
+
+class BroadcastHub:
+    """
+    Кольцевой буфер событий процесса и общий сигнал о новых событиях
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_event_stream_settings()
+        self.buffer = deque(maxlen=self.config['BUFFER_SIZE'])
+        self.cursor = None  # последний обработанный seq журнала
+        self.changed = asyncio.Event()
+        self.task = None
+        self.ready = asyncio.Event()
+        self.gaps = GapGuard(self.config['GAP_TIMEOUT'])
+
+    async def start(self):
+        # Опрос запускает первое подключение, остальные ждут начальный курсор
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        await self.ready.wait()
+
+    async def run(self):
+        self.cursor = await sync_to_async(_load_latest_seq)()
+        self.ready.set()
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception('Event stream poll failed')
+            await asyncio.sleep(self.config['POLL_INTERVAL'])
+
+    async def poll(self):
+        changes = await sync_to_async(_load_batch)(self.cursor, self.config['BATCH_SIZE'])
+        accepted = self.gaps.take(self.cursor, changes)
+        if not accepted:
+            return
+        events = await sync_to_async(_build)([change for change in accepted if change.model in EVENT_MODELS])
+        # Курсор и буфер меняются вместе, без await между ними
+        self.cursor = accepted[-1].seq
+        if events:
+            self.publish(events)
+
+    def publish(self, events):
+        self.buffer.extend(events)
+        # Будим всех ждущих одним вызовом и готовим сигнал для следующей пачки
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def events_after(self, seq):
+        """
+        События новее seq (из конца буфера, обычно это несколько последних)
+        """
+        events = []
+        for event in reversed(self.buffer):
+            if event.seq <= seq:
+                break
+            events.append(event)
+        events.reverse()
+        return events
+
+    def covers(self, seq):
+        """
+        Буфер содержит все события после seq
+        """
+        return seq >= self.cursor or (bool(self.buffer) and seq >= self.buffer[0].seq - 1)
+
+
+_hubs = {}
+
+
+def get_hub():
+    # Отдельный хаб на event loop: asyncio.Event привязан к своему циклу
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = BroadcastHub()
+    return _hubs[loop]
+
+
+def _parse_id(value):
+    if value in (None, ''):
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(value)
+    return value
+
+
+async def _send_error(send, status, message):
+    body = json.dumps({'error': message}, ensure_ascii=False).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def event_stream_app(scope, receive, send):
+    """
+    GET /api/v1/events/?category=<id>&product=<id> (text/event-stream)
+    """
+    config = get_event_stream_settings()
+    if scope['method'] != 'GET':
+        await _send_error(send, 405, 'Метод не разрешён')
+        return
+
+    query = parse_qs(scope['query_string'].decode())
+    headers = dict(scope['headers'])
+    try:
+        category_id = _parse_id(query.get('category', [None])[0])
+        product_id = _parse_id(query.get('product', [None])[0])
+        # Браузер передаёт заголовок, для curl и отладки - параметр
+        last_event_id = _parse_id(headers.get(b'last-event-id', b'').decode() or query.get('last_event_id', [None])[0])
+    except ValueError:
+        await _send_error(send, 400, 'category, product и Last-Event-ID должны быть неотрицательными целыми числами')
+        return
+
+    hub = get_hub()
+    await hub.start()
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-store'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    cursor = max(hub.cursor, last_event_id or 0)
+    pending = []
+    if last_event_id is not None and last_event_id < hub.cursor:
+        if hub.covers(last_event_id):
+            pending = hub.events_after(last_event_id)
+        else:
+            pending = await sync_to_async(_replay)(last_event_id, hub.cursor, config['REPLAY_LIMIT'])
+            if pending is None:
+                # Пропущено слишком много: клиент догоняет через /api/v1/sync/
+                await send({'type': 'http.response.body', 'body': b'event: reset\ndata: {}\n\n', 'more_body': True})
+                pending = []
+
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while True:
+            chunk = b''.join(
+                event.encode() for event in pending if event.matches(product_id, category_id)
+            )
+            if pending:
+                cursor = max(cursor, pending[-1].seq)
+            await send({'type': 'http.response.body', 'body': chunk or b': ping\n\n', 'more_body': True})
+
+            changed = asyncio.ensure_future(hub.changed.wait())
+            done, _ = await asyncio.wait({changed, disconnected}, timeout=config['HEARTBEAT'], return_when=asyncio.FIRST_COMPLETED)
+            changed.cancel()
+            if disconnected in done:
+                break
+            pending = hub.events_after(cursor)
+    finally:
+        disconnected.cancel()
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
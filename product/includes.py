@@ -0,0 +1,62 @@
+"""
+Встраивание связанных данных в ответы по товарам (?include=category,reviews,rating)
+
+Каждая связь загружается одним пакетным запросом на весь набор товаров,
+а не отдельным запросом на каждую строку.
+"""
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, Window
+from django.db.models.functions import RowNumber
+from .models import Category, Review
+from .serializers import ReviewSerializer
+
+
+PRODUCT_INCLUDES = ('category', 'reviews', 'rating')
+
+
+def attach_product_includes(items, includes):
+    """
+    Добавляет связанные данные к сериализованным товарам (список dict с id и category)
+    """
+    if not items or not includes:
+        return items
+    product_ids = [item['id'] for item in items]
+    
+    if 'category' in includes:
+        category_ids = {item['category'] for item in items}
+        categories = {
+            category.id: {'id': category.id, 'name': category.name}
+            for category in Category.objects.filter(id__in=category_ids).only('id', 'name')
+        }
+        for item in items:
+            item['category'] = categories.get(item['category'])
+    
+    if 'reviews' in includes:
+        # Последние N отзывов каждого товара одним запросом через ROW_NUMBER()
+        limit = getattr(settings, 'INCLUDE_REVIEWS_LIMIT', 5)
+        latest = (
+            Review.objects.filter(product_id__in=product_ids)
+            .annotate(row_number=Window(RowNumber(), partition_by=F('product_id'), order_by=F('id').desc()))
+            .filter(row_number__lte=limit)
+            .order_by('product_id', '-id')
+        )
+        reviews = {pk: [] for pk in product_ids}
+        for review in ReviewSerializer(latest, many=True).data:
+            reviews[review['product']].append(review)
+        for item in items:
+            item['reviews'] = reviews[item['id']]
+    
+    if 'rating' in includes:
+        ratings = {
+            row['product_id']: row
+            for row in Review.objects.filter(product_id__in=product_ids)
+            .values('product_id')
+            .annotate(avg_stars=Avg('stars'), total=Count('id'))
+        }
+        for item in items:
+            row = ratings.get(item['id'])
+            item['rating'] = round(row['avg_stars'], 2) if row else 0.0
+            item['reviews_count'] = row['total'] if row else 0
+    
+    return items
@@ -0,0 +1,232 @@
+"""
+Анализ нагрузки SQL и подбор недостающих индексов (команда index_advisor)
+
+Запросы группируются по нормализованной форме (литералы и параметры
+заменяются на ?), для каждой формы выполняется EXPLAIN и ищутся полные
+сканирования и сортировки в памяти. Кандидат в индекс строится из колонок
+условий равенства, одной колонки диапазона и колонок ORDER BY.
+"""
+
+import json
+import re
+from collections import OrderedDict
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from .slow_queries import EXPLAIN_PREFIXES
+
+
+QUOTED = r'["`](\w+)["`]'
+COLUMN_RE = re.compile(QUOTED + r'\.' + QUOTED + r'\s*(=|<=|>=|<|>|IN\b)', re.IGNORECASE)
+ORDER_BY_RE = re.compile(r'\bORDER BY\b(.+?)(?:\bLIMIT\b|\bOFFSET\b|$)', re.IGNORECASE | re.DOTALL)
+ORDER_COLUMN_RE = re.compile(QUOTED + r'\.' + QUOTED + r'(\s+DESC)?', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """
+    Форма запроса без конкретных значений
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    shape = re.sub(r'%s|\b\d+(?:\.\d+)?\b', '?', shape)
+    shape = re.sub(r'\bIN\s*\((?:\s*\?\s*,?)+\)', 'IN (...)', shape, flags=re.IGNORECASE)
+    return re.sub(r'\s+', ' ', shape).strip()
+
+
+def load_workload(path):
+    """
+    JSON-строки журнала медленных запросов (logs/slow_queries.log)
+    """
+    workload = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('sql') and entry.get('params') is not None:
+                workload.append({
+                    'sql': entry['sql'],
+                    'params': [replace_redacted(value) for value in entry['params']]
+                    if isinstance(entry['params'], list) else entry['params'],
+                    'duration_ms': entry.get('duration_ms', 0),
+                })
+    return workload
+
+
+def replace_redacted(value):
+    # Для плана конкретное значение строки не важно
+    if isinstance(value, str) and value.startswith('<redacted:'):
+        return ''
+    return value
+
+
+def group_by_shape(workload):
+    groups = OrderedDict()
+    for query in workload:
+        if not query['sql'].lstrip().upper().startswith('SELECT'):
+            continue
+        shape = normalize_sql(query['sql'])
+        group = groups.setdefault(shape, {'shape': shape, 'sample': query, 'count': 0, 'total_ms': 0.0})
+        group['count'] += 1
+        group['total_ms'] += query.get('duration_ms') or 0
+    return list(groups.values())
+
+
+def explain(sql, params):
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor, 'EXPLAIN ')
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params or None)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def find_problems(plan):
+    """
+    Полные сканирования таблиц и сортировки в памяти из плана
+    """
+    full_scans, sorts = set(), False
+    for line in plan:
+        match = re.search(r'\bSCAN (?:TABLE )?(\w+)', line)
+        if match and 'INDEX' not in line:
+            full_scans.add(match.group(1))
+        match = re.search(r'Seq Scan on (\w+)', line)
+        if match:
+            full_scans.add(match.group(1))
+        if 'USE TEMP B-TREE FOR ORDER BY' in line or re.search(r'^\W*Sort\b', line):
+            sorts = True
+    return full_scans, sorts
+
+
+def candidate_columns(sql, table):
+    """
+    Колонки индекса: равенства, затем один диапазон, затем ORDER BY
+    """
+    where = sql.split(' WHERE ', 1)[1] if ' WHERE ' in sql else ''
+    where = ORDER_BY_RE.split(where)[0] if where else ''
+    equality, ranges = [], []
+    for column_table, column, operator in COLUMN_RE.findall(where):
+        if column_table != table:
+            continue
+        target = equality if operator.upper() in ('=', 'IN') else ranges
+        if column not in equality and column not in target:
+            target.append(column)
+    
+    order = []
+    match = ORDER_BY_RE.search(sql)
+    if match:
+        for column_table, column, _ in ORDER_COLUMN_RE.findall(match.group(1)):
+            if column_table == table:
+                order.append(column)
+    
+    columns = []
+    for column in equality + ranges[:1] + order:
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def existing_indexes(table):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [tuple(info['columns']) for info in constraints.values() if info.get('index') or info.get('primary_key')]
+
+
+def table_rows(table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+def analyze(workload):
+    """
+    Отчёт по формам запросов и список предлагаемых индексов
+    """
+    report, candidates = [], OrderedDict()
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+    for group in group_by_shape(workload):
+        sample = group['sample']
+        try:
+            plan = explain(sample['sql'], sample.get('params'))
+        except Exception as e:
+            report.append({**group, 'plan': [f'EXPLAIN failed: {e}'], 'full_scans': [], 'sorts': False})
+            continue
+        full_scans, sorts = find_problems(plan)
+        # Подзапросы и CTE в плане тоже выглядят как SCAN
+        full_scans &= tables
+        report.append({**group, 'plan': plan, 'full_scans': sorted(full_scans), 'sorts': sorts})
+        
+        affected = set(full_scans)
+        if sorts:
+            affected.update(re.findall(r'\bFROM ' + QUOTED, sample['sql']))
+        for table in affected & tables:
+            columns = candidate_columns(sample['sql'], table)
+            if not columns:
+                continue
+            if any(index[:len(columns)] == tuple(columns) for index in existing_indexes(table)):
+                continue
+            key = (table, tuple(columns))
+            candidate = candidates.setdefault(key, {'table': table, 'columns': columns, 'queries': 0, 'rows': table_rows(table)})
+            candidate['queries'] += group['count']
+    
+    for candidate in candidates.values():
+        # Грубая оценка: сколько строк не придётся читать полным сканированием
+        candidate['benefit'] = candidate['rows'] * candidate['queries']
+    return report, sorted(candidates.values(), key=lambda c: c['benefit'], reverse=True)
+
+
+def model_for_table(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def draft_migration(candidates):
+    """
+    Черновик миграции с AddIndex для моделей проекта
+    """
+    operations, dependencies = [], set()
+    for candidate in candidates:
+        model = model_for_table(candidate['table'])
+        if model is None:
+            continue
+        columns = {field.column: field.name for field in model._meta.concrete_fields}
+        fields = [columns[column] for column in candidate['columns'] if column in columns]
+        if len(fields) != len(candidate['columns']):
+            continue
+        name = f"{model._meta.model_name[:10]}_{'_'.join(f[:6] for f in fields)}_idx"[:30]
+        dependencies.add(model._meta.app_label)
+        operations.append(
+            f"        migrations.AddIndex(\n"
+            f"            model_name='{model._meta.model_name}',\n"
+            f"            index=models.Index(fields={fields!r}, name='{name}'),\n"
+            f"        ),\n"
+        )
+    if not operations:
+        return None
+    
+    lines = [
+        '# Черновик, сгенерированный командой index_advisor. Проверьте перед применением.\n',
+        '\n',
+        'from django.db import migrations, models\n',
+        '\n',
+        '\n',
+        'class Migration(migrations.Migration):\n',
+        '\n',
+        '    dependencies = [\n',
+    ]
+    leaf_nodes = dict(MigrationLoader(connection, ignore_no_migrations=True).graph.leaf_nodes())
+    for app_label in sorted(dependencies):
+        if app_label in leaf_nodes:
+            lines.append(f"        ('{app_label}', '{leaf_nodes[app_label]}'),\n")
+    lines += ['    ]\n', '\n', '    operations = [\n', *operations, '    ]\n']
+    return ''.join(lines)
+
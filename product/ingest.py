@@ -0,0 +1,94 @@
+"""
+Отложенная пакетная запись отзывов (REVIEW_INGEST_MODE = 'queue')
+
+POST /reviews/ проверяет данные, сохраняет заявку ReviewSubmission и сразу
+отвечает 202. Команда flush_reviews забирает заявки пачками, проверяет
+дубли одним запросом на пачку и создаёт отзывы одним многострочным INSERT.
+Обработанные заявки нужны только для проверки статуса по tracking_id:
+через REVIEW_SUBMISSION_RETENTION их удаляет команда purge_review_submissions.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Lower
+from datetime import timedelta
+from django.utils import timezone
+from .models import Product, Review, ReviewSubmission
+from .signals import bulk_changed
+
+
+def is_queue_mode():
+    return getattr(settings, 'REVIEW_INGEST_MODE', 'sync') == 'queue'
+
+
+def submit_review(validated_data):
+    """
+    Сохранение проверенного отзыва в очередь
+    """
+    return ReviewSubmission.objects.create(payload={
+        'text': validated_data['text'],
+        'stars': validated_data['stars'],
+        'product': validated_data['product'].pk,
+    })
+
+
+def flush_pending_reviews(batch_size=500):
+    """
+    Переносит одну пачку заявок в таблицу отзывов. Возвращает (создано, отклонено)
+    """
+    with transaction.atomic():
+        submissions = list(
+            ReviewSubmission.objects.select_for_update(skip_locked=True)
+            .filter(status=ReviewSubmission.STATUS_PENDING)
+            .order_by('id')[:batch_size]
+        )
+        if not submissions:
+            return 0, 0
+        
+        product_ids = {submission.payload['product'] for submission in submissions}
+        existing_products = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        # Проверка дублей для всей пачки одним запросом
+        texts = {submission.payload['text'].strip().lower() for submission in submissions}
+        seen = set(
+            Review.objects.filter(product_id__in=existing_products)
+            .annotate(text_lower=Lower('text'))
+            .filter(text_lower__in=texts)
+            .values_list('product_id', 'text_lower')
+        )
+        
+        now = timezone.now()
+        accepted = []
+        for submission in submissions:
+            payload = submission.payload
+            key = (payload['product'], payload['text'].strip().lower())
+            submission.processed_at = now
+            if payload['product'] not in existing_products:
+                submission.status = ReviewSubmission.STATUS_REJECTED
+                submission.error = 'Указанный товар не существует'
+            elif key in seen:
+                submission.status = ReviewSubmission.STATUS_REJECTED
+                submission.error = 'Отзыв с похожим текстом уже существует для данного товара'
+            else:
+                seen.add(key)
+                submission.status = ReviewSubmission.STATUS_CREATED
+                submission.review = Review(text=payload['text'], stars=payload['stars'], product_id=payload['product'])
+                accepted.append(submission)
+        
+        reviews = Review.objects.bulk_create([submission.review for submission in accepted])
+        for submission, review in zip(accepted, reviews):
+            submission.review = review
+        ReviewSubmission.objects.bulk_update(submissions, ['status', 'review', 'error', 'processed_at'])
+        bulk_changed.send(sender=Review, pks=[review.pk for review in reviews], created=True)
+    
+    return len(accepted), len(submissions) - len(accepted)
+
+
+def processed_submissions():
+    """
+    Созданные и отклонённые заявки старше REVIEW_SUBMISSION_RETENTION
+    """
+    retention = timedelta(seconds=getattr(settings, 'REVIEW_SUBMISSION_RETENTION', 7 * 24 * 60 * 60))
+    return ReviewSubmission.objects.filter(
+        status__in=(ReviewSubmission.STATUS_CREATED, ReviewSubmission.STATUS_REJECTED),
+        processed_at__lt=timezone.now() - retention,
+    )
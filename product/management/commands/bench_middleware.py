@@ -0,0 +1,66 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+
+def full_stack():
+    """
+    Единый набор для всех путей, как до MIDDLEWARE_PROFILES: те же middleware,
+    что подключены сейчас, но без выбора по префиксу
+    """
+    stack = [name for name in settings.MIDDLEWARE if name != 'product.middleware.PathScopedMiddleware']
+    for _, profile in settings.MIDDLEWARE_PROFILES:
+        stack += [name for name in profile if name not in stack]
+    return stack
+
+
+# Client() по умолчанию шлёт Host: testserver, которого нет в ALLOWED_HOSTS:
+# замерялась бы страница ошибки DisallowedHost, а не API
+BENCH_HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает накладные расходы полного набора middleware и профиля для /api/v1/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/v1/categories/?fields=id',
+                            help='Запрашиваемый путь (лучше дешёвый эндпоинт)')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Раунды по очереди для каждого набора, берётся медиана')
+
+    def handle(self, *args, **options):
+        stacks = (('full', full_stack()), ('scoped', settings.MIDDLEWARE))
+        samples = {name: [] for name, _ in stacks}
+        # Наборы чередуются, чтобы прогрев и фоновый шум не доставались одному из них
+        for _ in range(options['rounds']):
+            for name, middleware in stacks:
+                # Лимит запросов отключаем, иначе он сработает на сотом запросе
+                with override_settings(MIDDLEWARE=middleware, RATE_LIMIT={'MAX_REQUESTS': 10 ** 9},
+                                       ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, BENCH_HOST]):
+                    samples[name].append(self.measure(options['path'], options['requests']))
+        
+        results = {name: statistics.median(values) for name, values in samples.items()}
+        for name, value in results.items():
+            self.stdout.write(f'{name:>7}: {value * 1e6:8.1f} мкс на запрос (медиана {options["rounds"]} раундов)')
+        saved = results['full'] - results['scoped']
+        self.stdout.write(self.style.SUCCESS(
+            f'Экономия: {saved * 1e6:.1f} мкс на запрос ({saved / results["full"] * 100:.1f}%)'
+        ))
+
+    @staticmethod
+    def measure(path, count):
+        client = Client(HTTP_HOST=BENCH_HOST)
+        # Прогрев: загрузка middleware и URL-резолвера
+        response = client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f'{path} вернул {response.status_code}, замер не имеет смысла')
+        started = time.perf_counter()
+        for _ in range(count):
+            response = client.get(path)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise CommandError(f'{path} вернул {response.status_code} во время замера')
+        return elapsed / count
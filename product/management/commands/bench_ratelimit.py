@@ -0,0 +1,49 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from product.ratelimit import SlidingWindowSketch
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка приблизительного ограничения частоты запросов на синтетических IP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ips', type=int, default=2_000_000, help='Сколько запросов с разных IP')
+        parser.add_argument('--epsilon', type=float, default=1e-5)
+        parser.add_argument('--delta', type=float, default=0.01)
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--heavy', type=int, default=10, help='Сколько IP шлют запросы сверх лимита')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        limit = options['limit']
+        sketch = SlidingWindowSketch(3600, options['epsilon'], options['delta'])
+        now = sketch.window_start + 1  # все запросы в одном окне
+        
+        heavy_ips = [f'10.0.0.{i}' for i in range(options['heavy'])]
+        sample = {}
+        false_blocks = 0
+        started = time.perf_counter()
+        for n in range(options['ips']):
+            ip = '.'.join(str(rng.randrange(256)) for _ in range(4))
+            allowed, estimate = sketch.hit(ip, limit, now)
+            if not allowed:
+                false_blocks += 1
+            if n % 1000 == 0:
+                sample[ip] = estimate
+            # Тяжёлые клиенты равномерно перемешаны с остальным трафиком
+            if n % max(options['ips'] // (limit * 2), 1) == 0:
+                for heavy_ip in heavy_ips:
+                    sketch.hit(heavy_ip, limit, now)
+        elapsed = time.perf_counter() - started
+        
+        heavy_blocked = sum(1 for ip in heavy_ips if not sketch.hit(ip, limit, now)[0])
+        worst = max(sample.values()) if sample else 0
+        self.stdout.write(f'Запросов: {options["ips"]:,}, {options["ips"] / elapsed:,.0f} в секунду')
+        self.stdout.write(f'Память скетча: {sketch.memory_bytes / 1024 / 1024:.1f} МБ '
+                          f'(width={sketch.current.width}, depth={sketch.current.depth})')
+        self.stdout.write(f'Граница погрешности EPSILON * N: {options["epsilon"] * options["ips"]:.1f}')
+        self.stdout.write(f'Максимальная оценка в выборке случайных IP (реально ~1): {worst:.0f}')
+        self.stdout.write(f'Ложных блокировок: {false_blocks}')
+        self.stdout.write(self.style.SUCCESS(f'Заблокировано тяжёлых IP: {heavy_blocked} из {len(heavy_ips)}'))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from product.ingest import flush_pending_reviews
+
+
+class Command(BaseCommand):
+    help = 'Переносит отзывы, принятые в режиме очереди, в таблицу отзывов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Пауза, когда очередь пуста (секунды)')
+
+    def handle(self, *args, **options):
+        while True:
+            created, rejected = flush_pending_reviews(options['batch_size'])
+            if created or rejected:
+                self.stdout.write(f'Создано отзывов: {created}, отклонено: {rejected}')
+            # Пока пачки полные, очередь ещё не пуста
+            if created + rejected == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
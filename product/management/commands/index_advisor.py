@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from product.index_advisor import analyze, draft_migration, load_workload
+from product.models import Product
+
+
+CAPTURE_HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = (
+        'Проигрывает нагрузку (журнал медленных запросов или основные GET-эндпоинты), '
+        'ищет полные сканирования и сортировки в памяти и предлагает индексы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workload', help='Файл журнала медленных запросов (JSON-строки)')
+        parser.add_argument('--emit-migration', metavar='PATH',
+                            help='Записать черновик миграции с индексами (- для вывода в консоль)')
+        parser.add_argument('--show-plans', action='store_true', help='Показывать планы всех запросов')
+
+    def handle(self, *args, **options):
+        if options['workload']:
+            try:
+                workload = load_workload(options['workload'])
+            except OSError as e:
+                raise CommandError(f'Не удалось прочитать {options["workload"]}: {e}')
+        else:
+            workload = self.capture_endpoints()
+        if not workload:
+            raise CommandError('Нагрузка пуста: нечего анализировать')
+        
+        report, candidates = analyze(workload)
+        self.stdout.write(f'Запросов: {len(workload)}, форм: {len(report)}\n')
+        for group in report:
+            problems = []
+            if group['full_scans']:
+                problems.append(f'полное сканирование: {", ".join(group["full_scans"])}')
+            if group['sorts']:
+                problems.append('сортировка в памяти')
+            if not problems and not options['show_plans']:
+                continue
+            self.stdout.write(self.style.WARNING(
+                f'[{group["count"]}x] {"; ".join(problems) or "ok"}'
+            ))
+            self.stdout.write(f'  {group["shape"][:300]}')
+            for line in group['plan']:
+                self.stdout.write(f'    {line}')
+        
+        self.stdout.write('')
+        if not candidates:
+            self.stdout.write(self.style.SUCCESS('Новые индексы не требуются'))
+            return
+        self.stdout.write('Предлагаемые индексы (по убыванию оценки выгоды):')
+        for candidate in candidates:
+            self.stdout.write(self.style.SUCCESS(
+                f'  {candidate["table"]} ({", ".join(candidate["columns"])}): '
+                f'запросов {candidate["queries"]}, строк в таблице {candidate["rows"]}, '
+                f'оценка {candidate["benefit"]}'
+            ))
+        
+        if options['emit_migration']:
+            migration = draft_migration(candidates)
+            if migration is None:
+                self.stdout.write('Индексы относятся к таблицам вне моделей проекта, миграция не создана')
+            elif options['emit_migration'] == '-':
+                self.stdout.write(migration)
+            else:
+                with open(options['emit_migration'], 'w', encoding='utf-8') as f:
+                    f.write(migration)
+                self.stdout.write(f'Черновик миграции: {options["emit_migration"]}')
+
+    def capture_endpoints(self):
+        """
+        Запросы основных GET-эндпоинтов API (без кэша ответов)
+        """
+        product_id = Product.objects.values_list('id', flat=True).first()
+        if product_id is None:
+            raise CommandError('В базе нет товаров: заполните её или передайте --workload')
+        paths = [
+            '/api/v1/categories/',
+            '/api/v1/products/',
+            '/api/v1/products/?fields=id,title,price',
+            '/api/v1/products/?include=category,reviews,rating',
+            f'/api/v1/products/{product_id}/',
+            f'/api/v1/products/{product_id}/reviews/',
+            f'/api/v1/products/{product_id}/reviews/?stars=5',
+            '/api/v1/products/reviews/',
+            '/api/v1/reviews/',
+        ]
+        # Client() по умолчанию шлёт Host: testserver, который отклоняет ALLOWED_HOSTS
+        client = Client(HTTP_HOST=CAPTURE_HOST)
+        workload = []
+        with override_settings(COALESCING={'ENABLED': False}, CATALOG_REPLICA={'ENABLED': False},
+                               RATE_LIMIT={'MAX_REQUESTS': 10 ** 9},
+                               ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, CAPTURE_HOST]):
+            for path in paths:
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(path)
+                if response.status_code != 200:
+                    raise CommandError(f'{path} вернул {response.status_code}: запросы этого эндпоинта не записаны')
+                workload += [
+                    {'sql': query['sql'], 'params': None, 'duration_ms': float(query['time']) * 1000}
+                    for query in queries.captured_queries
+                ]
+        return workload
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from product.ingest import processed_submissions
+from product.models import ReviewSubmission
+
+
+class Command(BaseCommand):
+    help = 'Удаляет обработанные заявки на отзывы старше REVIEW_SUBMISSION_RETENTION небольшими пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько строк удалять за один DELETE')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Пауза между пачками (секунды), чтобы не нагружать БД')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        while True:
+            ids = list(processed_submissions().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted, _ = ReviewSubmission.objects.filter(pk__in=ids).delete()
+            total += deleted
+            if len(ids) < batch_size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено заявок на отзывы: {total}'))
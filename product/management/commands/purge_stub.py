@@ -0,0 +1,50 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Локальная замена кэширующего прокси: принимает запросы HTTPPurger и печатает ключи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+
+    def handle(self, *args, **options):
+        stdout = self.stdout
+        purged = set()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                keys = self.headers.get('Surrogate-Key', '').split()
+                if not keys and body:
+                    keys = json.loads(body).get('keys', [])
+                purged.update(keys)
+                stdout.write(f'PURGE {len(keys)}: {" ".join(keys)}')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'status': 'ok', 'purged': len(keys)}).encode())
+
+            # Varnish и Fastly используют метод PURGE
+            do_PURGE = do_POST
+
+            def do_GET(self):
+                # Все ключи, сброшенные с момента запуска
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({'keys': sorted(purged)}).encode())
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f'Ожидание запросов на http://{options["host"]}:{options["port"]}/')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,293 @@
+"""
+Метрики API для Prometheus с агрегацией по процессам
+
+Каждый процесс (воркер gunicorn) копит счётчики и гистограммы в памяти и не
+чаще раза в FLUSH_INTERVAL секунд атомарно записывает их в свой файл
+METRICS_DIR/metrics-<pid>.json. Эндпоинт /api/v1/metrics/ суммирует файлы
+всех процессов и отдаёт текстовый формат Prometheus. Файлы завершившихся
+процессов при сборе переносятся в общий metrics-dead.json, чтобы счётчики
+не уменьшались, а число файлов не росло с перезапусками воркеров. Каталог
+METRICS_DIR должен быть своим у каждого хоста (контейнера): живость
+процесса проверяется по pid.
+"""
+
+try:
+    import fcntl
+except ImportError:  # Windows: файлы завершившихся процессов не объединяются
+    fcntl = None
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIR': os.path.join(tempfile.gettempdir(), 'shop_api_metrics'),
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': '',
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+}
+
+HELP = {
+    'http_requests_total': ('counter', 'Количество запросов API'),
+    'http_request_duration_seconds': ('histogram', 'Время обработки запроса API'),
+    'db_queries_total': ('counter', 'Количество SQL-запросов'),
+    'db_query_seconds_total': ('counter', 'Суммарное время SQL-запросов'),
+    'cache_requests_total': ('counter', 'Обращения к кэшу (result=hit|miss)'),
+    'rate_limit_rejections_total': ('counter', 'Запросы, отклонённые RateLimitMiddleware'),
+    'api_errors_total': ('counter', 'Ответы API с кодом 4xx и 5xx'),
+    'catalog_replica_apply_lag_seconds': ('histogram', 'Задержка применения журнала изменений репликой каталога'),
+}
+
+
+def get_metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        self.config = None
+
+    def get_config(self):
+        if self.config is None:
+            self.config = get_metrics_settings()
+        return self.config
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        buckets = self.get_config()['BUCKETS']
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # счётчики по корзинам, затем сумма и количество
+                histogram = self.histograms[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """
+        Запись состояния процесса в его файл (атомарно через os.replace)
+        """
+        config = self.get_config()
+        now = time.monotonic()
+        if not force and now - self.last_flush < config['FLUSH_INTERVAL']:
+            return
+        self.last_flush = now
+        os.makedirs(config['DIR'], exist_ok=True)
+        path = os.path.join(config['DIR'], f'metrics-{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+
+def inc(name, labels=None, value=1):
+    if registry.get_config()['ENABLED']:
+        registry.inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    if registry.get_config()['ENABLED']:
+        registry.observe(name, value, labels)
+
+
+DEAD_FILE = 'metrics-dead.json'
+
+
+def _merge(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in data['histograms']:
+        key = (name, tuple(sorted(labels.items())))
+        if key in histograms and len(histograms[key]) == len(values):
+            histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+        else:
+            histograms[key] = list(values)
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def compact_dead_processes(directory):
+    """
+    Перенос файлов завершившихся процессов в metrics-dead.json
+    """
+    if fcntl is None or not os.path.isdir(directory):
+        return
+    dead = []
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        pid = os.path.basename(path)[len('metrics-'):-len('.json')]
+        if pid.isdigit() and not _is_alive(int(pid)):
+            dead.append(path)
+    if not dead:
+        return
+    with open(os.path.join(directory, '.compact.lock'), 'w') as lock:
+        # Параллельный сбор в другом воркере не должен перенести те же файлы дважды
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = [path for path in dead if os.path.exists(path)]
+        archive_path = os.path.join(directory, DEAD_FILE)
+        counters, histograms = {}, {}
+        for path in [archive_path, *dead]:
+            data = _read(path)
+            if data is not None:
+                _merge(counters, histograms, data)
+        tmp_path = f'{archive_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                'histograms': [[name, dict(labels), values] for (name, labels), values in histograms.items()],
+            }, f)
+        os.replace(tmp_path, archive_path)
+        for path in dead:
+            os.remove(path)
+
+
+def collect():
+    """
+    Сумма метрик всех процессов
+    """
+    registry.flush(force=True)
+    config = registry.get_config()
+    compact_dead_processes(config['DIR'])
+    counters, histograms = {}, {}
+    for path in glob.glob(os.path.join(config['DIR'], 'metrics-*.json')):
+        data = _read(path)
+        if data is not None:
+            _merge(counters, histograms, data)
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def render_prometheus():
+    """
+    Текстовый формат Prometheus 0.0.4
+    """
+    counters, histograms = collect()
+    buckets = registry.get_config()['BUCKETS']
+    lines, described = [], set()
+    
+    def describe(name):
+        if name not in described:
+            described.add(name)
+            metric_type, help_text = HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+    
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), values in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(buckets, values):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {values[-2]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class DatabaseTimer:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Время ответа, статус и время БД для каждого view
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not registry.get_config()['ENABLED']:
+            return self.get_response(request)
+        
+        timer = DatabaseTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        labels = {'view': view, 'method': request.method}
+        inc('http_requests_total', {**labels, 'status': str(response.status_code)})
+        # Большинство view сами возвращают 400/500, поэтому ошибки считаются по статусу ответа
+        if response.status_code >= 400:
+            inc('api_errors_total', {
+                'view': view, 'class': f'{response.status_code // 100}xx', 'status': str(response.status_code)
+            })
+        observe('http_request_duration_seconds', duration, labels)
+        if timer.queries:
+            inc('db_queries_total', {'view': view}, timer.queries)
+            inc('db_query_seconds_total', {'view': view}, timer.seconds)
+        registry.flush()
+        return response
@@ -1,17 +1,123 @@
 """
 Middleware для дополнительной валидации API запросов
+
+Кастомные middleware подключаются только для API через PathScopedMiddleware
+(см. settings.MIDDLEWARE_PROFILES), поэтому сами не проверяют префикс пути.
 """
 
+import gzip
+import hashlib
 import json
 import logging
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
 from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
 from django.conf import settings
+from .ratelimit import SlidingWindowSketch
+from .utils import get_client_ip
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard - необязательная зависимость
+    zstandard = None
 
 
 logger = logging.getLogger(__name__)
 
 
+class MiddlewareChain:
+    """
+    Собранная цепочка middleware одного профиля
+    """
+
+    def __init__(self, handler, view_hooks, template_response_hooks, exception_hooks):
+        self.handler = handler
+        self.view_hooks = view_hooks
+        self.template_response_hooks = template_response_hooks
+        self.exception_hooks = exception_hooks
+
+
+class PathScopedMiddleware:
+    """
+    Выбор набора middleware по префиксу пути
+
+    Профили задаются в settings.MIDDLEWARE_PROFILES как список пар
+    (префикс, список middleware); используется первый подходящий префикс.
+    Например, админка получает сессии, CSRF и сообщения, а /api/v1/ -
+    только то, что нужно stateless API.
+    """
+
+    def __init__(self, get_response):
+        self.profiles = [
+            (prefix, self.load_chain(middleware_paths, get_response))
+            for prefix, middleware_paths in settings.MIDDLEWARE_PROFILES
+        ]
+
+    @staticmethod
+    def load_chain(middleware_paths, get_response):
+        """
+        Сборка цепочки так же, как это делает BaseHandler.load_middleware
+        """
+        handler = get_response
+        view_hooks, template_response_hooks, exception_hooks = [], [], []
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            try:
+                mw_instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(mw_instance, 'process_view'):
+                view_hooks.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, 'process_template_response'):
+                template_response_hooks.append(mw_instance.process_template_response)
+            if hasattr(mw_instance, 'process_exception'):
+                exception_hooks.append(mw_instance.process_exception)
+            handler = convert_exception_to_response(mw_instance)
+        return MiddlewareChain(handler, view_hooks, template_response_hooks, exception_hooks)
+
+    def get_chain(self, request):
+        path = request.path_info
+        for prefix, chain in self.profiles:
+            if path.startswith(prefix):
+                return chain
+        return None
+
+    def __call__(self, request):
+        chain = self.get_chain(request)
+        if chain is None:
+            raise ValueError(f'Нет профиля middleware для пути {request.path_info}')
+        return chain.handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for hook in self.get_chain(request).view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        for hook in self.get_chain(request).template_response_hooks:
+            response = hook(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        for hook in self.get_chain(request).exception_hooks:
+            response = hook(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
 class RequestValidationMiddleware(MiddlewareMixin):
     """
     Middleware для валидации входящих запросов
@@ -29,7 +135,7 @@ class RequestValidationMiddleware(MiddlewareMixin):
             }, status=413)
         
         # Проверяем Content-Type для POST/PUT/PATCH запросов к API
-        if request.method in ['POST', 'PUT', 'PATCH'] and request.path.startswith('/api/'):
+        if request.method in ['POST', 'PUT', 'PATCH']:
             content_type = request.content_type or ''
             if 'application/json' not in content_type and 'multipart/form-data' not in content_type:
                 return JsonResponse({
@@ -42,17 +148,14 @@ class RequestValidationMiddleware(MiddlewareMixin):
         """
         Обработка исключений
         """
-        if request.path.startswith('/api/'):
-            logger.error(f'API Error: {exception}', exc_info=True)
-            
-            # Возвращаем общую ошибку для API без раскрытия деталей
-            return JsonResponse({
-                'error': 'Произошла внутренняя ошибка сервера',
-                'timestamp': str(timezone.now()),
-                'path': request.path
-            }, status=500)
+        logger.error(f'API Error: {exception}', exc_info=True)
         
-        return None
+        # Возвращаем общую ошибку для API без раскрытия деталей
+        return JsonResponse({
+            'error': 'Произошла внутренняя ошибка сервера',
+            'timestamp': str(timezone.now()),
+            'path': request.path
+        }, status=500)
 
 
 class SecurityHeadersMiddleware(MiddlewareMixin):
@@ -64,25 +167,24 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
         """
         Добавляем заголовки безопасности к ответу
         """
-        if request.path.startswith('/api/'):
-            # Предотвращение MIME-снiffing
-            response['X-Content-Type-Options'] = 'nosniff'
-            
-            # Защита от XSS
-            response['X-XSS-Protection'] = '1; mode=block'
-            
-            # Предотвращение показа в iframe
-            response['X-Frame-Options'] = 'DENY'
-            
-            # Строгая транспортная безопасность (только для HTTPS)
-            if request.is_secure():
-                response['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-            
-            # CSP для API (только JSON)
-            response['Content-Security-Policy'] = "default-src 'none'"
-            
-            # Удаляем заголовки, которые могут раскрыть информацию о сервере
-            response['Server'] = 'Shop API'
+        # Предотвращение MIME-снiffing
+        response['X-Content-Type-Options'] = 'nosniff'
+        
+        # Защита от XSS
+        response['X-XSS-Protection'] = '1; mode=block'
+        
+        # Предотвращение показа в iframe
+        response['X-Frame-Options'] = 'DENY'
+        
+        # Строгая транспортная безопасность (только для HTTPS)
+        if request.is_secure():
+            response['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
+        
+        # CSP для API (только JSON)
+        response['Content-Security-Policy'] = "default-src 'none'"
+        
+        # Удаляем заголовки, которые могут раскрыть информацию о сервере
+        response['Server'] = 'Shop API'
         
         return response
 
@@ -90,25 +192,41 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
 class RateLimitMiddleware(MiddlewareMixin):
     """
     Простое ограничение частоты запросов
+
+    RATE_LIMIT['MODE'] = 'exact' хранит время запросов каждого IP (память растёт
+    с числом клиентов), 'sketch' - приблизительный подсчёт count-min sketch
+    с фиксированным объёмом памяти (см. product/ratelimit.py).
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
         self.request_counts = {}  # В продакшене лучше использовать Redis
+        config = getattr(settings, 'RATE_LIMIT', {})
+        self.window_size = config.get('WINDOW', 60)  # 1 минута
+        self.max_requests = config.get('MAX_REQUESTS', 100)  # максимум 100 запросов в минуту
+        self.sketch = None
+        if config.get('MODE', 'exact') == 'sketch':
+            self.sketch = SlidingWindowSketch(
+                self.window_size, config.get('EPSILON', 1e-5), config.get('DELTA', 0.01)
+            )
         super().__init__(get_response)
     
     def process_request(self, request):
         """
         Проверка лимита запросов
         """
-        if not request.path.startswith('/api/'):
-            return None
-        
         # Получаем IP адрес клиента
         ip = self.get_client_ip(request)
+        
+        if self.sketch is not None:
+            allowed, _ = self.sketch.hit(ip or '', self.max_requests)
+            if not allowed:
+                return self.limit_exceeded_response()
+            return None
+        
         current_time = int(time.time())
-        window_size = 60  # 1 минута
-        max_requests = 100  # максимум 100 запросов в минуту
+        window_size = self.window_size
+        max_requests = self.max_requests
         
         # Очищаем старые записи
         self.cleanup_old_requests(current_time - window_size)
@@ -124,26 +242,25 @@ class RateLimitMiddleware(MiddlewareMixin):
         ]
         
         if len(recent_requests) >= max_requests:
-            return JsonResponse({
-                'error': 'Превышен лимит запросов. Попробуйте позже.',
-                'retry_after': window_size
-            }, status=429)
+            return self.limit_exceeded_response()
         
         # Добавляем текущий запрос
         self.request_counts[ip] = recent_requests + [current_time]
         
         return None
     
+    def limit_exceeded_response(self):
+        metrics.inc('rate_limit_rejections_total')
+        return JsonResponse({
+            'error': 'Превышен лимит запросов. Попробуйте позже.',
+            'retry_after': self.window_size
+        }, status=429)
+    
     def get_client_ip(self, request):
         """
-        Получение IP адреса клиента
+        Получение IP адреса клиента (X-Forwarded-For только от TRUSTED_PROXIES)
         """
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        return get_client_ip(request)
     
     def cleanup_old_requests(self, cutoff_time):
         """
@@ -158,5 +275,125 @@ class RateLimitMiddleware(MiddlewareMixin):
                 del self.request_counts[ip]
 
 
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие JSON ответов API (br, zstd или gzip по заголовку Accept-Encoding)
+
+    Кодировка выбирается по наибольшему q клиента, при равных q - в порядке
+    предпочтения сервера. Сжатые тела кэшируются по хэшу содержимого в
+    отдельном кэше CACHE (имя из CACHES), поэтому одинаковый ответ (например,
+    неизменившийся список товаров) не сжимается повторно.
+    """
+
+    DEFAULTS = {
+        'MIN_SIZE': 1024,  # ответы меньше этого размера не сжимаем
+        'GZIP_LEVEL': 6,
+        'BROTLI_QUALITY': 5,
+        'ZSTD_LEVEL': 3,
+        'CACHE': None,  # имя кэша из CACHES для сжатых тел, None - не кэшировать
+        'CACHE_TIMEOUT': 300,  # время жизни сжатых тел в кэше (секунды)
+        'CACHE_MAX_SIZE': 5 * 1024 * 1024,  # большие тела в кэш не кладём
+    }
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.config = {**self.DEFAULTS, **getattr(settings, 'API_COMPRESSION', {})}
+        # Порядок предпочтения кодировок на стороне сервера
+        self.encoders = []
+        if brotli is not None:
+            self.encoders.append(('br', self.compress_brotli))
+        if zstandard is not None:
+            self.encoders.append(('zstd', self.compress_zstd))
+        self.encoders.append(('gzip', self.compress_gzip))
+
+    def process_response(self, request, response):
+        """
+        Сжимаем ответ, если клиент это поддерживает и тело достаточно большое
+        """
+        patch_vary_headers(response, ('Accept-Encoding',))
+        
+        if (response.streaming or response.status_code != 200
+                or response.has_header('Content-Encoding')
+                or len(response.content) < self.config['MIN_SIZE']):
+            return response
+        
+        selected = self.select_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if selected is None:
+            return response
+        encoding, compress = selected
+        
+        content = self.get_compressed(response.content, encoding, compress)
+        if len(content) >= len(response.content):
+            return response
+        
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # Сжатое тело отличается побайтово, поэтому сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    def select_encoder(self, header):
+        """
+        Кодировка с наибольшим q > 0; при равных q - первая в порядке сервера
+        """
+        accepted = self.parse_accept_encoding(header)
+        selected, best = None, 0
+        for encoding, compress in self.encoders:
+            quality = accepted.get(encoding, accepted.get('*', 0))
+            if quality > best:
+                selected, best = (encoding, compress), quality
+        return selected
+
+    def get_compressed(self, content, encoding, compress):
+        """
+        Сжатие с кэшированием результата по хэшу исходного тела
+        """
+        if not self.config['CACHE'] or len(content) > self.config['CACHE_MAX_SIZE']:
+            return compress(content)
+        
+        compressed_cache = caches[self.config['CACHE']]
+        digest = hashlib.sha1(content).hexdigest()
+        cache_key = f'compressed:{encoding}:{digest}'
+        compressed = compressed_cache.get(cache_key)
+        if compressed is None:
+            compressed = compress(content)
+            compressed_cache.set(cache_key, compressed, self.config['CACHE_TIMEOUT'])
+        return compressed
+
+    def compress_gzip(self, content):
+        return gzip.compress(content, compresslevel=self.config['GZIP_LEVEL'], mtime=0)
+
+    def compress_brotli(self, content):
+        return brotli.compress(content, quality=self.config['BROTLI_QUALITY'])
+
+    def compress_zstd(self, content):
+        return zstandard.ZstdCompressor(level=self.config['ZSTD_LEVEL']).compress(content)
+
+    @staticmethod
+    def parse_accept_encoding(header):
+        """
+        Разбор Accept-Encoding: {'gzip': 1.0, 'br': 0.5, ...}
+        """
+        accepted = {}
+        for item in header.split(','):
+            parts = item.strip().split(';')
+            name = parts[0].strip().lower()
+            if not name:
+                continue
+            quality = 1.0
+            for param in parts[1:]:
+                key, _, value = param.strip().partition('=')
+                if key.strip() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            accepted[name] = quality
+        return accepted
+
+
 import time
 from django.utils import timezone
\ No newline at end of file
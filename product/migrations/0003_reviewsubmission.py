@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:28
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_review_review_product_stars_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tracking_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='идентификатор')),
+                ('payload', models.JSONField(verbose_name='данные')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает записи'), ('created', 'Создан'), ('rejected', 'Отклонён')], default='pending', max_length=10, verbose_name='статус')),
+                ('error', models.TextField(blank=True, verbose_name='ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='дата создания')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='дата обработки')),
+                ('review', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.review', verbose_name='отзыв')),
+            ],
+            options={
+                'verbose_name': 'Заявка на отзыв',
+                'verbose_name_plural': 'Заявки на отзывы',
+                'indexes': [models.Index(fields=['status', 'id'], name='review_submission_status_idx')],
+            },
+        ),
+    ]
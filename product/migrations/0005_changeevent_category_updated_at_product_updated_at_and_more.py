@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:42
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_change_events(apps, schema_editor):
+    # Уже существующие объекты попадают в журнал как изменения, чтобы
+    # первая синхронизация (since=0) вернула весь каталог
+    ChangeEvent = apps.get_model('product', 'ChangeEvent')
+    quote = schema_editor.quote_name
+    columns = ', '.join(quote(column) for column in ('model', 'object_id', 'action', 'created_at'))
+    now = schema_editor.connection.ops.adapt_datetimefield_value(timezone.now())
+    for model_name in ('category', 'product', 'review'):
+        model = apps.get_model('product', model_name)
+        schema_editor.execute(
+            f'INSERT INTO {quote(ChangeEvent._meta.db_table)} ({columns}) '
+            f'SELECT %s, id, %s, %s FROM {quote(model._meta.db_table)} ORDER BY id',
+            [model_name, 'upsert', now]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_reviewsubmission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False, verbose_name='номер изменения')),
+                ('model', models.CharField(max_length=20, verbose_name='модель')),
+                ('object_id', models.BigIntegerField(verbose_name='id объекта')),
+                ('action', models.CharField(choices=[('upsert', 'Создание или изменение'), ('delete', 'Удаление')], max_length=10, verbose_name='действие')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='дата')),
+            ],
+            options={
+                'verbose_name': 'Изменение каталога',
+                'verbose_name_plural': 'Изменения каталога',
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='дата изменения'),
+        ),
+        migrations.RunPython(backfill_change_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_changeevent_category_updated_at_product_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changeevent',
+            name='category_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='id категории'),
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='product_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='id товара'),
+        ),
+        migrations.AlterField(
+            model_name='changeevent',
+            name='action',
+            field=models.CharField(choices=[('create', 'Создание'), ('upsert', 'Создание или изменение'), ('delete', 'Удаление')], max_length=10, verbose_name='действие'),
+        ),
+    ]
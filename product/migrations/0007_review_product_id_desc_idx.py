@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_changeevent_category_id_changeevent_product_id_and_more'),
+    ]
+
+    operations = [
+        # Сначала новый индекс, затем удаление одиночного индекса по product_id
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-id'], name='review_product_id_desc_idx'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='product',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='product.product', verbose_name='товар'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+# Индексы для поиска в админке по подстроке (search_fields = ('title', 'description')
+# у товаров и ('text',) у отзывов). Django строит для icontains условие
+# UPPER("col"::text) LIKE UPPER(%s), поэтому GIN-индексы pg_trgm создаются по
+# тому же выражению.
+# Индексы строятся CONCURRENTLY, без блокировки записи в таблицы, поэтому
+# миграция не атомарная. Расширение pg_trgm и классы операторов есть только
+# в Postgres; для CREATE EXTENSION нужны права владельца базы.
+INDEXES = (
+    ('Product', 'product_title_upper_trgm_idx', 'title'),
+    ('Product', 'product_description_upper_trgm_idx', 'description'),
+    ('Review', 'review_text_upper_trgm_idx', 'text'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for model_name, index_name, column in INDEXES:
+        table = schema_editor.quote_name(apps.get_model('product', model_name)._meta.db_table)
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} '
+            f'USING gin (UPPER(({schema_editor.quote_name(column)})::text) gin_trgm_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, index_name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('product', '0007_review_product_id_desc_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
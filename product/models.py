@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -5,6 +6,7 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name=_('название'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('дата изменения'))
 
     class Meta:
         verbose_name = _('Категория')
@@ -19,6 +21,7 @@ class Product(models.Model):
     description = models.TextField(verbose_name=_('описание'))
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('цена'))
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', verbose_name=_('категория'))
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('дата изменения'))
 
     class Meta:
         verbose_name = _('Товар')
@@ -27,10 +30,21 @@ class Product(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Категория на момент загрузки: при переносе товара кэши сбрасываются и у старой категории
+        if 'category_id' in instance.__dict__:
+            instance._loaded_category_id = instance.category_id
+        return instance
+
 
 class Review(models.Model):
     text = models.TextField(verbose_name=_('текст'))
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews', verbose_name=_('товар'))
+    # Отдельный индекс по product_id не нужен: его заменяют составные индексы ниже
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reviews', verbose_name=_('товар'), db_index=False
+    )
     # Рейтинг отзыва от 1 до 5 звёзд
     stars = models.IntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(5)],
@@ -38,10 +52,85 @@ class Review(models.Model):
         help_text='Рейтинг от 1 до 5 звёзд',
         default=5
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name=_('дата изменения'))
 
     class Meta:
         verbose_name = _('Отзыв')
         verbose_name_plural = _('Отзывы')
+        indexes = [
+            # Отзывы одного товара: фильтр по рейтингу и keyset-пагинация по id
+            models.Index(fields=['product', 'stars', 'id'], name='review_product_stars_id_idx'),
+            # Новые отзывы товара без фильтра (ORDER BY id DESC) и поиск по product_id
+            models.Index(fields=['product', '-id'], name='review_product_id_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.text[:50]} ({self.stars}★)"
+
+
+class ReviewSubmission(models.Model):
+    """
+    Принятый, но ещё не записанный отзыв (режим REVIEW_INGEST_MODE = 'queue').
+    Строка фиксируется до ответа 202, поэтому отзыв не теряется при падении
+    процесса; в таблицу отзывов их пачками переносит команда flush_reviews.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_CREATED = 'created'
+    STATUS_REJECTED = 'rejected'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Ожидает записи')),
+        (STATUS_CREATED, _('Создан')),
+        (STATUS_REJECTED, _('Отклонён')),
+    )
+
+    tracking_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, verbose_name=_('идентификатор'))
+    payload = models.JSONField(verbose_name=_('данные'))
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name=_('статус'))
+    review = models.ForeignKey(Review, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name=_('отзыв'))
+    error = models.TextField(blank=True, verbose_name=_('ошибка'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('дата создания'))
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('дата обработки'))
+
+    class Meta:
+        verbose_name = _('Заявка на отзыв')
+        verbose_name_plural = _('Заявки на отзывы')
+        indexes = [
+            models.Index(fields=['status', 'id'], name='review_submission_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tracking_id} ({self.status})"
+
+
+
+class ChangeEvent(models.Model):
+    """
+    Журнал изменений каталога для синхронизации (/api/v1/sync/).
+    Пишется после коммита изменения, seq выдаются в порядке коммита
+    (см. product/sync.py); удаления хранятся как записи с action = 'delete'
+    (tombstone).
+    """
+    ACTION_CREATE = 'create'
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = (
+        (ACTION_CREATE, _('Создание')),
+        (ACTION_UPSERT, _('Создание или изменение')),
+        (ACTION_DELETE, _('Удаление')),
+    )
+
+    seq = models.BigAutoField(primary_key=True, verbose_name=_('номер изменения'))
+    model = models.CharField(max_length=20, verbose_name=_('модель'))
+    object_id = models.BigIntegerField(verbose_name=_('id объекта'))
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name=_('действие'))
+    # Для удалений: товар и категория удалённого объекта (фильтры ленты событий)
+    product_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('id товара'))
+    category_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('id категории'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('дата'))
+
+    class Meta:
+        verbose_name = _('Изменение каталога')
+        verbose_name_plural = _('Изменения каталога')
 
     def __str__(self):
-        return f"{self.text[:50]} ({self.stars}★)"
\ No newline at end of file
+        return f"#{self.seq} {self.action} {self.model}:{self.object_id}"
@@ -0,0 +1,95 @@
+"""
+Пагинация админки с оценкой количества строк для больших таблиц
+
+Точный COUNT(*) на десятках миллионов отзывов занимает секунды. Если
+оценка планировщика Postgres (pg_class.reltuples или EXPLAIN для запроса
+с фильтрами) не меньше THRESHOLD, вместо COUNT(*) используется она. На
+других СУБД точное значение выше порога кэшируется на CACHE_TIMEOUT секунд.
+В обоих случаях count_is_approximate = True.
+
+Списки API отдают полные выборки или курсорные страницы (отзывы товара),
+COUNT(*) в них не выполняется, поэтому здесь только Paginator для админки.
+"""
+
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+
+DEFAULTS = {
+    'THRESHOLD': 100000,
+    'CACHE_TIMEOUT': 300,
+}
+
+
+def get_estimated_count_settings():
+    return {**DEFAULTS, **getattr(settings, 'ESTIMATED_COUNT', {})}
+
+
+def planner_estimate(queryset):
+    """
+    Оценка количества строк планировщиком Postgres или None
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    
+    query = queryset.query
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct and not query.combinator:
+            # Вся таблица: статистика из pg_class без чтения данных
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            # -1 означает, что таблица ещё не анализировалась
+            return row[0] if row and row[0] >= 0 else None
+        
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.sha1(f'{queryset.db}|{sql}|{params!r}'.encode()).hexdigest()
+    return f'count:{digest}'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который не делает COUNT(*) для больших выборок
+    """
+    count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        
+        config = get_estimated_count_settings()
+        estimate = planner_estimate(self.object_list)
+        if estimate is not None:
+            if estimate >= config['THRESHOLD']:
+                self.count_is_approximate = True
+                return estimate
+            return super().count
+        
+        cache_key = count_cache_key(self.object_list)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            self.count_is_approximate = True
+            return cached
+        count = super().count
+        if count >= config['THRESHOLD']:
+            cache.set(cache_key, count, config['CACHE_TIMEOUT'])
+        return count
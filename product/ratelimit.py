@@ -0,0 +1,113 @@
+"""
+Приблизительный подсчёт запросов с фиксированным объёмом памяти
+
+Count-min sketch из depth строк по width счётчиков:
+    width = ceil(e / EPSILON), depth = ceil(ln(1 / DELTA))
+Оценка для ключа никогда не меньше реального числа запросов и с вероятностью
+не ниже 1 - DELTA превышает его не больше чем на EPSILON * N, где N - общее
+число запросов за окно. Поэтому EPSILON выбирают так, чтобы EPSILON * N было
+заметно меньше лимита: например, при 1 000 000 запросов в минуту и лимите 100
+EPSILON = 1e-5 даёт погрешность не больше 10 запросов.
+
+Память: 2 окна * width * depth * 4 байта и не зависит от числа разных IP
+(EPSILON = 1e-5, DELTA = 0.01: width = 271829, depth = 5, около 10.9 МБ).
+"""
+
+import hashlib
+import math
+import threading
+import time
+from array import array
+
+
+class CountMinSketch:
+    def __init__(self, epsilon, delta):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.counters = array('I', [0]) * (self.width * self.depth)
+
+    def indexes(self, key):
+        """
+        Позиции ключа во всех строках (двойное хэширование одного blake2b)
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def estimate_at(self, indexes):
+        counters = self.counters
+        return min(counters[i] for i in indexes)
+
+    def add_at(self, indexes, estimate):
+        """
+        Conservative update: увеличиваем только минимальные счётчики,
+        это уменьшает завышение оценок без потери гарантии
+        """
+        counters = self.counters
+        target = estimate + 1
+        for i in indexes:
+            if counters[i] < target:
+                counters[i] = target
+
+    def clear(self):
+        self.counters = array('I', [0]) * (self.width * self.depth)
+
+    @property
+    def memory_bytes(self):
+        return self.counters.itemsize * len(self.counters)
+
+
+class SlidingWindowSketch:
+    """
+    Скользящее окно из двух скетчей: текущего и предыдущего.
+    Оценка = текущее окно + предыдущее * доля, ещё попадающая в окно.
+    Проверка, conservative update и смена окна выполняются под одной
+    блокировкой: иначе параллельные потоки теряют увеличения счётчиков.
+    """
+
+    def __init__(self, window, epsilon, delta):
+        self.lock = threading.Lock()
+        self.window = window
+        self.current = CountMinSketch(epsilon, delta)
+        self.previous = CountMinSketch(epsilon, delta)
+        self.window_start = self._window_start(time.time())
+
+    def _window_start(self, now):
+        return int(now // self.window) * self.window
+
+    def _rotate(self, now):
+        window_start = self._window_start(now)
+        # Запрос с более ранним временем, чем текущее окно, окно не меняет
+        if window_start <= self.window_start:
+            return
+        if window_start - self.window_start == self.window:
+            self.previous, self.current = self.current, self.previous
+            self.current.clear()
+        else:
+            # Запросов не было дольше двух окон
+            self.previous.clear()
+            self.current.clear()
+        self.window_start = window_start
+
+    def hit(self, key, limit, now=None):
+        """
+        Учёт запроса. Возвращает (разрешён ли запрос, оценка числа запросов за окно)
+        """
+        # Хэширование вне блокировки: позиции одинаковы в обоих скетчах
+        indexes = self.current.indexes(key)
+        with self.lock:
+            now = max(now or time.time(), self.window_start)
+            self._rotate(now)
+            current = self.current.estimate_at(indexes)
+            weight = 1 - (now - self.window_start) / self.window
+            estimate = current + self.previous.estimate_at(indexes) * weight
+            if estimate >= limit:
+                return False, estimate
+            self.current.add_at(indexes, current)
+        return True, estimate + 1
+
+    @property
+    def memory_bytes(self):
+        return self.current.memory_bytes + self.previous.memory_bytes
@@ -0,0 +1,352 @@
+"""
+Read-only реплика каталога в памяти процесса (CATALOG_REPLICA)
+
+Категории, товары и агрегаты отзывов (количество и сумма оценок на товар)
+хранятся в компактных записях со __slots__ с индексами по id и по категории.
+Загрузка начинается при старте процесса (wsgi.py, asgi.py) в фоновом потоке,
+затем тот же поток применяет журнал ChangeEvent после своего курсора seq.
+Списки и карточки категорий и товаров отдаются из памяти без обращения к
+базе. Ответы из реплики несут заголовки X-Replica-Seq (последний применённый
+seq) и X-Replica-Lag (секунды с последней успешной сверки с журналом).
+
+Пока реплика не загружена, отстала больше MAX_LAG или не нашла объект,
+запрос обслуживается из базы как обычно.
+"""
+
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from . import metrics
+from .models import Category, ChangeEvent, Product, Review
+from .sync import GapGuard
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'POLL_INTERVAL': 0.5,
+    'BATCH_SIZE': 1000,
+    'GAP_TIMEOUT': 5,  # сколько ждать пропущенный seq (незакоммиченная запись журнала)
+    'MAX_LAG': 30,  # реплика, не сверявшаяся дольше, не используется
+}
+
+CENT = Decimal('0.01')
+
+# Порядок полей как в CategorySerializer и ProductSerializer
+CATEGORY_FIELDS = ('id', 'name', 'updated_at')
+PRODUCT_FIELDS = ('id', 'title', 'description', 'price', 'category', 'updated_at')
+
+_datetime_field = serializers.DateTimeField()
+
+
+def get_replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'CATALOG_REPLICA', {})}
+
+
+def _money(value):
+    return '{:f}'.format(Decimal(value).quantize(CENT))
+
+
+class CategoryRecord:
+    __slots__ = ('id', 'name', 'updated_at')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.name = row['name']
+        self.updated_at = _datetime_field.to_representation(row['updated_at'])
+
+
+class ProductRecord:
+    __slots__ = ('id', 'title', 'description', 'price', 'category_id', 'updated_at', 'reviews_count', 'stars_sum')
+
+    def __init__(self, row, reviews_count=0, stars_sum=0):
+        self.id = row['id']
+        self.title = row['title']
+        self.description = row['description']
+        self.price = row['price']
+        self.category_id = row['category_id']
+        self.updated_at = _datetime_field.to_representation(row['updated_at'])
+        self.reviews_count = reviews_count
+        self.stars_sum = stars_sum
+
+    @property
+    def rating(self):
+        return round(self.stars_sum / self.reviews_count, 2) if self.reviews_count else 0.0
+
+
+def _category_rows(pks=None):
+    queryset = Category.objects.all() if pks is None else Category.objects.filter(pk__in=pks)
+    return queryset.values('id', 'name', 'updated_at')
+
+
+def _product_rows(pks=None):
+    queryset = Product.objects.all() if pks is None else Product.objects.filter(pk__in=pks)
+    return queryset.values('id', 'title', 'description', 'price', 'category_id', 'updated_at')
+
+
+def _rating_rows(product_ids=None):
+    queryset = Review.objects.all() if product_ids is None else Review.objects.filter(product_id__in=product_ids)
+    return queryset.values('product_id').annotate(total=Count('id'), stars=Sum('stars')).order_by()
+
+
+class CatalogReplica:
+    """
+    Снимок каталога в памяти и фоновый поток, применяющий журнал изменений
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_replica_settings()
+        self.lock = threading.Lock()
+        self.categories = {}
+        self.products = {}
+        self.by_category = {}  # category_id -> set(product_id)
+        self.rendered = {}  # готовые списки, сбрасываются при каждом изменении
+        self.cursor = 0  # последний применённый seq журнала
+        self.synced_at = None  # time.monotonic() последней успешной сверки
+        self.loaded = threading.Event()
+        self.gaps = GapGuard(self.config['GAP_TIMEOUT'])
+        self.pid = os.getpid()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='catalog-replica', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                if self.loaded.is_set():
+                    self.poll()
+                else:
+                    self.load()
+            except Exception:
+                logger.exception('Catalog replica sync failed')
+            finally:
+                close_old_connections()
+            time.sleep(self.config['POLL_INTERVAL'])
+
+    def lag(self):
+        return time.monotonic() - self.synced_at if self.synced_at is not None else None
+
+    def load(self):
+        """
+        Полный снимок. Курсор берётся до снимка: изменения, попавшие в
+        снимок, применятся повторно, это безопасно
+        """
+        cursor = ChangeEvent.objects.aggregate(seq=Max('seq'))['seq'] or 0
+        categories = {row['id']: CategoryRecord(row) for row in _category_rows()}
+        ratings = {row['product_id']: row for row in _rating_rows()}
+        products, by_category = {}, {}
+        for row in _product_rows().order_by('id').iterator(chunk_size=2000):
+            rating = ratings.get(row['id'])
+            record = ProductRecord(row, *((rating['total'], rating['stars']) if rating else ()))
+            products[record.id] = record
+            by_category.setdefault(record.category_id, set()).add(record.id)
+        with self.lock:
+            self.categories, self.products, self.by_category = categories, products, by_category
+            self.rendered = {}
+            self.cursor = cursor
+            self.synced_at = time.monotonic()
+        self.loaded.set()
+        logger.info('Catalog replica loaded: %d categories, %d products, seq %d', len(categories), len(products), cursor)
+
+    def poll(self):
+        while True:
+            changes = list(
+                ChangeEvent.objects.filter(seq__gt=self.cursor).order_by('seq')[:self.config['BATCH_SIZE']]
+            )
+            accepted = self.gaps.take(self.cursor, changes)
+            if accepted:
+                self.apply(accepted)
+                metrics.observe(
+                    'catalog_replica_apply_lag_seconds',
+                    (timezone.now() - accepted[-1].created_at).total_seconds()
+                )
+            if len(accepted) < self.config['BATCH_SIZE']:
+                break
+        with self.lock:
+            self.synced_at = time.monotonic()
+
+    def apply(self, changes):
+        """
+        Применение пачки журнала: текущее состояние изменённых объектов
+        грузится одним запросом на модель, все запросы - до блокировки
+        """
+        latest = {}
+        rated = set()
+        for change in changes:
+            latest[(change.model, change.object_id)] = change.action
+            if change.model == 'review' and change.product_id is not None:
+                rated.add(change.product_id)
+
+        def changed(model_name):
+            return {pk for (model, pk), action in latest.items()
+                    if model == model_name and action != ChangeEvent.ACTION_DELETE}
+
+        category_ids, product_ids, review_ids = changed('category'), changed('product'), changed('review')
+        categories = {row['id']: CategoryRecord(row) for row in _category_rows(category_ids)} if category_ids else {}
+        products = {row['id']: row for row in _product_rows(product_ids)} if product_ids else {}
+        # Пересозданная запись товара получает свежий агрегат отзывов
+        rated.update(products)
+        if review_ids:
+            rated.update(Review.objects.filter(pk__in=review_ids).values_list('product_id', flat=True))
+        ratings = {row['product_id']: row for row in _rating_rows(rated)} if rated else {}
+
+        with self.lock:
+            # Объекты, не найденные в базе, уже удалены: их удаление тоже в журнале
+            for pk in {pk for (model, pk) in latest if model == 'category'}:
+                if pk in categories:
+                    self.categories[pk] = categories[pk]
+                else:
+                    self.categories.pop(pk, None)
+            for pk in {pk for (model, pk) in latest if model == 'product'}:
+                self.remove_product(pk)
+                if pk in products:
+                    self.add_product(ProductRecord(products[pk]))
+            for pk in rated:
+                record = self.products.get(pk)
+                if record is not None:
+                    rating = ratings.get(pk)
+                    record.reviews_count, record.stars_sum = (rating['total'], rating['stars']) if rating else (0, 0)
+            self.rendered = {}
+            self.cursor = changes[-1].seq
+
+    def add_product(self, record):
+        self.products[record.id] = record
+        self.by_category.setdefault(record.category_id, set()).add(record.id)
+
+    def remove_product(self, pk):
+        record = self.products.pop(pk, None)
+        if record is not None:
+            self.by_category.get(record.category_id, set()).discard(pk)
+
+    def render_product(self, record, fields, includes):
+        values = {
+            'id': record.id, 'title': record.title, 'description': record.description,
+            'price': _money(record.price), 'category': record.category_id, 'updated_at': record.updated_at,
+        }
+        data = {name: values[name] for name in PRODUCT_FIELDS if not fields or name in fields}
+        if 'category' in includes:
+            category = self.categories.get(record.category_id)
+            data['category'] = {'id': category.id, 'name': category.name} if category else None
+        if 'rating' in includes:
+            data['rating'] = record.rating
+            data['reviews_count'] = record.reviews_count
+        return data
+
+    def product_list(self, fields, includes):
+        """
+        Готовый список хранится только со всеми полями (по одному на набор
+        include), поля из ?fields= выбираются из него для каждого запроса
+        """
+        key = ('products', tuple(sorted(includes)))
+        with self.lock:
+            if key not in self.rendered:
+                self.rendered[key] = [
+                    self.render_product(self.products[pk], None, includes) for pk in sorted(self.products)
+                ]
+            rendered = self.rendered[key]
+        if not fields:
+            return rendered
+        # Поля из include (rating, reviews_count) остаются всегда
+        return [{name: value for name, value in item.items() if name in fields or name not in PRODUCT_FIELDS}
+                for item in rendered]
+
+    def product_detail(self, pk, fields, includes):
+        """
+        Товар или None, если его нет в реплике
+        """
+        with self.lock:
+            record = self.products.get(pk)
+            return self.render_product(record, fields, includes) if record is not None else None
+
+    def category_list(self):
+        """
+        Полный список категорий с количеством товаров (как CategoryWithCountSerializer)
+        """
+        with self.lock:
+            if 'categories' not in self.rendered:
+                self.rendered['categories'] = [
+                    {'id': pk, 'name': self.categories[pk].name, 'products_count': len(self.by_category.get(pk, ()))}
+                    for pk in sorted(self.categories)
+                ]
+            return self.rendered['categories']
+
+    def category_detail(self, pk, fields):
+        with self.lock:
+            record = self.categories.get(pk)
+            if record is None:
+                return None
+            values = {'id': record.id, 'name': record.name, 'updated_at': record.updated_at}
+            return {name: values[name] for name in CATEGORY_FIELDS if not fields or name in fields}
+
+    def category_stats(self, pk):
+        """
+        Статистика категории по индексу товаров (как build_category_stats)
+        """
+        with self.lock:
+            if pk not in self.categories:
+                return None
+            records = [self.products[product_id] for product_id in self.by_category.get(pk, ())]
+            prices = [record.price for record in records]
+            reviews_count = sum(record.reviews_count for record in records)
+            stars_sum = sum(record.stars_sum for record in records)
+        return {
+            'category': pk,
+            'products_count': len(records),
+            'min_price': _money(min(prices)) if prices else None,
+            'max_price': _money(max(prices)) if prices else None,
+            'avg_price': _money(sum(prices) / len(prices)) if prices else None,
+            'reviews_count': reviews_count,
+            'rating': round(stars_sum / reviews_count, 2) if reviews_count else 0.0,
+        }
+
+    def respond(self, data):
+        response = Response(data)
+        response['X-Replica-Seq'] = str(self.cursor)
+        response['X-Replica-Lag'] = f'{self.lag():.3f}'
+        return response
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def warm_up():
+    """
+    Запуск загрузки реплики при старте процесса (не блокирует)
+    """
+    config = get_replica_settings()
+    if not config['ENABLED']:
+        return None
+    global _replica
+    with _replica_lock:
+        # После fork (gunicorn --preload) поток родителя в дочернем процессе не работает
+        if _replica is None or _replica.pid != os.getpid():
+            _replica = CatalogReplica(config)
+            _replica.start()
+    return _replica
+
+
+def get_replica():
+    """
+    Реплика, если она включена, загружена и не отстала больше MAX_LAG, иначе None
+    """
+    config = get_replica_settings()
+    if not config['ENABLED']:
+        return None
+    replica = _replica
+    if replica is None or replica.pid != os.getpid():
+        replica = warm_up()
+    if not replica.loaded.is_set() or replica.lag() > config['MAX_LAG']:
+        return None
+    return replica
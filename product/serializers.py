@@ -1,3 +1,4 @@
+from decimal import Decimal
 from rest_framework import serializers
 from django.db.models import Avg, Count
 from .models import Category, Product, Review
@@ -8,9 +9,34 @@ from .validators import (
 )
 
 
+class SparseFieldsMixin:
+    """
+    Ограничение набора полей сериализатора (параметр ?fields=)
+    """
+    # Поля, которые клиент может запросить через ?fields=
+    sparse_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_only_fields(cls, fields):
+        """
+        Колонки модели, которые нужно загрузить для запрошенных полей
+        """
+        concrete = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        return ['id'] + [name for name in fields if name in concrete and name != 'id']
+
+
 # Сериализаторы преобразуют модели в JSON и обратно.
 # С улучшенной валидацией для всех полей
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sparse_fields = ('id', 'name')
+
     # Применяем кастомную валидацию к полю name
     name = serializers.CharField(
         max_length=100,
@@ -54,7 +80,8 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 # Новый сериализатор для категорий с подсчётом товаров
-class CategoryWithCountSerializer(serializers.ModelSerializer):
+class CategoryWithCountSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sparse_fields = ('id', 'name', 'products_count')
     products_count = serializers.SerializerMethodField()
     
     class Meta:
@@ -62,11 +89,16 @@ class CategoryWithCountSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'products_count']
     
     def get_products_count(self, obj):
+        # Если queryset аннотирован Count('products'), отдельный запрос не нужен
+        if hasattr(obj, 'products_total'):
+            return obj.products_total
         # Подсчитываем количество товаров в данной категории
         return obj.products.count()
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sparse_fields = ('id', 'title', 'description', 'price', 'category')
+
     # Применяем кастомную валидацию ко всем полям товара
     title = serializers.CharField(
         max_length=100,
@@ -140,7 +172,9 @@ class ProductWithReviewsSerializer(serializers.ModelSerializer):
         return round(avg_rating, 2) if avg_rating else 0.0
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sparse_fields = ('id', 'text', 'stars', 'product')
+
     # Применяем кастомную валидацию ко всем полям отзыва
     text = serializers.CharField(
         validators=[
@@ -179,7 +213,8 @@ class ReviewSerializer(serializers.ModelSerializer):
         product = data.get('product')
         text = data.get('text', '').strip().lower()
         
-        if product and text:
+        # В режиме очереди дубли проверяются пакетно при записи (product/ingest.py)
+        if product and text and not self.context.get('defer_duplicate_check'):
             # Проверяем на дублированные отзывы с похожим текстом
             similar_reviews = Review.objects.filter(
                 product=product,
@@ -195,3 +230,47 @@ class ReviewSerializer(serializers.ModelSerializer):
                 })
         
         return data
+
+
+# Массовые операции над товарами (админка и POST /products/bulk/)
+class BulkProductOperationSerializer(serializers.Serializer):
+    percent = serializers.DecimalField(
+        max_digits=6, decimal_places=2, required=False,
+        min_value=Decimal('-99.99'), max_value=Decimal('1000')
+    )
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    category = serializers.PrimaryKeyRelatedField(
+        queryset=Category.objects.all(),
+        required=False,
+        error_messages={
+            'does_not_exist': 'Указанная категория не существует',
+            'incorrect_type': 'ID категории должен быть числом',
+        }
+    )
+
+    def validate(self, data):
+        """
+        Ровно одна операция: percent, amount или category
+        """
+        operations = [name for name in ('percent', 'amount', 'category') if data.get(name) is not None]
+        if len(operations) != 1:
+            raise serializers.ValidationError('Укажите ровно одну операцию: percent, amount или category')
+        data['operation'] = operations[0]
+        return data
+
+
+class BulkProductFilterSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    def validate(self, data):
+        # Без фильтра операция затронула бы весь каталог
+        if not data:
+            raise serializers.ValidationError('Укажите хотя бы один фильтр: ids, category, min_price или max_price')
+        return data
+
+
+class BulkProductUpdateSerializer(BulkProductOperationSerializer):
+    filter = BulkProductFilterSerializer()
@@ -0,0 +1,120 @@
+"""
+Обработчики сигналов моделей каталога
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from .cache import invalidate_objects
+from .category_cache import refresh_categories
+from .coalescing import bump_versions
+from .models import Category, ChangeEvent, Product, Review
+from .surrogate import category_key, product_key, product_reviews_key, purge_keys, review_key
+from .sync import record_changes, record_deletion, remember_deleted_product
+
+
+# Массовые изменения (bulk_create, update) не вызывают post_save,
+# поэтому код, который их выполняет, отправляет этот сигнал: sender - модель, pks - id объектов,
+# created=True - объекты только что созданы (bulk_create), category_ids - категории,
+# чьи списки и статистика зависят от изменённых товаров
+bulk_changed = Signal()
+
+
+# Журнал изменений для /sync/ пишется после коммита изменения одним писателем
+# (sync.write_events), чтобы номера событий шли в порядке коммитов
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Review)
+def catalog_change_recorded(sender, instance, signal, **kwargs):
+    if signal is post_delete:
+        record_deletion(instance, kwargs.get('origin'))
+    else:
+        action = ChangeEvent.ACTION_CREATE if kwargs.get('created') else ChangeEvent.ACTION_UPSERT
+        record_changes(sender, [instance.pk], action)
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, origin=None, **kwargs):
+    # Отзывы удаляются каскадом раньше товара: их tombstone нужна категория товара
+    remember_deleted_product(instance, origin)
+
+
+# Кэш сбрасываем после коммита, иначе параллельный запрос может
+# закэшировать ещё старые данные уже под новой версией.
+# Версии coalescing-кэша выдаются тем же ресурсам, что и surrogate-ключи
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    def invalidate():
+        keys = ['categories', category_key(instance.pk)]
+        invalidate_objects(Category, [instance.pk])
+        bump_versions(keys)
+        refresh_categories([instance.pk])
+        purge_keys(keys)
+    transaction.on_commit(invalidate)
+
+
+@receiver(pre_save, sender=Product)
+def product_category_loaded(sender, instance, raw=False, **kwargs):
+    # Товар, созданный не из запроса к базе (или без category_id), - категорию до изменения читаем из базы
+    if raw or instance._state.adding or hasattr(instance, '_loaded_category_id'):
+        return
+    instance._loaded_category_id = Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # При переносе товара меняются обе категории: прежняя и новая
+    category_ids = sorted({instance.category_id, getattr(instance, '_loaded_category_id', None)} - {None})
+    instance._loaded_category_id = instance.category_id
+
+    def invalidate():
+        keys = ['products', product_key(instance.pk), 'categories', *map(category_key, category_ids)]
+        invalidate_objects(Product, [instance.pk])
+        # Количество товаров в категориях тоже изменилось
+        invalidate_objects(Category, category_ids)
+        bump_versions(keys)
+        refresh_categories(category_ids)
+        purge_keys(keys)
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, **kwargs):
+    def invalidate():
+        keys = ['reviews', review_key(instance.pk), product_reviews_key(instance.product_id)]
+        invalidate_objects(Review, [instance.pk])
+        bump_versions(keys)
+        purge_keys(keys)
+    transaction.on_commit(invalidate)
+
+
+
+@receiver(bulk_changed)
+def objects_bulk_changed(sender, pks, created=False, category_ids=(), **kwargs):
+    record_changes(sender, pks, ChangeEvent.ACTION_CREATE if created else ChangeEvent.ACTION_UPSERT)
+    
+    def invalidate():
+        keys = bulk_surrogate_keys(sender, pks)
+        if category_ids:
+            # Сами категории не менялись: пересчитываются только их списки и статистика
+            keys += ['categories', *map(category_key, category_ids)]
+        invalidate_objects(sender, pks)
+        bump_versions(keys)
+        if sender is Category:
+            refresh_categories(pks)
+        if category_ids:
+            refresh_categories(category_ids)
+        purge_keys(keys)
+    transaction.on_commit(invalidate)
+
+
+def bulk_surrogate_keys(sender, pks):
+    if sender is Category:
+        return ['categories', *map(category_key, pks)]
+    if sender is Product:
+        return ['products', *map(product_key, pks)]
+    # Для отзывов нужны ещё ключи страниц отзывов их товаров
+    product_ids = Review.objects.filter(pk__in=pks).values_list('product_id', flat=True).distinct()
+    return ['reviews', *map(review_key, pks), *map(product_reviews_key, product_ids)]
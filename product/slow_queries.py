@@ -0,0 +1,154 @@
+"""
+Журнал медленных SQL-запросов с планом выполнения
+
+SlowQueryLogMiddleware подключает execute_wrapper ко всем соединениям на
+время запроса. Каждый запрос дольше THRESHOLD_MS пишется одной JSON-строкой
+в logs/slow_queries.log (логгер product.slow_queries): SQL, параметры
+(строки скрываются), view, длительность и план (EXPLAIN, на SQLite -
+EXPLAIN QUERY PLAN). Число записей ограничено MAX_PER_MINUTE, чтобы сам
+журнал не создавал нагрузку. Этот же файл использует команда index_advisor.
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger('product.slow_queries')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 200,
+    'MAX_PER_MINUTE': 30,
+    'EXPLAIN': True,
+    'REDACT': True,
+}
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+_state = threading.local()
+
+
+def get_slow_query_settings():
+    return {**DEFAULTS, **getattr(settings, 'SLOW_QUERY_LOG', {})}
+
+
+class RateLimiter:
+    """
+    Не больше limit записей за минуту на процесс
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.window_start = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window_start >= 60:
+                self.window_start = now
+                self.count = 0
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+
+def redact_params(params):
+    """
+    Строки и байты заменяются их длиной, числа и даты остаются как есть
+    """
+    def redact(value):
+        if isinstance(value, (str, bytes)):
+            return f'<redacted:{len(value)}>'
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+        return str(value)
+    
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact(value) for key, value in params.items()}
+    return [redact(value) for value in params]
+
+
+def explain(connection, sql, params):
+    """
+    План выполнения SELECT-запроса или None
+    """
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        # Отдельный курсор: результат исходного запроса ещё может читаться
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+
+
+class SlowQueryCapture:
+    def __init__(self, request, config, rate_limiter):
+        self.request = request
+        self.config = config
+        self.rate_limiter = rate_limiter
+
+    def __call__(self, execute, sql, params, many, context):
+        # Запросы EXPLAIN самого журнала не измеряем
+        if getattr(_state, 'active', False):
+            return execute(sql, params, many, context)
+        
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= self.config['THRESHOLD_MS'] and self.rate_limiter.allow():
+            _state.active = True
+            try:
+                self.record(context['connection'], sql, params, many, duration_ms)
+            finally:
+                _state.active = False
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        match = getattr(self.request, 'resolver_match', None)
+        entry = {
+            'timestamp': time.time(),
+            'duration_ms': round(duration_ms, 2),
+            'database': connection.alias,
+            'vendor': connection.vendor,
+            'view': match.view_name or match._func_path if match else None,
+            'method': self.request.method,
+            'path': self.request.path,
+            'sql': sql,
+            'params': None if many else redact_params(params) if self.config['REDACT'] else params,
+            'plan': explain(connection, sql, params) if self.config['EXPLAIN'] and not many else None,
+        }
+        logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class SlowQueryLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_slow_query_settings()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.rate_limiter = RateLimiter(self.config['MAX_PER_MINUTE'])
+
+    def __call__(self, request):
+        capture = SlowQueryCapture(request, self.config, self.rate_limiter)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(capture))
+            return self.get_response(request)
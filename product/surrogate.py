@@ -0,0 +1,224 @@
+"""
+Surrogate-ключи для кэширующего прокси перед GET-эндпоинтами
+
+Ответы view из product/views.py получают заголовок Surrogate-Key (например,
+"product-42 reviews-product-42") и Cache-Control с долгим s-maxage. После
+коммита изменений сигналы ставят ключи в очередь, а фоновый поток раз в
+FLUSH_INTERVAL отправляет их пачками через настраиваемый PURGER. Пачка, которую
+не удалось сбросить, повторяется с экспоненциальной задержкой до
+RETRY_ATTEMPTS раз; после этого ответ устареет не дольше, чем на S_MAXAGE.
+
+Сброс ключа заставляет прокси заново запросить ответ у любого воркера.
+Кэши приложения (coalescing, OBJECT_CACHE) к этому моменту должны быть
+сброшены во всех процессах, поэтому они должны быть общими (REDIS_URL).
+Реплика каталога (CATALOG_REPLICA) в каждом процессе догоняет журнал с
+задержкой: для неё REPURGE_AFTER повторяет сброс через заданное число секунд.
+"""
+
+import atexit
+import heapq
+import json
+import logging
+import threading
+import time
+import urllib.request
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_AGE': 60,  # для браузеров и клиентов
+    'S_MAXAGE': 5 * 60,  # для прокси, который сбрасывается по ключам
+    'PURGER': 'product.surrogate.NullPurger',
+    'PURGE_URL': '',
+    'PURGE_METHOD': 'POST',
+    'PURGE_HEADERS': {},
+    'PURGE_TIMEOUT': 2,
+    'BATCH_SIZE': 256,
+    'FLUSH_INTERVAL': 0.5,  # 0 - отправлять сразу после коммита
+    'RETRY_ATTEMPTS': 8,
+    'RETRY_BACKOFF': 1,  # задержка первого повтора, дальше удваивается
+    'RETRY_MAX_DELAY': 60,
+    'REPURGE_AFTER': 0,  # повторный сброс через столько секунд (0 - нет)
+}
+
+
+def get_surrogate_settings():
+    return {**DEFAULTS, **getattr(settings, 'SURROGATE_KEYS', {})}
+
+
+def category_key(category_id):
+    return f'category-{category_id}'
+
+
+def product_key(product_id):
+    return f'product-{product_id}'
+
+
+def review_key(review_id):
+    return f'review-{review_id}'
+
+
+def product_reviews_key(product_id):
+    return f'reviews-product-{product_id}'
+
+
+def add_surrogate_keys(response, keys, s_maxage=None):
+    """
+    Заголовки кэширования для успешного GET-ответа. keys=None - ответ не кэшируется
+    """
+    config = get_surrogate_settings()
+    if not config['ENABLED']:
+        return response
+    if response.status_code != 200 or keys is None:
+        patch_cache_control(response, no_store=True)
+        return response
+    response['Surrogate-Key'] = ' '.join(dict.fromkeys(keys))
+    patch_cache_control(
+        response, public=True, max_age=config['MAX_AGE'],
+        s_maxage=config['S_MAXAGE'] if s_maxage is None else s_maxage
+    )
+    return response
+
+
+class SurrogateKeyMixin:
+    """
+    Для APIView: GET-ответы помечаются ключами из get_surrogate_keys()
+    """
+
+    def get_surrogate_keys(self, request, response, **kwargs):
+        return None
+
+    def get_surrogate_max_age(self):
+        return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            add_surrogate_keys(
+                response, self.get_surrogate_keys(request, response, **kwargs), self.get_surrogate_max_age()
+            )
+        return response
+
+
+class NullPurger:
+    """
+    Прокси нет: ключи только пишутся в лог
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def purge(self, keys):
+        logger.debug(f'Surrogate purge: {" ".join(keys)}')
+
+
+class HTTPPurger(NullPurger):
+    """
+    Пачка ключей одним HTTP-запросом: ключи в заголовке Surrogate-Key
+    (как у Fastly) и в теле {"keys": [...]}
+    """
+
+    def purge(self, keys):
+        request = urllib.request.Request(
+            self.config['PURGE_URL'],
+            data=json.dumps({'keys': keys}).encode(),
+            method=self.config['PURGE_METHOD'],
+            headers={
+                'Content-Type': 'application/json',
+                'Surrogate-Key': ' '.join(keys),
+                **self.config['PURGE_HEADERS'],
+            },
+        )
+        with urllib.request.urlopen(request, timeout=self.config['PURGE_TIMEOUT']) as response:
+            response.read()
+
+
+class PurgeQueue:
+    """
+    Накопление ключей и отправка пачками из фонового потока
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.delayed = []  # куча (время отправки, номер попытки, пачка ключей)
+        self.thread = None
+        self.purger = None
+
+    def get_purger(self, config):
+        if self.purger is None:
+            self.purger = import_string(config['PURGER'])(config)
+        return self.purger
+
+    def add(self, keys):
+        config = get_surrogate_settings()
+        if not config['ENABLED'] or not keys:
+            return
+        with self.lock:
+            self.pending.update(keys)
+        if config['REPURGE_AFTER']:
+            self.delay(sorted(keys), 0, config['REPURGE_AFTER'], config)
+        if not config['FLUSH_INTERVAL']:
+            self.flush()
+        elif self.thread is None:
+            self.start(config['FLUSH_INTERVAL'])
+
+    def delay(self, keys, attempt, seconds, config):
+        with self.lock:
+            heapq.heappush(self.delayed, (time.monotonic() + seconds, attempt, keys))
+        # Отложенные пачки отправляет фоновый поток, даже если FLUSH_INTERVAL = 0
+        if self.thread is None:
+            self.start(config['FLUSH_INTERVAL'] or config['RETRY_BACKOFF'])
+
+    def start(self, interval):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        now = time.monotonic()
+        with self.lock:
+            keys, self.pending = sorted(self.pending), set()
+            due = []
+            while self.delayed and self.delayed[0][0] <= now:
+                _, attempt, batch = heapq.heappop(self.delayed)
+                due.append((attempt, batch))
+        if not keys and not due:
+            return
+        config = get_surrogate_settings()
+        purger = self.get_purger(config)
+        batches = [(0, keys[start:start + config['BATCH_SIZE']]) for start in range(0, len(keys), config['BATCH_SIZE'])]
+        for attempt, batch in batches + due:
+            try:
+                purger.purge(batch)
+            except Exception:
+                if attempt + 1 >= config['RETRY_ATTEMPTS']:
+                    # Дальше срок устаревания ограничивает только s-maxage
+                    logger.exception(f'Surrogate purge failed for {len(batch)} keys, giving up after {attempt + 1} attempts')
+                    continue
+                delay = min(config['RETRY_BACKOFF'] * 2 ** attempt, config['RETRY_MAX_DELAY'])
+                logger.warning(f'Surrogate purge failed for {len(batch)} keys, retry in {delay}s', exc_info=True)
+                self.delay(batch, attempt + 1, delay, config)
+
+
+purge_queue = PurgeQueue()
+
+
+def purge_keys(keys):
+    """
+    Вызывается после коммита (из transaction.on_commit в signals.py)
+    """
+    purge_queue.add(keys)
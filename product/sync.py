@@ -0,0 +1,166 @@
+"""
+Инкрементальная синхронизация каталога (/api/v1/sync/?since=<token>)
+
+Каждое изменение категорий, товаров и отзывов записывается в ChangeEvent
+(сигналы и bulk_changed). Токен - номер последнего отданного изменения
+(seq). Страница содержит текущее состояние объектов, изменённых после
+токена, и id удалённых объектов (tombstone).
+
+Запись в журнал выполняется после коммита изменения отдельной короткой
+транзакцией, и писатели журнала идут по одному (pg_advisory_xact_lock в
+Postgres, блокировка записи в SQLite). Поэтому seq выдаются в порядке
+коммита: пока виден seq N, все меньшие номера уже зафиксированы или
+откачены, и долгая транзакция не может получить номер меньше курсора
+клиента. Цена - изменение, закоммиченное перед падением процесса, может
+не попасть в журнал (об этом пишется в лог); такие объекты клиент получит
+только при полной синхронизации.
+"""
+
+import logging
+import time
+from functools import partial
+from django.conf import settings
+from django.db import connections, transaction
+from .models import Category, ChangeEvent, Product, Review
+from .serializers import CategorySerializer, ProductSerializer, ReviewSerializer
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 5000,
+}
+
+# Ключ pg_advisory_xact_lock писателя журнала
+LOG_LOCK_ID = 48100
+
+# model_name -> (модель, сериализатор, ключ в ответе)
+SYNC_MODELS = {
+    'category': (Category, CategorySerializer, 'categories'),
+    'product': (Product, ProductSerializer, 'products'),
+    'review': (Review, ReviewSerializer, 'reviews'),
+}
+
+
+def get_sync_settings():
+    return {**DEFAULTS, **getattr(settings, 'SYNC', {})}
+
+
+def write_events(events):
+    """
+    Запись в журнал одним писателем: seq выдаются в порядке коммита
+    """
+    connection = connections[ChangeEvent.objects.db]
+    with transaction.atomic(using=connection.alias):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOG_LOCK_ID])
+        ChangeEvent.objects.bulk_create(events)
+
+
+def _write_after_commit(events):
+    try:
+        write_events(events)
+    except Exception:
+        logger.exception(f'Change log write failed, {len(events)} events lost')
+
+
+def record_changes(model, pks, action=ChangeEvent.ACTION_UPSERT):
+    """
+    Запись изменений в журнал после коммита текущей транзакции
+    """
+    events = [ChangeEvent(model=model._meta.model_name, object_id=pk, action=action) for pk in pks]
+    if events:
+        transaction.on_commit(partial(_write_after_commit, events))
+
+
+def remember_deleted_product(instance, origin):
+    """
+    Категория удаляемого товара для tombstone его отзывов. При каскадном
+    удалении pre_delete всех объектов идут до post_delete, а origin - общий
+    для всего удаления объект (экземпляр или QuerySet, у которого вызван delete)
+    """
+    if origin is not None:
+        if not hasattr(origin, '_deleted_product_categories'):
+            origin._deleted_product_categories = {}
+        origin._deleted_product_categories[instance.pk] = instance.category_id
+
+
+def record_deletion(instance, origin=None):
+    """
+    Tombstone удалённого объекта вместе с его товаром и категорией
+    """
+    event = ChangeEvent(
+        model=instance._meta.model_name, object_id=instance.pk, action=ChangeEvent.ACTION_DELETE
+    )
+    if isinstance(instance, Category):
+        event.category_id = instance.pk
+    elif isinstance(instance, Product):
+        event.product_id, event.category_id = instance.pk, instance.category_id
+    elif isinstance(instance, Review):
+        event.product_id = instance.product_id
+        # Категорию берём у загруженного товара или у товара, удаляемого вместе с отзывом: без лишнего запроса
+        if Review.product.is_cached(instance):
+            event.category_id = instance.product.category_id
+        else:
+            event.category_id = getattr(origin, '_deleted_product_categories', {}).get(instance.product_id)
+    transaction.on_commit(partial(_write_after_commit, [event]))
+
+
+def get_changes(since, limit):
+    """
+    Страница изменений после номера since
+    """
+    events = list(ChangeEvent.objects.filter(seq__gt=since).order_by('seq')[:limit + 1])
+    has_more = len(events) > limit
+    events = events[:limit]
+    
+    # Объект мог меняться несколько раз: важно только последнее действие
+    latest = {}
+    for event in events:
+        latest[(event.model, event.object_id)] = event.action
+    
+    changes, deleted = {}, {}
+    for model_name, (model, serializer_class, name) in SYNC_MODELS.items():
+        upserts = [pk for (event_model, pk), action in latest.items()
+                   if event_model == model_name and action != ChangeEvent.ACTION_DELETE]
+        deleted[name] = sorted(pk for (event_model, pk), action in latest.items()
+                               if event_model == model_name and action == ChangeEvent.ACTION_DELETE)
+        # Объекты, удалённые после этой страницы, придут как удаления на следующих
+        queryset = model.objects.filter(pk__in=upserts).order_by('pk') if upserts else model.objects.none()
+        changes[name] = serializer_class(queryset, many=True).data
+    
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        'next': str(events[-1].seq if events else since),
+        'has_more': has_more,
+    }
+
+
+class GapGuard:
+    """
+    Чтение журнала по курсору: дальше курсора пропускается только непрерывная
+    последовательность seq. Пропуск означает ещё не закоммиченную запись в
+    журнал, пропуск старше timeout секунд считается откатом.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.started = None
+
+    def take(self, cursor, changes):
+        accepted = []
+        expected = cursor + 1
+        for change in changes:
+            if change.seq != expected:
+                now = time.monotonic()
+                if self.started is None:
+                    self.started = now
+                if now - self.started < self.timeout:
+                    break
+            self.started = None
+            accepted.append(change)
+            expected = change.seq + 1
+        return accepted
@@ -1,3 +1,737 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from users.tokens import issue_tokens
+from . import metrics
+from .bulk import change_prices, move_to_category
+from .events import BroadcastHub, Event, event_stream_app, get_event_stream_settings
+from .includes import PRODUCT_INCLUDES
+from .ingest import flush_pending_reviews
+from .middleware import CompressionMiddleware
+from .models import Category, ChangeEvent, Product, Review, ReviewSubmission
+from .pagination import EstimatedCountPaginator
+from .ratelimit import CountMinSketch, SlidingWindowSketch
+from .replica import CatalogReplica, get_replica_settings
+from .serializers import ProductSerializer
+from .slow_queries import SlowQueryCapture, get_slow_query_settings
+from .surrogate import PurgeQueue, category_key, product_reviews_key
+from .sync import get_changes
+from .utils import get_client_ip
+from .views import parse_fields_param, parse_ids_param, parse_include_param
 
-# Create your tests here.
+
+class ClientIPTests(SimpleTestCase):
+    def request(self, remote_addr, forwarded_for):
+        return RequestFactory().get('/', REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxy(self):
+        self.assertEqual(get_client_ip(self.request('203.0.113.7', '198.51.100.1')), '203.0.113.7')
+
+    @override_settings(TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_supplied_hops_are_not_trusted(self):
+        # Клиент дописал поддельный адрес слева, прокси добавил реальный справа
+        request = self.request('10.0.0.5', '198.51.100.1, 203.0.113.7')
+        self.assertEqual(get_client_ip(request), '203.0.113.7')
+
+
+class CompressionTests(SimpleTestCase):
+    body = {'results': [{'id': index, 'title': f'Product {index}'} for index in range(200)]}
+
+    def setUp(self):
+        caches['compression'].clear()
+
+    def respond(self, accept_encoding, body=None):
+        def get_response(request):
+            response = JsonResponse(self.body if body is None else body)
+            response['ETag'] = '"v1"'
+            return response
+        middleware = CompressionMiddleware(get_response)
+        return middleware, middleware(RequestFactory().get('/api/v1/products/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_client_preference_wins(self):
+        cases = {
+            'gzip, br;q=0.1': 'gzip',
+            'br, gzip': 'br',  # равные q - порядок сервера
+            'gzip;q=0.5, zstd;q=0.8': 'zstd',
+            '*;q=0.5, gzip': 'gzip',
+            'gzip;q=0, br;q=0': None,
+            '': None,
+        }
+        for header, expected in cases.items():
+            _, response = self.respond(header)
+            self.assertEqual(response.get('Content-Encoding'), expected, header)
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_small_body_is_not_compressed(self):
+        _, response = self.respond('gzip', body={'id': 1})
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['ETag'], '"v1"')
+
+    def test_compressed_etag_is_weak(self):
+        _, response = self.respond('gzip')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), self.body)
+
+    def test_compressed_body_is_cached(self):
+        middleware, first = self.respond('gzip')
+        compress = mock.Mock(side_effect=middleware.compress_gzip)
+        middleware.encoders = [('gzip', compress)]
+        second = middleware(RequestFactory().get('/api/v1/products/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(second.content, first.content)
+        compress.assert_not_called()
+
+
+class RateLimitSketchTests(SimpleTestCase):
+    def test_error_bound(self):
+        epsilon = 0.001
+        sketch = CountMinSketch(epsilon, 0.01)
+        counts = {f'10.0.{index // 256}.{index % 256}': index % 7 + 1 for index in range(2000)}
+        for key, count in counts.items():
+            indexes = sketch.indexes(key)
+            for _ in range(count):
+                sketch.add_at(indexes, sketch.estimate_at(indexes))
+        total = sum(counts.values())
+        errors = [sketch.estimate_at(sketch.indexes(key)) - count for key, count in counts.items()]
+        # Оценка никогда не занижена и почти всегда завышена не больше чем на EPSILON * N
+        self.assertGreaterEqual(min(errors), 0)
+        self.assertLessEqual(sum(error > epsilon * total for error in errors), len(errors) * 0.01)
+
+    def test_window_rotation(self):
+        sketch = SlidingWindowSketch(60, 0.01, 0.01)
+        sketch.window_start = 600
+        for _ in range(10):
+            sketch.hit('ip', 100, now=610)
+        self.assertEqual(sketch.hit('ip', 100, now=620), (True, 11))
+        # Новое окно: предыдущее учитывается с долей, ещё попадающей в окно
+        self.assertEqual(sketch.hit('ip', 100, now=690), (True, 11 * 0.5 + 1))
+        self.assertEqual(sketch.window_start, 660)
+        # Запрос с опоздавшим временем не откатывает и не сбрасывает окно
+        sketch.hit('ip', 100, now=650)
+        self.assertEqual(sketch.window_start, 660)
+        self.assertEqual(sketch.current.estimate_at(sketch.current.indexes('ip')), 2)
+        # Пауза дольше двух окон сбрасывает оба
+        self.assertEqual(sketch.hit('ip', 100, now=900), (True, 1))
+
+    def test_concurrent_hits_are_not_lost(self):
+        sketch = SlidingWindowSketch(60, 0.01, 0.01)
+        sketch.window_start = 600
+
+        def worker():
+            for _ in range(2000):
+                sketch.hit('ip', 10 ** 9, now=610)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sketch.current.estimate_at(sketch.current.indexes('ip')), 16000)
+
+
+class ProductReviewListTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=category)
+        for stars in (3, 4, 5):
+            Review.objects.create(text=f'Review {stars}', stars=stars, product=self.product)
+
+    def test_fields_without_id_keep_cursor(self):
+        response = self.client.get(f'/api/v1/products/{self.product.id}/reviews/?fields=text&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [{'text': 'Review 5'}, {'text': 'Review 4'}])
+        self.assertIsNotNone(response.json()['next_cursor'])
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser(email='admin@example.com', password='secret123')
+        self.client.force_login(admin)
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Waterproof case', price='10.00', category=category)
+        self.review = Review.objects.create(text='Battery lasts two days', stars=5, product=self.product)
+
+    def test_search_by_text_and_description(self):
+        response = self.client.get('/admin/product/review/', {'q': 'two days'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.review])
+        response = self.client.get('/admin/product/product/', {'q': 'waterproof'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.product])
+
+
+class QueryParamsTests(SimpleTestCase):
+    def request(self, query):
+        return Request(RequestFactory().get(f'/api/v1/products/?{query}'))
+
+    def test_duplicates_are_dropped(self):
+        self.assertEqual(parse_fields_param(self.request('fields=title,id,title'), ProductSerializer), (True, {}, ['title', 'id']))
+        self.assertEqual(
+            parse_include_param(self.request('include=category, category,rating'), PRODUCT_INCLUDES),
+            (True, {}, ('category', 'rating'))
+        )
+        self.assertEqual(parse_ids_param(self.request('ids=3,1,3')), (True, {}, [3, 1]))
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=self.category)
+        self.review = Review.objects.create(text='Good phone', stars=4, product=self.product)
+
+    def test_unknown_fields_are_rejected(self):
+        urls = {
+            '/api/v1/products/': ProductSerializer.sparse_fields,
+            f'/api/v1/products/{self.product.id}/': ProductSerializer.sparse_fields,
+            f'/api/v1/categories/{self.category.id}/': ('id', 'name'),
+            f'/api/v1/reviews/': ('id', 'text', 'stars', 'product'),
+        }
+        for url, allowed in urls.items():
+            response = self.client.get(url, {'fields': 'title,secret'})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json()['unknown'], ['secret'] if 'title' in allowed else ['title', 'secret'])
+            self.assertEqual(response.json()['allowed'], list(allowed))
+        self.assertEqual(self.client.get('/api/v1/products/', {'fields': ','}).status_code, 400)
+
+    def assert_columns(self, url, fields, expected, skipped_column):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': fields})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        rows = data if isinstance(data, list) else [data]
+        self.assertEqual([set(row) for row in rows], [expected])
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            self.assertNotIn(skipped_column, query['sql'])
+
+    def test_only_requested_columns_are_selected(self):
+        product_fields = {'id', 'title', 'price'}
+        self.assert_columns('/api/v1/products/', 'id,title,price', product_fields, '"description"')
+        self.assert_columns(f'/api/v1/products/{self.product.id}/', 'id,title,price', product_fields, '"description"')
+        self.assert_columns(f'/api/v1/categories/{self.category.id}/', 'id', {'id'}, '"name"')
+        self.assert_columns(f'/api/v1/reviews/{self.review.id}/', 'id,stars', {'id', 'stars'}, '"text"')
+        self.assert_columns('/api/v1/reviews/', 'id,stars', {'id', 'stars'}, '"text"')
+
+
+class IncludeTests(TestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(name='Phones')
+        self.laptops = Category.objects.create(name='Laptops')
+        self.phone = Product.objects.create(title='Phone X', description='Description', price='10.00', category=self.phones)
+        self.laptop = Product.objects.create(title='Laptop Y', description='Description', price='20.00', category=self.laptops)
+        self.phone_reviews = [
+            Review.objects.create(text=f'Review {index}', stars=index % 5 + 1, product=self.phone) for index in range(7)
+        ]
+        Review.objects.create(text='Only one', stars=4, product=self.laptop)
+
+    def get_products(self, query):
+        response = self.client.get(f'/api/v1/products/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id']: item for item in response.json()}
+
+    def test_one_query_per_relation(self):
+        with self.assertNumQueries(1):
+            self.get_products('')
+        with self.assertNumQueries(4):
+            products = self.get_products('include=category,reviews,rating')
+        self.assertEqual(products[self.phone.id]['category'], {'id': self.phones.id, 'name': 'Phones'})
+        self.assertEqual(products[self.laptop.id]['category'], {'id': self.laptops.id, 'name': 'Laptops'})
+        self.assertEqual(products[self.phone.id]['reviews_count'], 7)
+        self.assertEqual(products[self.phone.id]['rating'], round(sum(r.stars for r in self.phone_reviews) / 7, 2))
+
+    def test_five_newest_reviews_per_product(self):
+        products = self.get_products('include=reviews')
+        newest = [review.id for review in reversed(self.phone_reviews)][:5]
+        self.assertEqual([review['id'] for review in products[self.phone.id]['reviews']], newest)
+        self.assertEqual([review['text'] for review in products[self.laptop.id]['reviews']], ['Only one'])
+
+    def test_include_with_fields(self):
+        products = self.get_products('fields=title&include=category')
+        self.assertEqual(
+            products[self.phone.id],
+            {'id': self.phone.id, 'title': 'Phone X', 'category': {'id': self.phones.id, 'name': 'Phones'}}
+        )
+        products = self.get_products('fields=price&include=rating')
+        self.assertEqual(set(products[self.laptop.id]), {'id', 'price', 'rating', 'reviews_count'})
+        response = self.client.get(f'/api/v1/products/{self.phone.id}/', {'fields': 'title', 'include': 'reviews'})
+        self.assertEqual(set(response.json()), {'id', 'title', 'reviews'})
+        self.assertEqual(len(response.json()['reviews']), 5)
+
+    @override_settings(COALESCING={'ENABLED': True, 'TIMEOUT': 60})
+    def test_spaced_include_keys(self):
+        cache.clear()
+        response = self.client.get('/api/v1/products/?include=category,%20reviews')
+        self.assertEqual(response['Surrogate-Key'].split(), ['products', 'categories', 'reviews'])
+        response = self.client.get(f'/api/v1/products/{self.laptop.id}/?include=category,%20reviews')
+        self.assertIn(product_reviews_key(self.laptop.id), response['Surrogate-Key'].split())
+        
+        # Новый отзыв сбрасывает закэшированный список со встроенными отзывами
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(text='Second one', stars=5, product=self.laptop)
+        products = self.get_products('include=category,%20reviews')
+        self.assertEqual(len(products[self.laptop.id]['reviews']), 2)
+
+
+class ReplicaProductListTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=category)
+        self.replica = CatalogReplica({**get_replica_settings(), 'ENABLED': True})
+        self.replica.load()
+
+    def test_one_render_per_include_set(self):
+        self.assertEqual(
+            self.replica.product_list(['title', 'id'], ('rating',)),
+            [{'id': self.product.pk, 'title': 'Phone X', 'rating': 0.0, 'reviews_count': 0}]
+        )
+        self.replica.product_list(['price'], ('rating',))
+        self.replica.product_list(None, ('rating',))
+        self.assertEqual(list(self.replica.rendered), [('products', ('rating',))])
+
+
+class EstimatedCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Phones')
+        for index in range(3):
+            Product.objects.create(title=f'Phone {index}', description='Description', price='10.00', category=category)
+
+    def count(self):
+        paginator = EstimatedCountPaginator(Product.objects.order_by('id'), 2)
+        return paginator.count, paginator.count_is_approximate
+
+    @override_settings(ESTIMATED_COUNT={'THRESHOLD': 100, 'CACHE_TIMEOUT': 60})
+    def test_planner_estimate_above_threshold(self):
+        with mock.patch('product.pagination.planner_estimate', return_value=5000):
+            self.assertEqual(self.count(), (5000, True))
+        with mock.patch('product.pagination.planner_estimate', return_value=50):
+            self.assertEqual(self.count(), (3, False))
+
+    def test_exact_count_below_threshold_is_not_cached(self):
+        self.assertEqual(self.count(), (3, False))
+        Product.objects.filter(title='Phone 0').delete()
+        self.assertEqual(self.count(), (2, False))
+
+    @override_settings(ESTIMATED_COUNT={'THRESHOLD': 3, 'CACHE_TIMEOUT': 60})
+    def test_cached_count_above_threshold(self):
+        self.assertEqual(self.count(), (3, False))
+        Product.objects.filter(title='Phone 0').delete()
+        self.assertEqual(self.count(), (3, True))
+
+    @override_settings(ESTIMATED_COUNT={'THRESHOLD': 3, 'CACHE_TIMEOUT': 60})
+    def test_admin_marks_approximate_count(self):
+        admin = get_user_model().objects.create_superuser(email='admin@example.com', password='secret123')
+        self.client.force_login(admin)
+        label = 'Количество записей приблизительное'
+        self.assertNotContains(self.client.get('/admin/product/product/'), label)
+        self.assertContains(self.client.get('/admin/product/product/'), label)
+
+
+class BatchIdsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=self.category)
+        self.review = Review.objects.create(text='Good phone', stars=4, product=self.product)
+
+    def assert_batch(self, url, expected):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), expected)
+
+    def check_fields_without_id(self):
+        self.assert_batch(
+            f'/api/v1/products/?ids={self.product.id},999&fields=title',
+            {'results': [{'title': 'Phone X'}], 'missing': [999]},
+        )
+        self.assert_batch(f'/api/v1/categories/?ids={self.category.id}&fields=name', {'results': [{'name': 'Phones'}], 'missing': []})
+        self.assert_batch(f'/api/v1/reviews/?ids={self.review.id}&fields=text', {'results': [{'text': 'Good phone'}], 'missing': []})
+
+    def test_fields_without_id(self):
+        self.check_fields_without_id()
+
+    @override_settings(OBJECT_CACHE='default')
+    def test_fields_without_id_from_object_cache(self):
+        self.check_fields_without_id()
+        # Второй проход читается из кэша объектов
+        self.check_fields_without_id()
+
+
+@override_settings(COALESCING={'ENABLED': True, 'TIMEOUT': 60})
+class CoalescingVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=self.category)
+
+    def test_versions_are_per_resource(self):
+        self.client.get('/api/v1/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(text='Good phone', stars=4, product=self.product)
+        # Отзыв не затрагивает список товаров без рейтинга
+        with self.assertNumQueries(0):
+            self.client.get('/api/v1/products/')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Phone Y'
+            self.product.save()
+        response = self.client.get('/api/v1/products/')
+        self.assertEqual(response.json()[0]['title'], 'Phone Y')
+
+
+@override_settings(COALESCING={'ENABLED': True, 'TIMEOUT': 60})
+class ProductMoveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.old = Category.objects.create(name='Phones')
+        self.new = Category.objects.create(name='Tablets')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=self.old)
+
+    def counts(self):
+        return {row['id']: row['products_count'] for row in self.client.get('/api/v1/categories/').json()}
+
+    def test_both_categories_are_refreshed(self):
+        self.assertEqual(self.counts(), {self.old.id: 1, self.new.id: 0})
+        self.client.get(f'/api/v1/categories/{self.old.id}/stats/')
+        product = Product.objects.get(pk=self.product.pk)
+        with mock.patch('product.signals.purge_keys') as purge_keys:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.category = self.new
+                product.save()
+        self.assertIn(category_key(self.old.id), purge_keys.call_args.args[0])
+        self.assertIn(category_key(self.new.id), purge_keys.call_args.args[0])
+        self.assertEqual(self.counts(), {self.old.id: 0, self.new.id: 1})
+        stats = self.client.get(f'/api/v1/categories/{self.old.id}/stats/').json()
+        self.assertEqual(stats['products_count'], 0)
+
+
+
+class BulkOperationTests(TestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(name='Phones')
+        self.tablets = Category.objects.create(name='Tablets')
+        self.cheap = Product.objects.create(title='Phone X', description='Description', price='5.00', category=self.phones)
+        self.expensive = Product.objects.create(title='Tablet X', description='Description', price='10.00', category=self.tablets)
+
+    def prices(self):
+        return dict(Product.objects.values_list('pk', 'price'))
+
+    def events(self):
+        return set(ChangeEvent.objects.values_list('model', 'object_id'))
+
+    def test_percent_is_rounded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(change_prices(Product.objects.all(), percent='33.33'), (2, 0))
+        self.assertEqual(self.prices(), {self.cheap.pk: Decimal('6.67'), self.expensive.pk: Decimal('13.33')})
+
+    def check_out_of_bounds_prices_are_skipped(self):
+        with mock.patch('product.signals.purge_keys') as purge_keys:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(change_prices(Product.objects.all(), amount='-7'), (1, 1))
+        self.assertEqual(self.prices(), {self.cheap.pk: Decimal('5.00'), self.expensive.pk: Decimal('3.00')})
+        # Пропущенный товар и категории (не менявшиеся строки) в журнал не попадают
+        self.assertEqual(self.events(), {('product', self.expensive.pk)})
+        keys = purge_keys.call_args.args[0]
+        self.assertIn(category_key(self.tablets.pk), keys)
+        self.assertNotIn(category_key(self.phones.pk), keys)
+
+    def test_out_of_bounds_prices_are_skipped(self):
+        self.check_out_of_bounds_prices_are_skipped()
+
+    def test_out_of_bounds_prices_are_skipped_without_returning(self):
+        with mock.patch('product.bulk._supports_update_returning', return_value=False):
+            self.check_out_of_bounds_prices_are_skipped()
+
+    def test_move_to_category(self):
+        with mock.patch('product.signals.refresh_categories') as refresh_categories:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(move_to_category(Product.objects.all(), self.tablets), 1)
+        self.assertEqual(Product.objects.get(pk=self.cheap.pk).category_id, self.tablets.pk)
+        self.assertEqual(set(refresh_categories.call_args.args[0]), {self.phones.pk, self.tablets.pk})
+        self.assertEqual(self.events(), {('product', self.cheap.pk)})
+        # Повторный перенос ничего не меняет
+        self.assertEqual(move_to_category(Product.objects.all(), self.tablets), 0)
+
+    def post_bulk(self, user=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {issue_tokens(user)["access"]}'} if user else {}
+        return self.client.post(
+            '/api/v1/products/bulk/', {'filter': {'category': self.tablets.pk}, 'percent': '10'},
+            content_type='application/json', **headers
+        )
+
+    def test_endpoint_requires_admin(self):
+        self.assertIn(self.post_bulk().status_code, (401, 403))
+        user = get_user_model().objects.create_user(email='user@example.com', password='secret123', is_active=True)
+        self.assertEqual(self.post_bulk(user).status_code, 403)
+        self.assertEqual(self.prices()[self.expensive.pk], Decimal('10.00'))
+        
+        admin = get_user_model().objects.create_superuser(email='admin@example.com', password='secret123')
+        response = self.post_bulk(admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'operation': 'percent', 'updated': 1, 'skipped': 0})
+        self.assertEqual(self.prices()[self.expensive.pk], Decimal('11.00'))
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(name='Phones')
+        self.tablets = Category.objects.create(name='Tablets')
+
+    def make_hub(self, cursor, buffered=()):
+        hub = BroadcastHub(get_event_stream_settings())
+        hub.task = mock.Mock()  # опрос журнала не запускается: события публикует тест
+        hub.cursor = cursor
+        hub.ready.set()
+        hub.buffer.extend(buffered)
+        return hub
+
+    def stream(self, hub, query='', last_event_id=None, publish=()):
+        """
+        Подключение к event_stream_app: тело ответа после первой отправки
+        (и после публикации publish), затем отключение клиента
+        """
+        headers = [(b'last-event-id', str(last_event_id).encode())] if last_event_id is not None else []
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/v1/events/', 'query_string': query.encode(), 'headers': headers}
+        
+        async def run():
+            sent = []
+            disconnected = asyncio.Event()
+            
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+            
+            async def send(message):
+                sent.append(message)
+            
+            async def wait_bodies(count):
+                while sum(message['type'] == 'http.response.body' for message in sent) < count:
+                    await asyncio.sleep(0.01)
+            
+            task = asyncio.ensure_future(event_stream_app(scope, receive, send))
+            await asyncio.wait_for(wait_bodies(1), 5)
+            if publish:
+                bodies = sum(message['type'] == 'http.response.body' for message in sent)
+                hub.publish(publish)
+                await asyncio.wait_for(wait_bodies(bodies + 1), 5)
+            disconnected.set()
+            await asyncio.wait_for(task, 5)
+            return sent
+        
+        with mock.patch('product.events.get_hub', return_value=hub):
+            sent = async_to_sync(run)()
+        self.assertEqual(sent[0]['status'], 200)
+        return b''.join(message.get('body', b'') for message in sent[1:]).decode()
+
+    def ids(self, body):
+        return [int(seq) for seq in re.findall(r'^id: (\d+)$', body, re.M)]
+
+    def create_products(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                Product.objects.create(title=f'Phone {index}', description='Description', price='10.00', category=self.phones)
+        return list(ChangeEvent.objects.filter(model='product').values_list('seq', flat=True).order_by('seq'))
+
+    def test_resume_from_buffer(self):
+        buffered = [Event(seq, 'product.updated', {'id': seq}, seq, self.phones.pk) for seq in range(1, 6)]
+        hub = self.make_hub(5, buffered)
+        with self.assertNumQueries(0):
+            body = self.stream(hub, last_event_id=3)
+        self.assertEqual(self.ids(body), [4, 5])
+
+    def test_replay_from_database(self):
+        seqs = self.create_products(3)
+        body = self.stream(self.make_hub(seqs[-1]), query=f'last_event_id={seqs[0]}')
+        self.assertEqual(self.ids(body), seqs[1:])
+        self.assertIn('"title": "Phone 2"', body)
+
+    def test_reset_when_gap_exceeds_replay_limit(self):
+        seqs = self.create_products(3)
+        with override_settings(EVENT_STREAM={'REPLAY_LIMIT': 1}):
+            body = self.stream(self.make_hub(seqs[-1]), last_event_id=seqs[0])
+        self.assertTrue(body.startswith('event: reset\n'))
+        self.assertEqual(self.ids(body), [])
+
+    def test_filters(self):
+        events = [
+            Event(11, 'product.updated', {'id': 1}, 1, self.phones.pk),
+            Event(12, 'product.updated', {'id': 2}, 2, self.tablets.pk),
+            Event(13, 'review.created', {'id': 7, 'product': 1}, 1, self.phones.pk),
+        ]
+        self.assertEqual(self.ids(self.stream(self.make_hub(10), publish=events)), [11, 12, 13])
+        self.assertEqual(self.ids(self.stream(self.make_hub(10), query=f'category={self.phones.pk}', publish=events)), [11, 13])
+        self.assertEqual(self.ids(self.stream(self.make_hub(10), query='product=2', publish=events)), [12])
+
+    def test_poll_publishes_committed_changes(self):
+        seqs = self.create_products(1)
+        hub = self.make_hub(seqs[-1])
+        product = Product.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = '12.00'
+            product.save()
+        async_to_sync(hub.poll)()
+        event, = hub.buffer
+        self.assertEqual((event.name, event.category_id), ('product.updated', self.phones.pk))
+        self.assertEqual(event.data['price'], '12.00')
+        self.assertEqual(hub.cursor, event.seq)
+
+class FlakyPurger:
+    def __init__(self, config):
+        self.failures = 1
+        self.purged = []
+
+    def purge(self, keys):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('proxy unavailable')
+        self.purged.append(keys)
+
+
+@override_settings(SURROGATE_KEYS={
+    'PURGER': 'product.tests.FlakyPurger', 'FLUSH_INTERVAL': 0, 'RETRY_BACKOFF': 0.01, 'RETRY_ATTEMPTS': 2
+})
+class PurgeQueueTests(SimpleTestCase):
+    def test_failed_batch_is_retried(self):
+        queue = PurgeQueue()
+        queue.thread = threading.current_thread()  # повторы отправляем вручную
+        with self.assertLogs('product.surrogate', 'WARNING'):
+            queue.add(['product-1'])
+        self.assertEqual(queue.purger.purged, [])
+        time.sleep(0.02)
+        queue.flush()
+        self.assertEqual(queue.purger.purged, [['product-1']])
+        self.assertEqual(queue.delayed, [])
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones')
+
+    def test_slow_transaction_is_not_skipped(self):
+        # Долгая транзакция изменила товар, но ещё не закоммичена
+        with self.captureOnCommitCallbacks() as slow:
+            slow_product = Product.objects.create(title='Slow', description='Description', price='10.00', category=self.category)
+        self.assertFalse(ChangeEvent.objects.filter(model='product', object_id=slow_product.pk).exists())
+
+        # Тем временем клиент синхронизации забирает более быстрое изменение
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='Fast', description='Description', price='10.00', category=self.category)
+        cursor = int(get_changes(0, 100)['next'])
+
+        # Коммит долгой транзакции: номер в журнале больше курсора клиента
+        for callback in slow:
+            callback()
+        page = get_changes(cursor, 100)
+        self.assertEqual([product['title'] for product in page['changes']['products']], ['Slow'])
+
+    def review_tombstone(self, delete):
+        product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=self.category)
+        review = Review.objects.create(text='Good phone', stars=4, product=product)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete(product)
+        return ChangeEvent.objects.get(model='review', object_id=review.pk, action=ChangeEvent.ACTION_DELETE)
+
+    def test_cascade_review_tombstone_has_category(self):
+        self.assertEqual(self.review_tombstone(lambda product: product.delete()).category_id, self.category.pk)
+        tombstone = self.review_tombstone(lambda product: Product.objects.filter(pk=product.pk).delete())
+        self.assertEqual(tombstone.category_id, self.category.pk)
+        tombstone = self.review_tombstone(lambda product: Category.objects.filter(pk=product.category_id).delete())
+        self.assertEqual(tombstone.category_id, self.category.pk)
+
+
+@override_settings(REVIEW_INGEST_MODE='queue')
+class ReviewQueueTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(title='Phone X', description='Description', price='10.00', category=category)
+
+    def test_submission_is_durable_and_written_once(self):
+        response = self.client.post(
+            '/api/v1/reviews/', {'text': 'Good phone', 'stars': 4, 'product': self.product.id},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 202)
+        # До flush отзыв хранится только в закоммиченной заявке, а не в памяти процесса
+        self.assertFalse(Review.objects.exists())
+        submission = ReviewSubmission.objects.get(tracking_id=response.json()['tracking_id'])
+        self.assertEqual(submission.status, ReviewSubmission.STATUS_PENDING)
+
+        self.assertEqual(flush_pending_reviews(), (1, 0))
+        self.assertEqual(flush_pending_reviews(), (0, 0))
+        self.assertEqual(Review.objects.filter(product=self.product, text='Good phone').count(), 1)
+        status_response = self.client.get(response.json()['status_url'])
+        self.assertEqual(status_response.json()['status'], ReviewSubmission.STATUS_CREATED)
+
+    def test_purge_keeps_pending_submissions(self):
+        ReviewSubmission.objects.create(payload={'text': 'Old', 'stars': 5, 'product': self.product.id})
+        flush_pending_reviews()
+        ReviewSubmission.objects.update(processed_at=timezone.now() - timedelta(days=30))
+        ReviewSubmission.objects.create(payload={'text': 'New', 'stars': 5, 'product': self.product.id})
+        call_command('purge_review_submissions', stdout=StringIO())
+        self.assertEqual(list(ReviewSubmission.objects.values_list('status', flat=True)), [ReviewSubmission.STATUS_PENDING])
+
+
+class SlowQueryLogTests(SimpleTestCase):
+    def record(self, redact):
+        config = {**get_slow_query_settings(), 'REDACT': redact, 'EXPLAIN': False}
+        capture = SlowQueryCapture(RequestFactory().get('/api/v1/products/'), config, rate_limiter=None)
+        with self.assertLogs('product.slow_queries', 'INFO') as logs:
+            capture.record(connection, 'SELECT %s, %s', ['secret', 42], False, 250.0)
+        return json.loads(logs.records[0].getMessage())['params']
+
+    def test_params_are_redacted_only_when_configured(self):
+        self.assertEqual(self.record(redact=True), ['<redacted:6>', 42])
+        self.assertEqual(self.record(redact=False), ['secret', 42])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.override = override_settings(METRICS={'ENABLED': True, 'DIR': self.directory})
+        self.override.enable()
+        metrics.registry.config = None
+        metrics.registry.counters, metrics.registry.histograms = {}, {}
+
+    def tearDown(self):
+        self.override.disable()
+        metrics.registry.config = None
+        shutil.rmtree(self.directory)
+
+    def test_errors_returned_by_views_are_counted(self):
+        self.client.get('/api/v1/products/?fields=unknown')
+        counters, _ = metrics.collect()
+        errors = {dict(labels)['status']: value for (name, labels), value in counters.items() if name == 'api_errors_total'}
+        self.assertEqual(errors, {'400': 1})
+
+    def test_dead_process_files_are_folded(self):
+        # pid завершившегося процесса
+        process = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        dead_pid = int(process.stdout)
+        for name in (f'metrics-{dead_pid}.json', metrics.DEAD_FILE):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                json.dump({'counters': [['http_requests_total', {'status': '200'}, 2]], 'histograms': []}, f)
+        counters, _ = metrics.collect()
+        self.assertEqual(counters[('http_requests_total', (('status', '200'),))], 4)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'metrics-{dead_pid}.json')))
+        # Повторный сбор не считает перенесённые значения дважды
+        counters, _ = metrics.collect()
+        self.assertEqual(counters[('http_requests_total', (('status', '200'),))], 4)
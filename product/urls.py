@@ -1,24 +1,40 @@
 from django.urls import path
 from .views import (
-    CategoryListView, CategoryDetailView,
-    ProductListView, ProductDetailView, ProductWithReviewsListView,
-    ReviewListView, ReviewDetailView
+    CategoryListView, CategoryDetailView, CategoryStatsView,
+    ProductListView, ProductDetailView, ProductBulkUpdateView, ProductWithReviewsListView, ProductReviewListView,
+    ReviewListView, ReviewDetailView, ReviewSubmissionDetailView, SyncView, MetricsView
 )
 
 # Маршруты приложения product (REST-подобные):
 # - /categories/        GET -> список категорий с количеством товаров
 # - /categories/<id>/   GET -> одна категория
-# - /products/          GET -> список товаров
+# - /categories/<id>/stats/ GET -> число товаров, цены и рейтинг категории
+# - /products/          GET -> список товаров (?fields=id,title,price)
 # - /products/<id>/     GET -> один товар
+# - /products/bulk/     POST -> массовое изменение цены или категории (сотрудники)
 # - /products/reviews/  GET -> список товаров с отзывами и рейтингом
+# - /products/<id>/reviews/ GET -> отзывы товара (?stars=, ?cursor=, ?limit=)
 # - /reviews/           GET -> список отзывов
 # - /reviews/<id>/      GET -> один отзыв
+# - /reviews/submissions/<uuid>/ GET -> статус отзыва, принятого в режиме очереди
+# - /sync/?since=<token> GET -> изменения и удаления после токена (по номеру изменения)
+# - /events/?category=&product= SSE-лента изменений (обслуживается в shop_api/asgi.py)
+# - /metrics/          GET -> метрики Prometheus (Token METRICS['TOKEN'] или токен сотрудника)
+# Товары принимают ?include=category,reviews,rating (связи загружаются пакетно)
+# Списки категорий, товаров и отзывов принимают ?ids=1,2,3 и возвращают
+# {"results": [...], "missing": [...]} в порядке запрошенных id
 urlpatterns = [
     path('categories/', CategoryListView.as_view()),
     path('categories/<int:id>/', CategoryDetailView.as_view()),
+    path('categories/<int:id>/stats/', CategoryStatsView.as_view()),
     path('products/', ProductListView.as_view()),
     path('products/<int:id>/', ProductDetailView.as_view()),
+    path('products/bulk/', ProductBulkUpdateView.as_view()),
     path('products/reviews/', ProductWithReviewsListView.as_view()),
+    path('products/<int:id>/reviews/', ProductReviewListView.as_view()),
     path('reviews/', ReviewListView.as_view()),
     path('reviews/<int:id>/', ReviewDetailView.as_view()),
+    path('reviews/submissions/<uuid:tracking_id>/', ReviewSubmissionDetailView.as_view()),
+    path('sync/', SyncView.as_view()),
+    path('metrics/', MetricsView.as_view()),
 ]
@@ -5,9 +5,11 @@
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.http import Http404
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+import ipaddress
 import logging
 
 
@@ -117,15 +119,34 @@ def log_api_request(request, response=None, error=None):
         logger.info(f'API Request: {log_data}')
 
 
+def _is_trusted_proxy(ip):
+    """
+    Адрес входит в TRUSTED_PROXIES (отдельные адреса или сети)
+    """
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in getattr(settings, 'TRUSTED_PROXIES', []))
+
+
 def get_client_ip(request):
     """
-    Получение IP адреса клиента
+    Получение IP адреса клиента.
+
+    X-Forwarded-For учитывается, только если запрос пришёл от доверенного
+    прокси. Цепочка разбирается справа: первый адрес, который не является
+    доверенным прокси, - клиент. Левые значения задаёт сам клиент, им не верим.
     """
+    ip = request.META.get('REMOTE_ADDR')
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
+    if not x_forwarded_for or not ip or not _is_trusted_proxy(ip):
+        return ip
+    for hop in reversed([value.strip() for value in x_forwarded_for.split(',') if value.strip()]):
+        if not _is_trusted_proxy(hop):
+            return hop
+        ip = hop
     return ip
 
 
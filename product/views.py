@@ -1,14 +1,31 @@
+import hmac
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from .models import Category, Product, Review
+from django.db.models import Count
+from django.http import HttpResponse
+from . import metrics
+from .bulk import change_prices, filter_products, move_to_category
+from .cache import get_object_cache, get_object_cache_timeout, object_cache_key
+from .category_cache import get_category_cache_config, get_category_list, get_category_stats
+from .coalescing import coalesced_read
+from .includes import PRODUCT_INCLUDES, attach_product_includes
+from .ingest import is_queue_mode, submit_review
+from .models import Category, Product, Review, ReviewSubmission
+from .replica import get_replica
 from .serializers import (
     CategorySerializer, CategoryWithCountSerializer, 
     ProductSerializer, ProductWithReviewsSerializer, 
-    ReviewSerializer
+    ReviewSerializer, BulkProductUpdateSerializer
 )
+from .surrogate import (
+    SurrogateKeyMixin, category_key, product_key, product_reviews_key, review_key
+)
+from .sync import get_changes, get_sync_settings
 from .validators import validate_positive_integer_id
 
 
@@ -44,14 +61,179 @@ def validate_object_id(object_id, model_name='объект'):
         return False, {'error': f'Некорректный ID {model_name}: {str(e)}'}
 
 
+def parse_fields_param(request, serializer_class):
+    """
+    Разбор параметра ?fields= с проверкой по списку разрешённых полей
+    (порядок сохраняется, дубли убираются)
+    """
+    raw = request.query_params.get('fields')
+    if raw is None:
+        return True, {}, None
+    fields = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in serializer_class.sparse_fields]
+    if not fields or unknown:
+        return False, {
+            'error': 'Недопустимые поля в параметре fields',
+            'unknown': unknown,
+            'allowed': list(serializer_class.sparse_fields)
+        }, None
+    return True, {}, fields
+
+
+def apply_fields(queryset, serializer_class, fields):
+    """
+    Загружаем из БД только колонки, нужные для запрошенных полей
+    """
+    if fields:
+        return queryset.only(*serializer_class.get_only_fields(fields))
+    return queryset
+
+
+def parse_include_param(request, allowed):
+    """
+    Разбор параметра ?include= (связанные данные, встраиваемые в ответ;
+    дубли убираются)
+    """
+    raw = request.query_params.get('include')
+    if raw is None:
+        return True, {}, ()
+    includes = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in includes if name not in allowed]
+    if unknown:
+        return False, {
+            'error': 'Недопустимые значения в параметре include',
+            'unknown': unknown,
+            'allowed': list(allowed)
+        }, ()
+    return True, {}, tuple(includes)
+
+
+def with_include_fields(fields, includes):
+    """
+    Для встраивания связей нужны id товара и id категории
+    """
+    if not fields or not includes:
+        return fields
+    required = ['id'] + (['category'] if 'category' in includes else [])
+    return required + [name for name in fields if name not in required]
+
+
+def key_part(values):
+    """
+    Часть ключа кэша для списка полей или include. Порядок значений на
+    ответ не влияет, поэтому ключ от него тоже не зависит
+    """
+    return ','.join(sorted(values)) if values else '*'
+
+
+def include_surrogate_keys(includes):
+    """
+    Surrogate-ключи связей, встроенных через ?include= (includes из parse_include_param)
+    """
+    keys = []
+    if 'category' in includes:
+        keys.append('categories')
+    if 'reviews' in includes or 'rating' in includes:
+        keys.append('reviews')
+    return keys
+
+
+def parse_ids_param(request):
+    """
+    Разбор параметра ?ids=1,2,3 (порядок сохраняется, дубли убираются)
+    """
+    raw = request.query_params.get('ids')
+    if raw is None:
+        return True, {}, None
+    max_ids = getattr(settings, 'MAX_BATCH_IDS', 200)
+    parts = [part.strip() for part in raw.split(',') if part.strip()]
+    if not parts:
+        return False, {'error': 'Параметр ids не может быть пустым'}, None
+    if len(parts) > max_ids:
+        return False, {'error': f'Можно запросить не более {max_ids} объектов за раз'}, None
+    ids = []
+    for part in parts:
+        is_valid, error_response = validate_object_id(part)
+        if not is_valid:
+            return False, error_response, None
+        if int(part) not in ids:
+            ids.append(int(part))
+    return True, {}, ids
+
+
+def get_objects_by_ids(queryset, serializer_class, ids, fields):
+    """
+    Пакетное получение объектов одним запросом IN с учётом кэша объектов.
+    Возвращает ответ в порядке запрошенных ids и список ненайденных ids.
+    """
+    model = queryset.model
+    object_cache = get_object_cache()
+    found = {}
+    if object_cache is not None:
+        cached = object_cache.get_many([object_cache_key(model, pk) for pk in ids])
+        found = {pk: cached[object_cache_key(model, pk)] for pk in ids if object_cache_key(model, pk) in cached}
+        metrics.inc('cache_requests_total', {'cache': 'object', 'result': 'hit'}, len(found))
+        metrics.inc('cache_requests_total', {'cache': 'object', 'result': 'miss'}, len(ids) - len(found))
+    
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        queryset = queryset.filter(pk__in=missing)
+        if object_cache is None:
+            # Без кэша загружаем только нужные колонки; id нужен для сопоставления,
+            # в ответе он останется, только если его запросили
+            load_fields = ['id'] + [name for name in fields if name != 'id'] if fields else fields
+            data = serializer_class(
+                apply_fields(queryset, serializer_class, load_fields), many=True, fields=load_fields
+            ).data
+        else:
+            # В кэш кладём полное представление, поля отбираем ниже
+            data = serializer_class(queryset, many=True).data
+            object_cache.set_many(
+                {object_cache_key(model, item['id']): item for item in data},
+                get_object_cache_timeout()
+            )
+        found.update({item['id']: item for item in data})
+    
+    results = []
+    for pk in ids:
+        if pk in found:
+            item = found[pk]
+            results.append({name: item[name] for name in fields} if fields else item)
+    return {
+        'results': results,
+        'missing': [pk for pk in ids if pk not in found],
+    }
+
+
 # Category
-class CategoryListView(APIView):
+class CategoryListView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, **kwargs):
+        return ['categories']
+
     # Возвращает список всех категорий с количеством товаров
     def get(self, request):
+        is_valid, error_response, fields = parse_fields_param(request, CategoryWithCountSerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        is_valid, error_response, ids = parse_ids_param(request)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
-            categories = Category.objects.all()
-            serializer = CategoryWithCountSerializer(categories, many=True)
-            return Response(serializer.data)
+            if ids is not None:
+                # Количество товаров считаем одним запросом вместо COUNT на каждую категорию
+                categories = Category.objects.annotate(products_total=Count('products'))
+                return Response(get_objects_by_ids(categories, CategoryWithCountSerializer, ids, fields))
+            
+            # Полный список из реплики или кэша stale-while-revalidate, нужные поля отбираем здесь
+            replica = get_replica()
+            data = replica.category_list() if replica is not None else get_category_list()
+            if fields:
+                data = [{name: item[name] for name in fields} for item in data]
+            if replica is not None:
+                return replica.respond(data)
+            return Response(data)
         except Exception as e:
             return Response({
                 'error': 'Произошла ошибка при получении списка категорий',
@@ -82,7 +264,40 @@ class CategoryListView(APIView):
                 'details': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CategoryDetailView(APIView):
+# Статистика категории (кэш stale-while-revalidate)
+class CategoryStatsView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, id):
+        return [category_key(id)]
+
+    def get_surrogate_max_age(self):
+        # Рейтинг обновляется по SOFT_TTL, поэтому прокси хранит ответ не дольше
+        return get_category_cache_config()['TIMEOUT']
+
+    def get(self, request, id):
+        is_valid, error_response = validate_object_id(id, 'категории')
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            replica = get_replica()
+            stats = replica.category_stats(id) if replica is not None else None
+            if stats is not None:
+                return replica.respond(stats)
+            
+            stats = get_category_stats(id)
+            if stats is None:
+                return Response({'error': 'Категория не найдена'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(stats)
+        except Exception as e:
+            return Response({
+                'error': 'Произошла ошибка при получении статистики категории',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class CategoryDetailView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, id):
+        return [category_key(id)]
+
     # Детальная информация по одной категории
     def get(self, request, id):
         # Валидация ID
@@ -90,9 +305,19 @@ class CategoryDetailView(APIView):
         if not is_valid:
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
         
+        is_valid, error_response, fields = parse_fields_param(request, CategorySerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
-            category = Category.objects.get(id=id)
-            serializer = CategorySerializer(category)
+            # Если объекта нет в реплике (мог появиться недавно), читаем из базы
+            replica = get_replica()
+            data = replica.category_detail(id, fields) if replica is not None else None
+            if data is not None:
+                return replica.respond(data)
+            
+            category = apply_fields(Category.objects.all(), CategorySerializer, fields).get(id=id)
+            serializer = CategorySerializer(category, fields=fields)
             return Response(serializer.data)
         except Category.DoesNotExist:
             return Response({'error': 'Категория не найдена'}, status=status.HTTP_404_NOT_FOUND)
@@ -200,13 +425,49 @@ class CategoryDetailView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Product
-class ProductListView(APIView):
+class ProductListView(SurrogateKeyMixin, APIView):
+    # Разобранный ?include= текущего запроса (см. get)
+    includes = ()
+
+    def get_surrogate_keys(self, request, response, **kwargs):
+        return ['products', *include_surrogate_keys(self.includes)]
+
     # Список всех товаров
     def get(self, request):
+        is_valid, error_response, fields = parse_fields_param(request, ProductSerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        is_valid, error_response, ids = parse_ids_param(request)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        is_valid, error_response, includes = parse_include_param(request, PRODUCT_INCLUDES)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        self.includes = includes
+        fields = with_include_fields(fields, includes)
+        
         try:
-            products = Product.objects.all()
-            serializer = ProductSerializer(products, many=True)
-            return Response(serializer.data)
+            if ids is not None:
+                data = get_objects_by_ids(Product.objects.all(), ProductSerializer, ids, fields)
+                attach_product_includes(data['results'], includes)
+                return Response(data)
+            
+            # Отзывы в реплике не хранятся, только их агрегаты
+            replica = get_replica() if 'reviews' not in includes else None
+            if replica is not None:
+                return replica.respond(replica.product_list(fields, includes))
+            
+            def build():
+                products = apply_fields(Product.objects.all(), ProductSerializer, fields)
+                serializer = ProductSerializer(products, many=True, fields=fields)
+                return attach_product_includes(serializer.data, includes)
+            
+            return Response(coalesced_read(
+                f'products:{key_part(fields)}:{key_part(includes)}', build,
+                resources=self.get_surrogate_keys(request, None)
+            ))
         except Exception as e:
             return Response({
                 'error': 'Произошла ошибка при получении списка товаров',
@@ -237,7 +498,51 @@ class ProductListView(APIView):
                 'details': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class ProductDetailView(APIView):
+# Массовое изменение цен или категории товаров (только для сотрудников)
+class ProductBulkUpdateView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        is_valid, error_response = validate_request_content_type(request)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = BulkProductUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        try:
+            queryset = filter_products(**data['filter'])
+            if data['operation'] == 'category':
+                updated, skipped = move_to_category(queryset, data['category']), 0
+            else:
+                updated, skipped = change_prices(queryset, percent=data.get('percent'), amount=data.get('amount'))
+            return Response({
+                'operation': data['operation'],
+                'updated': updated,
+                # Товары, цена которых вышла бы за допустимые границы
+                'skipped': skipped,
+            })
+        except Exception as e:
+            return Response({
+                'error': 'Произошла ошибка при массовом изменении товаров',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class ProductDetailView(SurrogateKeyMixin, APIView):
+    # Разобранный ?include= текущего запроса (см. get)
+    includes = ()
+
+    def get_surrogate_keys(self, request, response, id):
+        keys = [product_key(id)]
+        if 'reviews' in self.includes or 'rating' in self.includes:
+            keys.append(product_reviews_key(id))
+        category = response.data.get('category') if isinstance(response.data, dict) else None
+        if isinstance(category, dict):
+            keys.append(category_key(category['id']))
+        return keys
+
     # Детальная информация по товару
     def get(self, request, id):
         # Валидация ID
@@ -245,10 +550,37 @@ class ProductDetailView(APIView):
         if not is_valid:
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
         
+        is_valid, error_response, fields = parse_fields_param(request, ProductSerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        is_valid, error_response, includes = parse_include_param(request, PRODUCT_INCLUDES)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        self.includes = includes
+        fields = with_include_fields(fields, includes)
+        
         try:
-            product = Product.objects.get(id=id)
-            serializer = ProductSerializer(product)
-            return Response(serializer.data)
+            replica = get_replica() if 'reviews' not in includes else None
+            data = replica.product_detail(id, fields, includes) if replica is not None else None
+            if data is not None:
+                return replica.respond(data)
+            
+            def build():
+                product = apply_fields(Product.objects.all(), ProductSerializer, fields).get(id=id)
+                data = ProductSerializer(product, fields=fields).data
+                attach_product_includes([data], includes)
+                return data
+            
+            # Значение зависит от товара и встроенных связей (см. get_surrogate_keys)
+            resources = [product_key(id)]
+            if 'category' in includes:
+                resources.append('categories')
+            if 'reviews' in includes or 'rating' in includes:
+                resources.append(product_reviews_key(id))
+            return Response(coalesced_read(
+                f'product:{id}:{key_part(fields)}:{key_part(includes)}', build, resources=resources
+            ))
         except Product.DoesNotExist:
             return Response({'error': 'Товар не найден'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -356,13 +688,18 @@ class ProductDetailView(APIView):
 
 
 # Новый view для списка товаров с отзывами и рейтингом
-class ProductWithReviewsListView(APIView):
+class ProductWithReviewsListView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, **kwargs):
+        return ['products', 'reviews']
+
     # Возвращает список всех товаров с их отзывами и средним рейтингом
     def get(self, request):
         try:
-            products = Product.objects.all()
-            serializer = ProductWithReviewsSerializer(products, many=True)
-            return Response(serializer.data)
+            def build():
+                products = Product.objects.all()
+                return ProductWithReviewsSerializer(products, many=True).data
+            
+            return Response(coalesced_read('products-with-reviews', build, resources=['products', 'reviews']))
         except Exception as e:
             return Response({
                 'error': 'Произошла ошибка при получении товаров с отзывами',
@@ -370,14 +707,91 @@ class ProductWithReviewsListView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Отзывы одного товара с keyset-пагинацией (новые сначала)
+class ProductReviewListView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, id):
+        return [product_reviews_key(id)]
+
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, id):
+        # Валидация ID
+        is_valid, error_response = validate_object_id(id, 'товара')
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        is_valid, error_response, fields = parse_fields_param(request, ReviewSerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        params = {}
+        for name in ('cursor', 'limit', 'stars'):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            is_valid, error_response = validate_object_id(value, name)
+            if not is_valid:
+                return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+            params[name] = int(value)
+        
+        if 'stars' in params and params['stars'] > 5:
+            return Response({'error': 'Рейтинг должен быть от 1 до 5 звёзд'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(params.get('limit', self.default_limit), self.max_limit)
+        
+        try:
+            # product_id + id < cursor обслуживает индекс (product, -id),
+            # с фильтром по рейтингу - индекс (product, stars, id)
+            reviews = Review.objects.filter(product_id=id)
+            if 'stars' in params:
+                reviews = reviews.filter(stars=params['stars'])
+            if 'cursor' in params:
+                reviews = reviews.filter(id__lt=params['cursor'])
+            # id для курсора загружается всегда (get_only_fields), в ответ попадает только по запросу
+            page = list(apply_fields(reviews, ReviewSerializer, fields).order_by('-id')[:limit + 1])
+            
+            # Существование товара проверяем только если первая страница пустая
+            if not page and 'cursor' not in params and not Product.objects.filter(id=id).exists():
+                return Response({'error': 'Товар не найден'}, status=status.HTTP_404_NOT_FOUND)
+            
+            has_more = len(page) > limit
+            page = page[:limit]
+            serializer = ReviewSerializer(page, many=True, fields=fields)
+            return Response({
+                'results': serializer.data,
+                'next_cursor': page[-1].id if has_more else None,
+            })
+        except Exception as e:
+            return Response({
+                'error': 'Произошла ошибка при получении отзывов товара',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # Review
-class ReviewListView(APIView):
+class ReviewListView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, **kwargs):
+        return ['reviews']
+
     # Список всех отзывов
     def get(self, request):
+        is_valid, error_response, fields = parse_fields_param(request, ReviewSerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
+        is_valid, error_response, ids = parse_ids_param(request)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
-            reviews = Review.objects.all()
-            serializer = ReviewSerializer(reviews, many=True)
-            return Response(serializer.data)
+            if ids is not None:
+                return Response(get_objects_by_ids(Review.objects.all(), ReviewSerializer, ids, fields))
+            
+            def build():
+                reviews = apply_fields(Review.objects.all(), ReviewSerializer, fields)
+                return ReviewSerializer(reviews, many=True, fields=fields).data
+            
+            return Response(coalesced_read(f'reviews:{key_part(fields)}', build, resources=['reviews']))
         except Exception as e:
             return Response({
                 'error': 'Произошла ошибка при получении списка отзывов',
@@ -395,6 +809,9 @@ class ReviewListView(APIView):
         if not is_valid:
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
         
+        if is_queue_mode():
+            return self.post_to_queue(request)
+        
         try:
             with transaction.atomic():
                 serializer = ReviewSerializer(data=request.data)
@@ -408,7 +825,45 @@ class ReviewListView(APIView):
                 'details': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class ReviewDetailView(APIView):
+    # Режим очереди: проверяем данные, сохраняем заявку и отвечаем 202
+    def post_to_queue(self, request):
+        serializer = ReviewSerializer(data=request.data, context={'defer_duplicate_check': True})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            submission = submit_review(serializer.validated_data)
+            return Response({
+                'tracking_id': str(submission.tracking_id),
+                'status': submission.status,
+                'status_url': f'/api/v1/reviews/submissions/{submission.tracking_id}/'
+            }, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            return Response({
+                'error': 'Произошла ошибка при приёме отзыва',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Статус отзыва, принятого в режиме очереди
+class ReviewSubmissionDetailView(SurrogateKeyMixin, APIView):
+    def get(self, request, tracking_id):
+        try:
+            submission = ReviewSubmission.objects.get(tracking_id=tracking_id)
+        except ReviewSubmission.DoesNotExist:
+            return Response({'error': 'Заявка на отзыв не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'tracking_id': str(submission.tracking_id),
+            'status': submission.status,
+            'review': submission.review_id,
+            'error': submission.error or None,
+        })
+
+class ReviewDetailView(SurrogateKeyMixin, APIView):
+    def get_surrogate_keys(self, request, response, id):
+        return [review_key(id)]
+
     # Детальный отзыв по id
     def get(self, request, id):
         # Валидация ID
@@ -416,9 +871,13 @@ class ReviewDetailView(APIView):
         if not is_valid:
             return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
         
+        is_valid, error_response, fields = parse_fields_param(request, ReviewSerializer)
+        if not is_valid:
+            return Response(error_response, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
-            review = Review.objects.get(id=id)
-            serializer = ReviewSerializer(review)
+            review = apply_fields(Review.objects.all(), ReviewSerializer, fields).get(id=id)
+            serializer = ReviewSerializer(review, fields=fields)
             return Response(serializer.data)
         except Review.DoesNotExist:
             return Response({'error': 'Отзыв не найден'}, status=status.HTTP_404_NOT_FOUND)
@@ -518,3 +977,50 @@ class ReviewDetailView(APIView):
                 'details': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+
+# Изменения каталога после токена (для зеркал каталога)
+class SyncView(SurrogateKeyMixin, APIView):
+    def get(self, request):
+        config = get_sync_settings()
+        try:
+            since = int(request.GET.get('since', '0'))
+            limit = int(request.GET.get('limit', config['PAGE_SIZE']))
+        except ValueError:
+            return Response({'error': 'since и limit должны быть целыми числами'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or not 1 <= limit <= config['MAX_PAGE_SIZE']:
+            return Response({
+                'error': f'since не может быть отрицательным, limit должен быть от 1 до {config["MAX_PAGE_SIZE"]}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            return Response(get_changes(since, limit))
+        except Exception as e:
+            return Response({
+                'error': 'Произошла ошибка при получении изменений',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Метрики в формате Prometheus (агрегированы по всем процессам)
+class MetricsView(SurrogateKeyMixin, APIView):
+    def has_access(self, request):
+        # Prometheus передаёт заранее заданный секрет: Authorization: Token <METRICS['TOKEN']>
+        token = metrics.get_metrics_settings()['TOKEN']
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if token and len(auth) == 2 and auth[0].lower() == 'token':
+            return hmac.compare_digest(auth[1], token)
+        # Либо подписанный токен сотрудника
+        return bool(getattr(request.user, 'is_staff', False))
+
+    def get(self, request):
+        if not self.has_access(request):
+            return Response({'error': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        except Exception as e:
+            return Response({
+                'error': 'Ошибка при получении метрик',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после настройки Django: модуль использует модели
+from product.events import event_stream_app, get_event_stream_settings  # noqa: E402
+from product.replica import warm_up  # noqa: E402
+
+# Загрузка реплики каталога в фоне, если она включена (CATALOG_REPLICA)
+warm_up()
+
+
+async def application(scope, receive, send):
+    """
+    Лента изменений (SSE) обслуживается напрямую, остальное - Django
+    """
+    config = get_event_stream_settings()
+    if scope['type'] == 'http' and config['ENABLED'] and scope['path'] == config['PATH']:
+        await event_stream_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
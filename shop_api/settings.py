@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dotenv
 
 # Загружаем переменные окружения из .env
@@ -56,19 +57,41 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    
-    # Кастомные middleware для валидации API
-    'product.middleware.RequestValidationMiddleware',
-    'product.middleware.SecurityHeadersMiddleware',
-    'product.middleware.RateLimitMiddleware',
+    # Дальше цепочка выбирается по префиксу пути (MIDDLEWARE_PROFILES)
+    'product.middleware.PathScopedMiddleware',
 ]
 
+# Наборы middleware по префиксу пути (используется первый подходящий префикс).
+# Stateless API не использует сессии, CSRF и сообщения, поэтому для /api/v1/
+# подключаются только кастомные middleware; админка получает полный набор.
+MIDDLEWARE_PROFILES = [
+    ('/api/v1/', [
+        # Метрики (время ответа, время БД) — снаружи, чтобы учитывать и отказы по лимиту
+        'product.metrics.MetricsMiddleware',
+        # Сжатие ответов API должно идти раньше остальных, чтобы обработать готовое тело
+        'product.middleware.CompressionMiddleware',
+        # Журнал медленных SQL-запросов (logs/slow_queries.log)
+        'product.slow_queries.SlowQueryLogMiddleware',
+        
+        # Кастомные middleware для валидации API
+        'product.middleware.RequestValidationMiddleware',
+        'product.middleware.SecurityHeadersMiddleware',
+        'product.middleware.RateLimitMiddleware',
+    ]),
+    ('/', [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ]),
+]
+
+# Проверки админки ищут сессии, аутентификацию и сообщения в MIDDLEWARE,
+# а они подключены через MIDDLEWARE_PROFILES
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'shop_api.urls'
 
 TEMPLATES = [
@@ -155,15 +178,227 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
+    # Подписанные токены проверяются без обращения к БД и без хэширования пароля
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.SignedTokenAuthentication',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'EXCEPTION_HANDLER': 'product.utils.custom_exception_handler',
 }
 
+# Время жизни кода подтверждения email (секунды)
+CONFIRMATION_CODE_TTL = int(os.getenv('CONFIRMATION_CODE_TTL', '86400'))
+# Повторная отправка кода (/api/v1/users/confirm/resend/) не чаще, чем раз в столько секунд
+CONFIRMATION_RESEND_INTERVAL = 60
+
+# Прокси (адреса или сети), которым доверяем X-Forwarded-For. Пусто - IP клиента берётся из REMOTE_ADDR
+TRUSTED_PROXIES = [value.strip() for value in os.getenv('TRUSTED_PROXIES', '').split(',') if value.strip()]
+
+# Задержки после неудачных попыток входа (по email и по IP)
+LOGIN_THROTTLE = {
+    'FREE_ATTEMPTS': 5,
+    'BASE_DELAY': 1,
+    'MAX_DELAY': 15 * 60,
+    'WINDOW': 60 * 60,
+    'CACHE': 'security',
+}
+
+# Отправка почты (письма отправляет команда process_outbox)
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@shop.local')
+
+# Повторы отправки сообщений outbox
+OUTBOX = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 8,
+    'BASE_DELAY': 5,
+    'RETENTION': 7 * 24 * 60 * 60,  # отправленные и неудачные сообщения удаляет purge_outbox
+}
+
+# Время жизни токенов API (секунды)
+API_TOKENS = {
+    'ACCESS_TTL': int(os.getenv('API_ACCESS_TOKEN_TTL', '900')),
+    'REFRESH_TTL': int(os.getenv('API_REFRESH_TOKEN_TTL', '604800')),
+    'CACHE': 'security',
+}
+
+# Кэш. Версии и блокировки coalescing-кэша должны быть общими для всех воркеров,
+# поэтому в продакшене задаём REDIS_URL
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Отозванные токены (API_TOKENS) и блокировки входа (LOGIN_THROTTLE) - в отдельном
+# кэше, который не должен вытеснять ключи: вытесненная запись молча снимает отзыв
+# refresh-токена или блокировку. В продакшене это Redis с maxmemory-policy noeviction
+# (REDIS_SECURITY_URL, по умолчанию REDIS_URL - тогда политика нужна всему инстансу)
+if os.getenv('REDIS_URL'):
+    CACHES['security'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_SECURITY_URL', os.getenv('REDIS_URL')),
+    }
+else:
+    CACHES['security'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'security',
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    }
+
+# Сжатые тела ответов (API_COMPRESSION) - в отдельном кэше процесса, чтобы
+# многомегабайтные значения не вытесняли ключи из default. Ключ - хэш тела,
+# поэтому общий кэш и сброс при изменениях не нужны
+CACHES['compression'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'compression',
+    'OPTIONS': {'MAX_ENTRIES': 200},
+}
+
+# Кэш объектов каталога для пакетных запросов ?ids= (имя кэша из CACHES, пусто - выключен)
+OBJECT_CACHE = os.getenv('OBJECT_CACHE') or None
+OBJECT_CACHE_TIMEOUT = 300
+# Максимальное количество id в одном пакетном запросе
+MAX_BATCH_IDS = 200
+
+# Объединение одновременных пересчётов популярных ответов (single-flight).
+# STALE_TIMEOUT > 0 включает stale-while-revalidate. Версии и блокировки должны
+# быть общими для всех воркеров, поэтому по умолчанию включено только с REDIS_URL
+COALESCING = {
+    'ENABLED': os.getenv('COALESCING', 'True' if os.getenv('REDIS_URL') else 'False') == 'True',
+    'TIMEOUT': 30,
+    'STALE_TIMEOUT': 0,
+    'LOCK_TIMEOUT': 10,
+}
+
+# Список категорий и статистика категорий: до SOFT_TTL значение свежее, до HARD_TTL
+# отдаётся устаревшее с фоновым пересчётом. Записи в Category/Product обновляют сразу
+CATEGORY_CACHE = {
+    'SOFT_TTL': int(os.getenv('CATEGORY_CACHE_SOFT_TTL', '60')),
+    'HARD_TTL': int(os.getenv('CATEGORY_CACHE_HARD_TTL', '3600')),
+}
+
+# Surrogate-ключи для кэширующего прокси: ответы каталога хранятся в прокси S_MAXAGE
+# секунд, изменения моделей сбрасывают их по ключам пачками через PURGER. Неудачный
+# сброс повторяется с задержкой до RETRY_ATTEMPTS раз. Кэши приложения должны быть
+# общими (REDIS_URL), иначе прокси может перечитать устаревший ответ другого воркера;
+# с CATALOG_REPLICA задайте REPURGE_AFTER не меньше GAP_TIMEOUT + POLL_INTERVAL реплики.
+# Для локальной проверки: python manage.py purge_stub и
+# SURROGATE_PURGER=product.surrogate.HTTPPurger SURROGATE_PURGE_URL=http://127.0.0.1:8099/purge
+SURROGATE_KEYS = {
+    'ENABLED': os.getenv('SURROGATE_KEYS', 'True') == 'True',
+    'MAX_AGE': 60,
+    'S_MAXAGE': int(os.getenv('SURROGATE_S_MAXAGE', '300')),
+    'PURGER': os.getenv('SURROGATE_PURGER', 'product.surrogate.NullPurger'),
+    'PURGE_URL': os.getenv('SURROGATE_PURGE_URL', ''),
+    'PURGE_METHOD': 'POST',
+    'PURGE_HEADERS': {},
+    'BATCH_SIZE': 256,
+    'FLUSH_INTERVAL': 0.5,
+    'RETRY_ATTEMPTS': 8,
+    'RETRY_BACKOFF': 1,
+    'RETRY_MAX_DELAY': 60,
+    'REPURGE_AFTER': float(os.getenv('SURROGATE_REPURGE_AFTER', '0')),
+}
+
+# Инкрементальная синхронизация (/api/v1/sync/): размер страницы
+SYNC = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 5000,
+}
+
+# Лента изменений товаров и отзывов (SSE, только при запуске через ASGI: shop_api/asgi.py)
+EVENT_STREAM = {
+    'ENABLED': os.getenv('EVENT_STREAM', 'True') == 'True',
+    'PATH': '/api/v1/events/',
+    'BUFFER_SIZE': 1000,
+    'POLL_INTERVAL': 0.5,
+    'HEARTBEAT': 15,
+    'GAP_TIMEOUT': 5,
+    'REPLAY_LIMIT': 1000,
+}
+
+# Read-only реплика каталога в памяти каждого процесса (product/replica.py):
+# GET списков и карточек категорий и товаров без обращения к базе
+CATALOG_REPLICA = {
+    'ENABLED': os.getenv('CATALOG_REPLICA', 'False') == 'True',
+    'POLL_INTERVAL': 0.5,
+    'BATCH_SIZE': 1000,
+    'GAP_TIMEOUT': 5,
+    'MAX_LAG': 30,
+}
+
+# Приём отзывов: 'sync' - запись сразу, 'queue' - ответ 202 и пакетная запись командой flush_reviews
+REVIEW_INGEST_MODE = os.getenv('REVIEW_INGEST_MODE', 'sync')
+# Сколько хранить обработанные заявки (статус по tracking_id), удаляет purge_review_submissions
+REVIEW_SUBMISSION_RETENTION = 7 * 24 * 60 * 60
+
+# Сколько последних отзывов встраивать в ответ при ?include=reviews
+INCLUDE_REVIEWS_LIMIT = 5
+
 # Настройки валидации данных
 DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB максимальный размер запроса
 FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB максимальный размер файла
 
+# Сжатие ответов API (brotli и zstandard подключаются, если установлены)
+API_COMPRESSION = {
+    'MIN_SIZE': int(os.getenv('API_COMPRESSION_MIN_SIZE', '1024')),
+    'GZIP_LEVEL': int(os.getenv('API_COMPRESSION_GZIP_LEVEL', '6')),
+    'BROTLI_QUALITY': int(os.getenv('API_COMPRESSION_BROTLI_QUALITY', '5')),
+    'ZSTD_LEVEL': int(os.getenv('API_COMPRESSION_ZSTD_LEVEL', '3')),
+    'CACHE': 'compression',
+    'CACHE_TIMEOUT': 300,
+}
+
+# Ограничение частоты запросов к API (RateLimitMiddleware).
+# MODE = 'sketch' - приблизительный подсчёт с фиксированной памятью: оценка
+# завышается не более чем на EPSILON * (запросов за окно) с вероятностью 1 - DELTA
+RATE_LIMIT = {
+    'MODE': os.getenv('RATE_LIMIT_MODE', 'exact'),
+    'WINDOW': 60,
+    'MAX_REQUESTS': 100,
+    'EPSILON': 1e-5,
+    'DELTA': 0.01,
+}
+
+# Журнал медленных SQL-запросов API с планами выполнения
+SLOW_QUERY_LOG = {
+    'ENABLED': os.getenv('SLOW_QUERY_LOG', 'True') == 'True',
+    'THRESHOLD_MS': int(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200')),
+    'MAX_PER_MINUTE': 30,
+    'EXPLAIN': True,
+    'REDACT': True,
+}
+
+# Оценка количества строк в пагинации админки: выше THRESHOLD вместо
+# COUNT(*) берётся оценка планировщика (Postgres) или закэшированное значение
+ESTIMATED_COUNT = {
+    'THRESHOLD': int(os.getenv('ESTIMATED_COUNT_THRESHOLD', '100000')),
+    'CACHE_TIMEOUT': 300,
+}
+
+# Метрики Prometheus: каждый процесс пишет свой файл в DIR, /api/v1/metrics/ их суммирует
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True') == 'True',
+    'DIR': os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'shop_api_metrics')),
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),
+}
+
 # Настройки безопасности
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -182,6 +417,10 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'message_only': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'file': {
@@ -195,6 +434,13 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'simple',
         },
+        # Одна JSON-строка на медленный запрос
+        'slow_queries': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'logs/slow_queries.log',
+            'formatter': 'message_only',
+        },
     },
     'loggers': {
         'product': {
@@ -207,5 +453,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'product.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
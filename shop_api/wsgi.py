@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop_api.settings')
 
 application = get_wsgi_application()
+
+# Загрузка реплики каталога в фоне, если она включена (CATALOG_REPLICA)
+from product.replica import warm_up  # noqa: E402
+
+warm_up()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, ConfirmationCode
+from .models import User, ConfirmationCode, OutboxMessage
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -12,3 +12,9 @@ class ConfirmationCodeAdmin(admin.ModelAdmin):
     list_display = ('user', 'code', 'created_at', 'is_used')
     search_fields = ('user__email', 'code')
     list_filter = ('is_used',)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'available_at', 'sent_at')
+    list_filter = ('status', 'kind')
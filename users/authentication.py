@@ -0,0 +1,57 @@
+"""
+Аутентификация API по подписанным токенам (Authorization: Bearer <token>)
+"""
+
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.permissions import AllowAny
+from .tokens import ACCESS, InvalidToken, verify_token
+
+
+class TokenUser:
+    """
+    Пользователь, восстановленный из токена без запроса к БД
+    """
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, payload):
+        self.id = self.pk = payload['uid']
+        self.is_staff = payload.get('stf', False)
+        self.token = payload
+
+    def __str__(self):
+        return f'TokenUser {self.id}'
+
+
+def is_public_view(request):
+    """
+    Представление доступно всем (только AllowAny): неверный токен там не мешает
+    """
+    view = (getattr(request, 'parser_context', None) or {}).get('view')
+    return view is not None and all(isinstance(permission, AllowAny) for permission in view.get_permissions())
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            if is_public_view(request):
+                return None
+            raise exceptions.AuthenticationFailed('Некорректный заголовок Authorization')
+        try:
+            payload = verify_token(auth[1].decode(), ACCESS)
+        except (InvalidToken, UnicodeError) as e:
+            # Публичный каталог отдаём и с просроченным или битым токеном, как анониму
+            if is_public_view(request):
+                return None
+            raise exceptions.AuthenticationFailed(str(e))
+        return TokenUser(payload), payload
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
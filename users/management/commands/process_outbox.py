@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from users.outbox import get_outbox_settings, process_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Отправляет сообщения из outbox пачками с повторами. '
+        'Для локальной проверки можно поднять SMTP-заглушку '
+        '(python -m aiosmtpd -n -l localhost:1025) и запустить с EMAIL_HOST=localhost EMAIL_PORT=1025'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Размер пачки')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Пауза, когда очередь пуста (секунды)')
+
+    def handle(self, *args, **options):
+        config = get_outbox_settings()
+        if options['batch_size']:
+            config['BATCH_SIZE'] = options['batch_size']
+        
+        while True:
+            sent, failed = process_batch(config)
+            if sent or failed:
+                self.stdout.write(f'Отправлено: {sent}, ошибок: {failed}')
+            if not options['loop']:
+                break
+            # Пока пачки полные, продолжаем без паузы
+            if sent + failed < config['BATCH_SIZE']:
+                time.sleep(options['interval'])
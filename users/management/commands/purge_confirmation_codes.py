@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from users.models import ConfirmationCode
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные и использованные коды подтверждения небольшими пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько строк удалять за один DELETE')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Пауза между пачками (секунды), чтобы не нагружать БД')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        for queryset in ConfirmationCode.objects.stale():
+            total += self.purge(queryset, batch_size, options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено кодов подтверждения: {total}'))
+
+    def purge(self, queryset, batch_size, sleep):
+        total = 0
+        while True:
+            # Каждая пачка - отдельный короткий DELETE по первичному ключу,
+            # поэтому блокировки не держатся долго
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted, _ = ConfirmationCode.objects.filter(pk__in=ids).delete()
+            total += deleted
+            if len(ids) < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+        return total
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_confirmationcode_options_alter_user_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='confirmationcode',
+            name='code',
+            field=models.CharField(max_length=6, verbose_name='Код подтверждения'),
+        ),
+        migrations.AlterField(
+            model_name='confirmationcode',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='confirmationcode',
+            index=models.Index(condition=models.Q(('is_used', True)), fields=['created_at'], name='users_confcode_used_idx'),
+        ),
+    ]
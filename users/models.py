@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
+from django.conf import settings
+from django.db import connections, models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-import random
+from datetime import timedelta
+import secrets
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -39,15 +41,110 @@ class User(AbstractBaseUser, PermissionsMixin):
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 
+def get_confirmation_code_ttl():
+    """
+    Время жизни кода подтверждения
+    """
+    return timedelta(seconds=getattr(settings, 'CONFIRMATION_CODE_TTL', 24 * 60 * 60))
+
+
+def _supports_update_returning(connection):
+    """
+    UPDATE ... RETURNING: PostgreSQL и SQLite 3.35+. Отдельного флага у Django нет,
+    у SQLite поддержка RETURNING появилась вместе с can_return_rows_from_bulk_insert
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.features.can_return_rows_from_bulk_insert
+
+
+class ConfirmationCodeManager(models.Manager):
+    def expired(self):
+        """
+        Просроченные коды (индекс по created_at)
+        """
+        return self.filter(created_at__lt=timezone.now() - get_confirmation_code_ttl())
+
+    def used(self):
+        """
+        Использованные коды (частичный индекс users_confcode_used_idx)
+        """
+        return self.filter(is_used=True)
+
+    def stale(self):
+        """
+        Наборы кодов, которые удаляет purge_confirmation_codes. Условия
+        проверяются отдельно, чтобы каждая пачка читалась по своему индексу
+        """
+        return [self.expired(), self.used()]
+
+    def reissue(self, user):
+        """
+        Новый код вместо просроченного или удалённого (повторная отправка письма)
+        """
+        code = '{:06d}'.format(secrets.randbelow(1000000))
+        conf, _ = self.update_or_create(
+            user=user, defaults={'code': code, 'is_used': False, 'created_at': timezone.now()}
+        )
+        return conf
+
+    def confirm(self, email, code):
+        """
+        Атомарно помечает код использованным и активирует пользователя.
+
+        Код гасится одним условным UPDATE ... WHERE is_used = false RETURNING,
+        поэтому из двух одновременных запросов с одним кодом успешен только один.
+        Возвращает id пользователя или None, если код неверный, просрочен или уже использован.
+        """
+        with transaction.atomic(using=self.db):
+            user_id = self._consume(email, code)
+            if user_id is not None:
+                User.objects.using(self.db).filter(pk=user_id).update(is_active=True)
+        return user_id
+
+    def _consume(self, email, code):
+        cutoff = timezone.now() - get_confirmation_code_ttl()
+        connection = connections[self.db]
+        if _supports_update_returning(connection):
+            qn = connection.ops.quote_name
+            sql = (
+                f'UPDATE {qn(self.model._meta.db_table)} SET {qn("is_used")} = %s '
+                f'WHERE {qn("code")} = %s AND {qn("is_used")} = %s AND {qn("created_at")} >= %s AND {qn("user_id")} = '
+                f'(SELECT {qn("id")} FROM {qn(User._meta.db_table)} WHERE UPPER({qn("email")}) = UPPER(%s)) '
+                f'RETURNING {qn("user_id")}'
+            )
+            with connection.cursor() as cursor:
+                created_at = connection.ops.adapt_datetimefield_value(cutoff)
+                cursor.execute(sql, [True, code, False, created_at, email])
+                row = cursor.fetchone()
+            return row[0] if row else None
+        
+        # Для БД без UPDATE ... RETURNING блокируем строку кода до конца транзакции
+        conf = (
+            self.select_for_update()
+            .filter(user__email__iexact=email, code=code, is_used=False, created_at__gte=cutoff)
+            .only('id', 'user_id')
+            .first()
+        )
+        if conf is None:
+            return None
+        self.filter(pk=conf.pk).update(is_used=True)
+        return conf.user_id
+
+
 class ConfirmationCode(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='confirmation_code', verbose_name='Пользователь')
-    code = models.CharField('Код подтверждения', max_length=6, unique=True)
-    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    # Код уникален в рамках пользователя (OneToOne), глобальная уникальность не нужна:
+    # генерация не зависит от размера таблицы и не даёт IntegrityError
+    code = models.CharField('Код подтверждения', max_length=6)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True, db_index=True)
     is_used = models.BooleanField('Использован', default=False)
 
+    objects = ConfirmationCodeManager()
+
     def save(self, *args, **kwargs):
         if not self.code:
-            self.code = '{:06d}'.format(random.randint(0, 999999))
+            self.code = '{:06d}'.format(secrets.randbelow(1000000))
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -56,3 +153,40 @@ class ConfirmationCode(models.Model):
     class Meta:
         verbose_name = 'Код подтверждения'
         verbose_name_plural = 'Коды подтверждения'
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(is_used=True), name='users_confcode_used_idx'),
+        ]
+
+
+class OutboxMessage(models.Model):
+    """
+    Побочные действия (письма и т.п.), записанные в той же транзакции,
+    что и основное изменение. Отправляет их команда process_outbox.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+    )
+
+    kind = models.CharField('Тип', max_length=50)
+    payload = models.JSONField('Данные', default=dict)
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    available_at = models.DateTimeField('Доступно с', default=timezone.now)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    sent_at = models.DateTimeField('Дата отправки', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Сообщение outbox'
+        verbose_name_plural = 'Outbox'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='users_outbox_pending_idx'),
+        ]
@@ -0,0 +1,133 @@
+"""
+Transactional outbox: запись побочных действий в БД и их отправка воркером
+
+Регистрация только вставляет строку OutboxMessage в своей транзакции,
+а письма отправляет команда process_outbox пачками с повторами.
+В payload лежит код подтверждения, поэтому после отправки (или последней
+неудачной попытки) он очищается, а сами строки через RETENTION удаляет
+команда purge_outbox.
+"""
+
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 50,
+    'LEASE': 60,  # на сколько секунд захваченные строки скрыты от других воркеров
+    'MAX_ATTEMPTS': 8,
+    'BASE_DELAY': 5,  # задержка перед повтором (секунды), удваивается с каждой попыткой
+    'MAX_DELAY': 60 * 60,
+    'RETENTION': 7 * 24 * 60 * 60,  # сколько хранить отправленные и неудачные сообщения
+}
+
+HANDLERS = {}
+
+
+def get_outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'OUTBOX', {})}
+
+
+def handler(kind):
+    """
+    Регистрация обработчика для типа сообщения
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload):
+    """
+    Записывает сообщение в outbox (вызывать внутри транзакции основного изменения)
+    """
+    return OutboxMessage.objects.create(kind=kind, payload=payload)
+
+
+@handler('confirmation_email')
+def send_confirmation_email(payload):
+    send_mail(
+        'Подтверждение регистрации',
+        f'Ваш код подтверждения: {payload["code"]}',
+        settings.DEFAULT_FROM_EMAIL,
+        [payload['email']],
+    )
+
+
+def claim_batch(batch_size, lease):
+    """
+    Захватывает пачку готовых к отправке сообщений.
+
+    Строки блокируются с SKIP LOCKED и сдвигаются на время аренды, поэтому
+    параллельные воркеры не получают одни и те же сообщения.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.STATUS_PENDING, available_at__lte=now)
+            .order_by('available_at')[:batch_size]
+        )
+        if messages:
+            OutboxMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+                available_at=now + timedelta(seconds=lease)
+            )
+    return messages
+
+
+def dispatch(message, config):
+    """
+    Отправка одного сообщения; при ошибке планируется повтор с экспоненциальной задержкой
+    """
+    message.attempts += 1
+    try:
+        HANDLERS[message.kind](message.payload)
+    except Exception as e:
+        message.last_error = str(e) or e.__class__.__name__
+        if message.attempts >= config['MAX_ATTEMPTS']:
+            message.status = OutboxMessage.STATUS_FAILED
+            message.payload = {}
+            logger.error(f'Outbox message {message.pk} failed: {message.last_error}')
+        else:
+            delay = min(config['BASE_DELAY'] * 2 ** (message.attempts - 1), config['MAX_DELAY'])
+            message.available_at = timezone.now() + timedelta(seconds=delay)
+        message.save(update_fields=['attempts', 'status', 'available_at', 'last_error', 'payload'])
+        return False
+    message.status = OutboxMessage.STATUS_SENT
+    message.sent_at = timezone.now()
+    message.payload = {}
+    message.save(update_fields=['attempts', 'status', 'sent_at', 'payload'])
+    return True
+
+
+def process_batch(config=None):
+    """
+    Захват и отправка одной пачки. Возвращает (отправлено, ошибок)
+    """
+    config = config or get_outbox_settings()
+    sent = failed = 0
+    for message in claim_batch(config['BATCH_SIZE'], config['LEASE']):
+        if dispatch(message, config):
+            sent += 1
+        else:
+            failed += 1
+    return sent, failed
+
+
+def finished(config=None):
+    """
+    Отправленные и окончательно неудачные сообщения старше RETENTION
+    """
+    config = config or get_outbox_settings()
+    cutoff = timezone.now() - timedelta(seconds=config['RETENTION'])
+    return OutboxMessage.objects.filter(
+        status__in=(OutboxMessage.STATUS_SENT, OutboxMessage.STATUS_FAILED), created_at__lt=cutoff
+    )
@@ -1,6 +1,11 @@
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 from django.contrib.auth import authenticate
+from django.db import transaction
+from product.utils import get_client_ip
 from .models import User, ConfirmationCode
+from .outbox import enqueue
+from .throttling import LoginThrottle
+from .tokens import REFRESH, InvalidToken, verify_token
 from django.utils.translation import gettext_lazy as _
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -10,13 +15,16 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ('email', 'username', 'password')
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            email=validated_data['email'],
-            username=validated_data.get('username', ''),
-            password=validated_data['password'],
-            is_active=False
-        )
-        ConfirmationCode.objects.create(user=user)
+        # Письмо не отправляется здесь: оно записывается в outbox в той же транзакции
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email=validated_data['email'],
+                username=validated_data.get('username', ''),
+                password=validated_data['password'],
+                is_active=False
+            )
+            conf = ConfirmationCode.objects.create(user=user)
+            enqueue('confirmation_email', {'email': user.email, 'code': conf.code})
         return user
 
     def validate_email(self, value):
@@ -29,27 +37,43 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
     def validate(self, data):
-        user = authenticate(email=data['email'], password=data['password'])
+        request = self.context.get('request')
+        throttle = LoginThrottle(data['email'], get_client_ip(request) if request else None)
+        # Проверяем блокировку до authenticate(), чтобы не тратить время на хэширование пароля
+        wait = throttle.wait()
+        if wait:
+            raise exceptions.Throttled(wait=wait)
+        user = authenticate(request, email=data['email'], password=data['password'])
         if not user:
+            throttle.register_failure()
             raise serializers.ValidationError('Неверный email или пароль')
+        throttle.reset()
         if not user.is_active:
             raise serializers.ValidationError('Пользователь не активирован')
         data['user'] = user
         return data
 
 class ConfirmSerializer(serializers.Serializer):
+    # Проверка кода и активация выполняются атомарно в ConfirmationCode.objects.confirm
     email = serializers.EmailField()
     code = serializers.CharField(max_length=6)
 
+
+class TokenRefreshSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
     def validate(self, data):
         try:
-            user = User.objects.get(email__iexact=data['email'])
-        except User.DoesNotExist:
-            raise serializers.ValidationError('Пользователь не найден')
-        try:
-            conf = ConfirmationCode.objects.get(user=user, code=data['code'], is_used=False)
-        except ConfirmationCode.DoesNotExist:
-            raise serializers.ValidationError('Неверный или уже использованный код')
+            payload = verify_token(data['refresh'], REFRESH)
+        except InvalidToken as e:
+            raise serializers.ValidationError(str(e))
+        # Refresh выполняется редко, поэтому здесь проверяем, что пользователь всё ещё активен
+        user = User.objects.filter(pk=payload['uid'], is_active=True).first()
+        if not user:
+            raise serializers.ValidationError('Пользователь не найден или не активирован')
+        data['payload'] = payload
         data['user'] = user
-        data['conf'] = conf
         return data
+
+class ResendConfirmationSerializer(serializers.Serializer):
+    email = serializers.EmailField()
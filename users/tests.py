@@ -0,0 +1,120 @@
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .models import ConfirmationCode, OutboxMessage
+from .outbox import enqueue, process_batch
+from .tokens import REFRESH, issue_tokens, revoke_token, verify_token
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        caches['security'].clear()
+        self.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='secret123', is_active=True)
+
+    def test_refresh_token_is_single_use(self):
+        refresh = issue_tokens(self.user)['refresh']
+        first = self.client.post('/api/v1/users/token/refresh/', {'refresh': refresh}, content_type='application/json')
+        second = self.client.post('/api/v1/users/token/refresh/', {'refresh': refresh}, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 400)
+
+    def test_revoke_is_atomic(self):
+        # Второй из параллельных refresh уже прошёл проверку, но отозвать токен не сможет
+        payload = verify_token(issue_tokens(self.user)['refresh'], REFRESH)
+        self.assertTrue(revoke_token(payload))
+        self.assertFalse(revoke_token(payload))
+        # Список отозванных не зависит от вытеснения и очистки кэша default
+        cache.clear()
+        self.assertFalse(revoke_token(payload))
+
+    def test_invalid_token_is_ignored_on_public_catalog(self):
+        response = self.client.get('/api/v1/categories/', HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(LOGIN_THROTTLE={'FREE_ATTEMPTS': 2, 'BASE_DELAY': 30, 'MAX_DELAY': 60, 'WINDOW': 600, 'CACHE': 'security'})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        caches['security'].clear()
+        get_user_model().objects.create_user(email='buyer@example.com', password='secret123', is_active=True)
+
+    def login(self, password, ip='203.0.113.7'):
+        return self.client.post(
+            '/api/v1/users/login/', {'email': 'buyer@example.com', 'password': password},
+            content_type='application/json', REMOTE_ADDR=ip
+        )
+
+    def test_blocked_attempt_skips_authenticate(self):
+        for _ in range(2):
+            self.assertEqual(self.login('wrong').status_code, 400)
+        with mock.patch('users.serializers.authenticate') as authenticate:
+            response = self.login('secret123')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response['Retry-After']), 30)
+        authenticate.assert_not_called()
+
+    def test_success_resets_email_counter(self):
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.assertEqual(self.login('secret123').status_code, 200)
+        # Счётчик email сброшен: ещё одна неудача с другого IP не блокирует вход
+        self.assertEqual(self.login('wrong', ip='198.51.100.1').status_code, 400)
+        self.assertEqual(self.login('secret123', ip='198.51.100.1').status_code, 200)
+
+
+class ConfirmationCodeTests(TestCase):
+    def test_code_is_consumed_once(self):
+        user = get_user_model().objects.create_user(username='new', email='new@example.com', password='secret123')
+        code = ConfirmationCode.objects.create(user=user).code
+        self.assertEqual(ConfirmationCode.objects.confirm('NEW@example.com', code), user.pk)
+        self.assertIsNone(ConfirmationCode.objects.confirm('new@example.com', code))
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+
+    @override_settings(CONFIRMATION_CODE_TTL=60)
+    def test_resend_after_expired_code_was_purged(self):
+        user = get_user_model().objects.create_user(username='late', email='late@example.com', password='secret123')
+        ConfirmationCode.objects.create(user=user)
+        ConfirmationCode.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        call_command('purge_confirmation_codes', stdout=StringIO())
+        self.assertFalse(ConfirmationCode.objects.exists())
+
+        response = self.client.post('/api/v1/users/confirm/resend/', {'email': 'late@example.com'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        code = ConfirmationCode.objects.get(user=user).code
+        self.assertEqual(OutboxMessage.objects.get().payload['code'], code)
+        self.assertEqual(ConfirmationCode.objects.confirm('late@example.com', code), user.pk)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    def test_retry_then_send_clears_payload(self):
+        message = enqueue('confirmation_email', {'email': 'buyer@example.com', 'code': '123456'})
+        with mock.patch('users.outbox.send_mail', side_effect=SMTPException('connection refused')):
+            self.assertEqual(process_batch(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_PENDING, 1))
+        self.assertGreater(message.available_at, timezone.now())
+        # До истечения задержки повтора сообщение не берётся
+        self.assertEqual(process_batch(), (0, 0))
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(process_batch(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('123456', mail.outbox[0].body)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.payload), (OutboxMessage.STATUS_SENT, {}))
+
+    def test_purge_removes_old_sent_messages(self):
+        enqueue('confirmation_email', {'email': 'buyer@example.com', 'code': '123456'})
+        process_batch()
+        enqueue('confirmation_email', {'email': 'other@example.com', 'code': '654321'})
+        OutboxMessage.objects.update(created_at=timezone.now() - timedelta(days=30))
+        call_command('purge_outbox', stdout=StringIO())
+        self.assertEqual(list(OutboxMessage.objects.values_list('status', flat=True)), [OutboxMessage.STATUS_PENDING])
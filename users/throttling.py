@@ -0,0 +1,69 @@
+"""
+Ограничение попыток входа до проверки пароля
+
+Счётчики неудачных попыток по email и по IP хранятся в отдельном кэше CACHE
+(имя из CACHES) с ограниченным временем жизни, поэтому память не растёт
+бесконечно. Кэш должен быть общим, чтобы блокировка действовала во всех
+воркерах, и не должен вытеснять ключи: вытесненный счётчик снимает блокировку. Заблокированный запрос
+отклоняется одним get_many без обращения к таблице User и к хэшеру паролей.
+"""
+
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+
+DEFAULTS = {
+    'FREE_ATTEMPTS': 5,  # столько неудачных попыток разрешено без задержки
+    'BASE_DELAY': 1,  # первая задержка (секунды), дальше удваивается
+    'MAX_DELAY': 15 * 60,
+    'WINDOW': 60 * 60,  # через сколько секунд без ошибок счётчик сбрасывается
+    'CACHE': 'default',  # кэш счётчиков и блокировок
+}
+
+
+class LoginThrottle:
+    """
+    Экспоненциальная задержка после серии неудачных попыток входа
+    """
+
+    def __init__(self, email, ip=None):
+        self.config = {**DEFAULTS, **getattr(settings, 'LOGIN_THROTTLE', {})}
+        self.cache = caches[self.config['CACHE']]
+        email_hash = hashlib.sha1(email.strip().lower().encode()).hexdigest()
+        self.scopes = [f'email:{email_hash}']
+        if ip:
+            self.scopes.append(f'ip:{ip}')
+
+    def wait(self):
+        """
+        Сколько секунд осталось до следующей разрешённой попытки (0 - можно)
+        """
+        blocked = self.cache.get_many([f'login-block:{scope}' for scope in self.scopes])
+        if not blocked:
+            return 0
+        return max(0, max(blocked.values()) - time.time())
+
+    def register_failure(self):
+        for scope in self.scopes:
+            failures_key = f'login-fails:{scope}'
+            self.cache.add(failures_key, 0, self.config['WINDOW'])
+            try:
+                failures = self.cache.incr(failures_key)
+            except ValueError:
+                # Ключ успел истечь между add и incr
+                self.cache.set(failures_key, 1, self.config['WINDOW'])
+                failures = 1
+            # После FREE_ATTEMPTS неудач каждая следующая попытка ждёт задержку
+            if failures >= self.config['FREE_ATTEMPTS']:
+                exponent = failures - self.config['FREE_ATTEMPTS']
+                delay = min(self.config['BASE_DELAY'] * 2 ** exponent, self.config['MAX_DELAY'])
+                self.cache.set(f'login-block:{scope}', time.time() + delay, int(delay) + 1)
+
+    def reset(self):
+        """
+        Успешный вход сбрасывает счётчик для email (счётчик IP остаётся)
+        """
+        email_scope = self.scopes[0]
+        self.cache.delete_many([f'login-fails:{email_scope}', f'login-block:{email_scope}'])
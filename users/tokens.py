@@ -0,0 +1,100 @@
+"""
+Подписанные access/refresh токены для API
+
+Токен - это подписанный (HMAC) JSON с идентификатором пользователя и сроком
+действия, поэтому проверка не требует запросов к БД. Отозванные токены
+хранятся до истечения их срока действия в отдельном кэше CACHE (имя из
+CACHES). Он должен быть общим для всех процессов (с LocMemCache отзыв виден
+только процессу, который его выполнил) и не должен вытеснять ключи (Redis с
+maxmemory-policy noeviction): вытесненная запись молча возвращает силу
+отозванному refresh-токену.
+"""
+
+import time
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+SALT = 'users.tokens'
+
+DEFAULTS = {
+    'ACCESS_TTL': 15 * 60,  # 15 минут
+    'REFRESH_TTL': 7 * 24 * 60 * 60,  # 7 дней
+    'CACHE': 'default',  # кэш списка отозванных токенов
+}
+
+
+class InvalidToken(Exception):
+    """
+    Токен повреждён, просрочен, отозван или имеет другой тип
+    """
+
+
+def get_token_settings():
+    return {**DEFAULTS, **getattr(settings, 'API_TOKENS', {})}
+
+
+def make_token(user, token_type):
+    """
+    Создание подписанного токена для пользователя
+    """
+    ttl = get_token_settings()['ACCESS_TTL' if token_type == ACCESS else 'REFRESH_TTL']
+    payload = {
+        'uid': user.pk,
+        'typ': token_type,
+        'jti': uuid.uuid4().hex,
+        'exp': int(time.time()) + ttl,
+        'stf': bool(user.is_staff),
+    }
+    return signing.dumps(payload, salt=SALT)
+
+
+def issue_tokens(user):
+    """
+    Пара access/refresh токенов, которую возвращает LoginView
+    """
+    return {
+        'access': make_token(user, ACCESS),
+        'refresh': make_token(user, REFRESH),
+        'token_type': 'Bearer',
+        'expires_in': get_token_settings()['ACCESS_TTL'],
+    }
+
+
+def verify_token(token, token_type):
+    """
+    Проверка подписи, типа, срока действия и списка отозванных токенов
+    """
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise InvalidToken('Недействительный токен')
+    if not isinstance(payload, dict) or payload.get('typ') != token_type:
+        raise InvalidToken('Неверный тип токена')
+    if payload.get('exp', 0) <= time.time():
+        raise InvalidToken('Срок действия токена истёк')
+    if _deny_cache().get(_deny_key(payload['jti'])):
+        raise InvalidToken('Токен отозван')
+    return payload
+
+
+def revoke_token(payload):
+    """
+    Добавление токена в список отозванных до истечения его срока действия.
+    False, если токен уже был отозван (cache.add атомарен)
+    """
+    timeout = max(int(payload['exp'] - time.time()), 1)
+    return _deny_cache().add(_deny_key(payload['jti']), True, timeout)
+
+
+def _deny_cache():
+    return caches[get_token_settings()['CACHE']]
+
+
+def _deny_key(jti):
+    return f'token-denied:{jti}'
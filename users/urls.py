@@ -1,8 +1,11 @@
 from django.urls import path
-from .views import RegisterView, LoginView, ConfirmView
+from .views import RegisterView, LoginView, ConfirmView, ResendConfirmationView, TokenRefreshView, LogoutView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='user-register'),
     path('login/', LoginView.as_view(), name='user-login'),
     path('confirm/', ConfirmView.as_view(), name='user-confirm'),
+    path('confirm/resend/', ResendConfirmationView.as_view(), name='user-confirm-resend'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='user-token-refresh'),
+    path('logout/', LogoutView.as_view(), name='user-logout'),
 ]
\ No newline at end of file
@@ -1,9 +1,15 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
 from django.contrib.auth import login
 from .models import User, ConfirmationCode
-from .serializers import RegisterSerializer, LoginSerializer, ConfirmSerializer
+from .outbox import enqueue
+from .serializers import RegisterSerializer, LoginSerializer, ConfirmSerializer, ResendConfirmationSerializer, TokenRefreshSerializer
+from .tokens import REFRESH, InvalidToken, issue_tokens, revoke_token, verify_token
 from django.utils.translation import gettext_lazy as _
 
 class RegisterView(APIView):
@@ -16,22 +22,64 @@ class RegisterView(APIView):
 
 class LoginView(APIView):
     def post(self, request):
-        serializer = LoginSerializer(data=request.data)
+        serializer = LoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            # Для API не используем login(request, user), просто возвращаем успех
-            return Response({'message': _('Успешная авторизация')}, status=status.HTTP_200_OK)
+            # Для API не используем login(request, user): выдаём подписанные токены,
+            # пароль проверяется только здесь
+            return Response({'message': _('Успешная авторизация'), **issue_tokens(user)}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class ConfirmView(APIView):
     def post(self, request):
         serializer = ConfirmSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.validated_data['user']
-            conf = serializer.validated_data['conf']
-            user.is_active = True
-            user.save()
-            conf.is_used = True
-            conf.save()
+            user_id = ConfirmationCode.objects.confirm(
+                serializer.validated_data['email'], serializer.validated_data['code']
+            )
+            if user_id is None:
+                return Response({'non_field_errors': [_('Неверный email или уже использованный код')]}, status=status.HTTP_400_BAD_REQUEST)
             return Response({'message': _('Пользователь успешно подтверждён и активирован')}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class ResendConfirmationView(APIView):
+    def post(self, request):
+        serializer = ResendConfirmationSerializer(data=request.data)
+        if serializer.is_valid():
+            email = serializer.validated_data['email']
+            interval = timedelta(seconds=getattr(settings, 'CONFIRMATION_RESEND_INTERVAL', 60))
+            with transaction.atomic():
+                user = User.objects.select_for_update().filter(email__iexact=email, is_active=False).first()
+                conf = ConfirmationCode.objects.filter(user=user).first() if user else None
+                # Не чаще раза в CONFIRMATION_RESEND_INTERVAL, чтобы не рассылать письма по кругу
+                if user and (conf is None or conf.created_at <= timezone.now() - interval):
+                    conf = ConfirmationCode.objects.reissue(user)
+                    enqueue('confirmation_email', {'email': user.email, 'code': conf.code})
+            # Ответ одинаковый для любого email: по нему нельзя узнать, есть ли пользователь
+            return Response({'message': _('Если пользователь не подтверждён, код отправлен повторно')}, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TokenRefreshView(APIView):
+    def post(self, request):
+        serializer = TokenRefreshSerializer(data=request.data)
+        if serializer.is_valid():
+            # Использованный refresh токен отзываем (ротация). Из параллельных
+            # запросов с одним токеном новую пару получает только первый
+            if not revoke_token(serializer.validated_data['payload']):
+                return Response({'non_field_errors': [_('Токен отозван')]}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(issue_tokens(serializer.validated_data['user']), status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class LogoutView(APIView):
+    def post(self, request):
+        # Отзываем текущий access токен (если запрос аутентифицирован токеном)
+        if isinstance(request.auth, dict):
+            revoke_token(request.auth)
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                revoke_token(verify_token(refresh, REFRESH))
+            except InvalidToken as e:
+                return Response({'refresh': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': _('Выход выполнен')}, status=status.HTTP_200_OK)